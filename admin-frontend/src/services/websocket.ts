@@ -45,7 +45,9 @@ export interface TaskErrorPayload {
 
 export interface TaskScreenshotPayload {
   task_id: string
-  screenshot: string  // base64 encoded image
+  screenshot?: string  // base64 encoded image（JSON 文本消息）
+  image?: Blob         // 原始图片（二进制消息）
+  mime?: string
   action_index: number
   timestamp: string
 }
@@ -97,6 +99,7 @@ class WebSocketService {
 
     try {
       this.ws = new WebSocket(url)
+      this.ws.binaryType = 'arraybuffer'
 
       this.ws.onopen = () => {
         console.log('[WebSocket] Connected to', url)
@@ -109,6 +112,11 @@ class WebSocketService {
 
       this.ws.onmessage = (event) => {
         try {
+          if (event.data instanceof ArrayBuffer) {
+            this.dispatchBinary(event.data)
+            return
+          }
+
           const message: WebSocketMessage = JSON.parse(event.data)
           this.lastMessage.value = message
 
@@ -291,7 +299,33 @@ class WebSocketService {
     return this.on<TaskScreenshotPayload>('task_screenshot', handler)
   }
 
+  /**
+   * 解析二进制消息：4 字节大端头部长度 + UTF-8 JSON 头部 + 图片原始字节
+   */
+  private dispatchBinary(buffer: ArrayBuffer): void {
+    const headerLength = new DataView(buffer).getUint32(0)
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)))
+    const image = new Blob([new Uint8Array(buffer, 4 + headerLength)], { type: header.mime })
+
+    this.dispatchMessage({
+      type: header.type,
+      payload: { ...header, image },
+      task_id: header.task_id ?? null,
+      timestamp: header.timestamp
+    })
+  }
+
   private dispatchMessage(message: WebSocketMessage): void {
+    // 批量消息：逐条分发合并在同一帧中的事件
+    // 事件自带 task_id / timestamp 时（服务端合并的积压消息可能来自不同任务）以事件自身为准
+    if (message.type === 'batch') {
+      const events = (message.payload.events ?? []) as Array<Pick<WebSocketMessage, 'type' | 'payload'> & Partial<WebSocketMessage>>
+      events.forEach(event => {
+        this.dispatchMessage({ task_id: message.task_id, timestamp: message.timestamp, ...event })
+      })
+      return
+    }
+
     const handlers = this.messageHandlers.get(message.type)
     if (handlers) {
       handlers.forEach(handler => {
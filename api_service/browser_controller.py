@@ -1,15 +1,40 @@
 #!/usr/bin/env python3
 """
 独立浏览器控制器
-通过 stdin/stdout 与主进程通信，避免 asyncio 子进程兼容性问题
+连接主进程监听的 IPC 套接字（--socket 指定 Unix 域套接字路径，或 --ipc-port 指定回环 TCP 端口）通信，
+未指定时回退到 stdin/stdout；消息为长度前缀 MessagePack 帧，避免 asyncio 子进程兼容性问题
 """
 import sys
 import json
+import base64
+import re
+import socket
+import argparse
+import time
+import functools
 import asyncio
 import logging
 import signal
 import os
+import select
+import shutil
 import subprocess
+import tempfile
+import http.client
+from pathlib import Path
+
+# 项目根目录（相对截图保存路径以此为基准）
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(_PROJECT_ROOT))
+
+from api_service.ipc import read_frame, send_frame, write_frame_fd
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # 配置日志
 logging.basicConfig(
@@ -19,6 +44,201 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 反检测 JavaScript 脚本（原始可读版本）
+_STEALTH_SCRIPT_SOURCE = """
+        // 隐藏 webdriver 标志
+        Object.defineProperty(navigator, 'webdriver', {
+            get: () => undefined,
+            configurable: true
+        });
+
+        // 覆盖 chrome.runtime
+        if (window.chrome) {
+            window.chrome.runtime = {
+                connect: function() {},
+                sendMessage: function() {}
+            };
+        }
+
+        // 修改 permissions
+        const originalQuery = window.navigator.permissions.query;
+        window.navigator.permissions.query = (parameters) => (
+            parameters.name === 'notifications' ?
+                Promise.resolve({ state: Notification.permission }) :
+                originalQuery(parameters)
+        );
+
+        // 修改 plugins
+        Object.defineProperty(navigator, 'plugins', {
+            get: () => [1, 2, 3, 4, 5],
+            configurable: true
+        });
+
+        // 修改 languages
+        Object.defineProperty(navigator, 'languages', {
+            get: () => ['zh-CN', 'zh', 'en-US', 'en'],
+            configurable: true
+        });
+
+        // 添加 chrome 属性
+        window.chrome = {
+            loadTimes: function() {
+                return {
+                    commit_finished_warmup_time: 0.1,
+                    first_paint_after_load_time: 0.1,
+                    first_meaningful_paint: 0.1,
+                    first_meaningful_paint_candidate: 0.1,
+                    first_text_paint: 0.1,
+                    load_event_start_time: 0.1,
+                    navigation_start: Date.now() - 100
+                };
+            },
+            csi: function() {
+                return {
+                    onloadT: Date.now() - 100,
+                    pageT: Date.now() - 100,
+                    tran: 15
+                };
+            }
+        };
+
+        // 覆盖 automation 检测
+        window.navigator.__defineGetter__('webdriver', function() {
+            return undefined;
+        });
+
+        // 修改 getComputedStyle
+        const originalGetComputedStyle = window.getComputedStyle;
+        window.getComputedStyle = function(element, pseudoElt) {
+            const style = originalGetComputedStyle(element, pseudoElt);
+            style.display = '';  // 确保 display 不被修改
+            return style;
+        };
+
+        // 模拟真实的 chrome.automation 对象
+        if (!window.chrome.automation) {
+            Object.defineProperty(window.chrome, 'automation', {
+                get: () => ({
+                    isAutomation: false,
+                    getAutomationId: () => null
+                }),
+                configurable: true
+            });
+        }
+        """
+
+_JS_LINE_COMMENT_RE = re.compile(r"\s*//[^\n]*")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _minify_js(source: str) -> str:
+    """去除行注释并压缩空白（脚本内所有语句均以分号结尾，可安全合并为单行）"""
+    return _WHITESPACE_RE.sub(" ", _JS_LINE_COMMENT_RE.sub("", source)).strip()
+
+
+# 导入时压缩一次，减少每次创建上下文时经 CDP 下发的脚本体积
+_STEALTH_SCRIPT = _minify_js(_STEALTH_SCRIPT_SOURCE)
+
+
+def _keep_selector(selector: str) -> str:
+    """css / xpath 选择器原样使用"""
+    return selector
+
+
+def _convert_id_selector(selector: str) -> str:
+    if selector[:1] == "#":
+        return selector
+    return f"#{selector}"
+
+
+def _convert_class_selector(selector: str) -> str:
+    # 已含 "." 的视为写好的类选择器，无需 split/join
+    if "." in selector:
+        return selector
+    classes = selector.split()
+    return ".".join(classes) if classes else f".{selector}"
+
+
+def _convert_name_selector(selector: str) -> str:
+    return f'[name="{selector}"]'
+
+
+# 选择器类型 -> 转换函数，未知类型按 css 原样处理
+_SELECTOR_CONVERTERS = {
+    "css": _keep_selector,
+    "xpath": _keep_selector,
+    "id": _convert_id_selector,
+    "class": _convert_class_selector,
+    "name": _convert_name_selector,
+}
+
+
+_EXTRACT_TYPES = ("text", "html", "attribute")
+
+# 批量提取脚本：一次 CDP 往返返回全部字段；选择器无法被原生 DOM 解析或元素不存在时 found=false
+_EXTRACT_SCRIPT = """
+(specs) => specs.map((spec) => {
+    let el = null;
+    try {
+        el = spec.xpath
+            ? document.evaluate(spec.selector, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue
+            : document.querySelector(spec.selector);
+    } catch (e) {
+        return {found: false};
+    }
+    if (!el) {
+        return {found: false};
+    }
+    if (spec.type === "html") {
+        return {found: true, value: el.innerHTML};
+    }
+    if (spec.type === "attribute") {
+        return {found: true, value: el.getAttribute(spec.attribute)};
+    }
+    return {found: true, value: el.innerText};
+})
+"""
+
+
+def _dom_query_spec(selector: str, extract_type: str, attribute: str) -> dict:
+    """把 Playwright 选择器转换为批量提取脚本可用的 DOM 查询描述"""
+    xpath = False
+    if selector.startswith("xpath="):
+        selector, xpath = selector[len("xpath="):], True
+    elif selector.startswith("css="):
+        selector = selector[len("css="):]
+    elif selector.startswith(("//", "..")):
+        xpath = True
+    return {"selector": selector, "xpath": xpath, "type": extract_type, "attribute": attribute}
+
+
+# 普通模式启动 Chrome 的固定参数（调试端口与用户数据目录按实例追加）
+_CHROME_BASE_ARGS = (
+    '--remote-debugging-address=127.0.0.1',
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--new-window',
+    '--disable-blink-features=AutomationControlled',
+    '--disable-infobars',
+    '--window-size=1920,1080',
+)
+
+# Windows 下不为 Chrome 创建控制台窗口；其他平台 Popen 不接受非零 creationflags
+_CHROME_CREATIONFLAGS = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+
+def _claim_port(port: int) -> int:
+    """确认端口可用；已被占用时返回系统分配的空闲端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind(("127.0.0.1", port))
+        except OSError:
+            logger.info(f"[BrowserController] 端口 {port} 已被占用，改用系统分配的端口")
+            s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
 
 class BrowserController:
     def __init__(self):
@@ -28,34 +248,60 @@ class BrowserController:
         self.playwright = None
         self.running = True
         self.process = None  # Chrome 进程
+        self.port = None  # Chrome 实际使用的调试端口
+        self.user_data_dir = None  # Chrome 独立的临时用户数据目录，关闭时删除
+        self._dom_ready = False  # 当前页面 DOM 是否已就绪，主框架导航时重置
+        self._tracked_pages = set()  # 已注册事件监听的页面
+        self._stealth = False  # 当前上下文是否应用了反检测配置
+        self._cdp_page = None  # _cdp 所属的页面
+        self._cdp = None  # 实时截图用的 CDP 会话
+        self._ensured_dirs = set()  # 已确认存在的截图保存目录
+        # 默认直接使用二进制 stdio，避免 TextIOWrapper 编码与逐条加锁；attach_socket 后改走套接字
+        self._stdin = sys.stdin.buffer
+        self._send_frame = functools.partial(write_frame_fd, sys.stdout.fileno())
+        self._req_id = None  # 当前处理中请求的 req_id，响应时原样带回
+        # 动作类型 -> 处理函数
+        self._handlers = {
+            "goto": self._do_goto,
+            "click": self._do_click,
+            "input": self._do_input,
+            "wait": self._do_wait,
+            "wait_element": self._do_wait_element,
+            "scroll": self._do_scroll,
+            "press": self._do_press,
+            "hover": self._do_hover,
+            "screenshot": self._do_screenshot,
+            "extract": self._do_extract,
+            "evaluate": self._do_evaluate,
+            "close_tab": self._do_close_tab,
+            "upload": self._do_upload,
+            "start": self._do_noop,
+            "end": self._do_noop,
+        }
+        # IPC 命令 -> 处理函数
+        self._commands = {
+            "action": self._cmd_action,
+            "screenshot": self._cmd_screenshot,
+            "reset": self._cmd_reset,
+            "start": self._cmd_start,
+            "ping": self._cmd_ping,
+            "close": self._cmd_close,
+        }
 
-    def convert_selector(self, selector: str, selector_type: str = "css") -> str:
-        """转换选择器"""
-        if not selector:
-            return selector
-
-        selector_type = selector_type.lower() if selector_type else "css"
-
-        if selector_type == "xpath":
-            return selector
-        elif selector_type == "id":
-            if not selector.startswith("#"):
-                return f"#{selector}"
-            return selector
-        elif selector_type == "class":
-            if not selector.startswith("."):
-                classes = selector.split()
-                return ".".join(classes) if classes else f".{selector}"
-            return selector
-        elif selector_type == "name":
-            return f'[name="{selector}"]'
-        else:
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def convert_selector(selector: str, selector_type: str = "css") -> str:
+        """转换选择器（同一会话内选择器高度重复，结果按参数缓存）"""
+        # 默认的 css 选择器原样返回，无需小写化和查表
+        if not selector or selector_type in (None, "", "css", "CSS"):
             return selector
+        return _SELECTOR_CONVERTERS.get(selector_type.lower(), _keep_selector)(selector)
 
     def start_browser(self, chrome_path: str, port: int, url: str = None,
                        enable_stealth: bool = True, viewport_width: int = 1920,
                        viewport_height: int = 1080, user_agent: str = None,
-                       locale: str = "zh-CN", timezone: str = "Asia/Shanghai") -> dict:
+                       locale: str = "zh-CN", timezone: str = "Asia/Shanghai",
+                       wait_until: str = "domcontentloaded") -> dict:
         """启动 Chrome - 同步版本"""
         logger.info(f"[BrowserController] 启动 Chrome: {chrome_path}, 端口: {port}, stealth: {enable_stealth}")
 
@@ -63,19 +309,20 @@ class BrowserController:
             # 使用 undetected-playwright 自动应用所有反检测措施
             return self._start_browser_stealth(
                 chrome_path, port, url, viewport_width, viewport_height,
-                user_agent, locale, timezone
+                user_agent, locale, timezone, wait_until=wait_until
             )
         else:
             # 使用原来的方式启动
             return self._start_browser_normal(
                 chrome_path, port, url, viewport_width, viewport_height,
-                user_agent, locale, timezone
+                user_agent, locale, timezone, wait_until=wait_until
             )
 
     def _start_browser_stealth(self, chrome_path: str, port: int, url: str = None,
                                  viewport_width: int = 1920, viewport_height: int = 1080,
                                  user_agent: str = None, locale: str = "zh-CN",
-                                 timezone: str = "Asia/Shanghai") -> dict:
+                                 timezone: str = "Asia/Shanghai",
+                                 wait_until: str = "domcontentloaded") -> dict:
         """使用 undetected-playwright 启动浏览器"""
         try:
             import undetected_playwright as uc
@@ -83,7 +330,7 @@ class BrowserController:
             logger.warning("undetected-playwright 未安装，回退到普通模式")
             return self._start_browser_normal(
                 chrome_path, port, url, viewport_width, viewport_height,
-                user_agent, locale, timezone
+                user_agent, locale, timezone, wait_until=wait_until
             )
 
         try:
@@ -112,15 +359,16 @@ class BrowserController:
                 context_options['user_agent'] = user_agent
 
             self.context = self.browser.new_context(**context_options)
-            self.page = self.context.new_page()
+            self._set_page(self.context.new_page())
+            self._stealth = True
+            self._warm_screenshot()
 
             # 注入额外的反检测脚本
             self.context.add_init_script(self._get_stealth_script())
 
             if url:
-                self.page.goto(url, wait_until='networkidle', timeout=30000)
-                # 等待页面渲染完成
-                self.page.wait_for_timeout(500)
+                # goto 按 wait_until 等到页面就绪后返回，不再额外固定等待
+                self.page.goto(url, wait_until=wait_until, timeout=30000)
                 logger.info(f"[BrowserController] 已访问页面: {url}")
 
             logger.info("[BrowserController] undetected-playwright 浏览器启动成功")
@@ -131,65 +379,75 @@ class BrowserController:
             # 回退到普通模式，保留原来的端口
             return self._start_browser_normal(
                 chrome_path, port, url, viewport_width, viewport_height,
-                user_agent, locale, timezone
+                user_agent, locale, timezone, wait_until=wait_until
             )
 
     def _start_browser_normal(self, chrome_path: str, port: int, url: str = None,
                                viewport_width: int = 1920, viewport_height: int = 1080,
                                user_agent: str = None, locale: str = "zh-CN",
                                timezone: str = "Asia/Shanghai",
-                               enable_stealth: bool = False) -> dict:
+                               enable_stealth: bool = False,
+                               wait_until: str = "domcontentloaded") -> dict:
         """普通模式启动 Chrome"""
         from playwright.sync_api import sync_playwright
 
-        # 启动 Chrome 进程
-        CREATE_NO_WINDOW = 0x08000000
-        chrome_args = [
-            f'--remote-debugging-port={port}',
-            '--remote-debugging-address=127.0.0.1',
-            '--no-sandbox',
-            '--disable-setuid-sandbox',
-            '--disable-dev-shm-usage',
-            '--disable-gpu',
-            '--new-window',
-            '--disable-blink-features=AutomationControlled',
-            '--disable-infobars',
-            '--window-size=1920,1080',
-        ]
+        # 端口被占用时改用系统分配的空闲端口，避免连到其他 Chrome 实例
+        port = _claim_port(port)
+        self.port = port
+
+        # 每个 Chrome 使用独立的用户数据目录：共用默认目录时后启动的 Chrome 会把窗口交给已运行的实例后退出
+        self.user_data_dir = tempfile.mkdtemp(prefix="auto-tools-chrome-")
 
+        # 启动 Chrome 进程
         self.process = subprocess.Popen(
-            [chrome_path] + chrome_args,
+            [
+                chrome_path,
+                f'--remote-debugging-port={port}',
+                f'--user-data-dir={self.user_data_dir}',
+                *_CHROME_BASE_ARGS,
+            ],
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
             shell=False,
-            creationflags=CREATE_NO_WINDOW,
+            creationflags=_CHROME_CREATIONFLAGS,
         )
         logger.info(f"[BrowserController] Chrome 已启动, PID: {self.process.pid}")
 
         # 等待 Chrome 启动并获取 WebSocket URL
-        import http.client
-        import time
         max_wait = 15
-        waited = 0
+        deadline = time.monotonic() + max_wait
+        attempt = 0
         ws_url = None
+        # 整个探测过程复用同一个连接，Chrome 就绪后的探测不再重复握手
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
 
-        while waited < max_wait:
+        while time.monotonic() < deadline:
             try:
-                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
                 conn.request("GET", "/json/version")
                 response = conn.getresponse()
+                body = response.read()
                 if response.status == 200:
-                    data = json.loads(response.read().decode())
+                    data = _json_loads(body)
                     if data.get("webSocketDebuggerUrl"):
                         ws_url = data["webSocketDebuggerUrl"]
                         logger.info(f"[BrowserController] 获取到 WebSocket URL: {ws_url}")
                         break
             except Exception as e:
                 logger.debug(f"[BrowserController] 等待 Chrome... {e}")
+                # 连接失败后重置状态，下次 request 时自动重连
+                conn.close()
+
+            if self.process.poll() is not None:
+                logger.error(f"[BrowserController] Chrome 进程已退出, 退出码: {self.process.returncode}")
+                break
 
-            time.sleep(0.5)
-            waited += 0.5
-            logger.debug(f"[BrowserController] 等待 Chrome 启动... {waited}s")
+            # 指数退避：从 25ms 起步、上限 200ms，Chrome 就绪后能尽快被发现
+            delay = min(0.025 * 2 ** attempt, 0.2)
+            attempt += 1
+            logger.debug("[BrowserController] 等待 Chrome 启动... 第 %d 次探测, %.3fs 后重试", attempt, delay)
+            time.sleep(delay)
+
+        conn.close()
 
         if not ws_url:
             return {"success": False, "error": "无法获取 Chrome WebSocket URL"}
@@ -216,101 +474,94 @@ class BrowserController:
         # 注入反检测 JavaScript
         if enable_stealth:
             self.context.add_init_script(self._get_stealth_script())
+        self._stealth = enable_stealth
 
-        self.page = self.context.pages[0] if self.context.pages else self.context.new_page()
+        self._set_page(self.context.pages[0] if self.context.pages else self.context.new_page())
+        self._warm_screenshot()
 
         if url:
-            self.page.goto(url, wait_until='networkidle', timeout=30000)
-            # 等待页面渲染完成
-            self.page.wait_for_timeout(500)
+            self.page.goto(url, wait_until=wait_until, timeout=30000)
             logger.info(f"[BrowserController] 已访问页面: {url}")
 
         logger.info("[BrowserController] 浏览器准备就绪")
-        return {"success": True}
+        return {"success": True, "port": port}
 
-    def _get_stealth_script(self) -> str:
-        """获取反检测 JavaScript 脚本"""
-        return """
-        // 隐藏 webdriver 标志
-        Object.defineProperty(navigator, 'webdriver', {
-            get: () => undefined,
-            configurable: true
-        });
+    def reset_browser(self, url: str = None, viewport_width: int = 1920,
+                      viewport_height: int = 1080, user_agent: str = None,
+                      locale: str = "zh-CN", timezone: str = "Asia/Shanghai",
+                      wait_until: str = "domcontentloaded") -> dict:
+        """复用已启动的浏览器：丢弃当前上下文（含 cookie、缓存、页面），按新参数创建上下文"""
+        if not self.browser:
+            return {"success": False, "error": "Browser not started"}
 
-        // 覆盖 chrome.runtime
-        if (window.chrome) {
-            window.chrome.runtime = {
-                connect: function() {},
-                sendMessage: function() {}
-            };
-        }
+        logger.info(f"[BrowserController] 重置浏览器上下文, url: {url}")
+        old_context = self.context
 
-        // 修改 permissions
-        const originalQuery = window.navigator.permissions.query;
-        window.navigator.permissions.query = (parameters) => (
-            parameters.name === 'notifications' ?
-                Promise.resolve({ state: Notification.permission }) :
-                originalQuery(parameters)
-        );
+        context_options = {}
+        if self._stealth:
+            context_options = {
+                'viewport': {'width': viewport_width, 'height': viewport_height},
+                'locale': locale,
+                'timezone_id': timezone,
+                'geolocation': {'latitude': 31.2304, 'longitude': 121.4737},
+                'permissions': ['geolocation'],
+                'ignore_https_errors': True,
+            }
+            if user_agent:
+                context_options['user_agent'] = user_agent
 
-        // 修改 plugins
-        Object.defineProperty(navigator, 'plugins', {
-            get: () => [1, 2, 3, 4, 5],
-            configurable: true
-        });
+        # 旧上下文的页面随上下文一起关闭
+        self._tracked_pages.clear()
+        self.page = None
 
-        // 修改 languages
-        Object.defineProperty(navigator, 'languages', {
-            get: () => ['zh-CN', 'zh', 'en-US', 'en'],
-            configurable: true
-        });
+        self.context = self.browser.new_context(**context_options)
+        if self._stealth:
+            self.context.add_init_script(self._get_stealth_script())
+        self._set_page(self.context.new_page())
+        self._warm_screenshot()
 
-        // 添加 chrome 属性
-        window.chrome = {
-            loadTimes: function() {
-                return {
-                    commit_finished_warmup_time: 0.1,
-                    first_paint_after_load_time: 0.1,
-                    first_meaningful_paint: 0.1,
-                    first_meaningful_paint_candidate: 0.1,
-                    first_text_paint: 0.1,
-                    load_event_start_time: 0.1,
-                    navigation_start: Date.now() - 100
-                };
-            },
-            csi: function() {
-                return {
-                    onloadT: Date.now() - 100,
-                    pageT: Date.now() - 100,
-                    tran: 15
-                };
-            }
-        };
+        if old_context is not None:
+            try:
+                old_context.close()
+            except Exception as e:
+                logger.debug(f"[BrowserController] 关闭旧 context 失败: {e}")
 
-        // 覆盖 automation 检测
-        window.navigator.__defineGetter__('webdriver', function() {
-            return undefined;
-        });
+        if url:
+            self.page.goto(url, wait_until=wait_until, timeout=30000)
+            logger.info(f"[BrowserController] 已访问页面: {url}")
 
-        // 修改 getComputedStyle
-        const originalGetComputedStyle = window.getComputedStyle;
-        window.getComputedStyle = function(element, pseudoElt) {
-            const style = originalGetComputedStyle(element, pseudoElt);
-            style.display = '';  // 确保 display 不被修改
-            return style;
-        };
+        return {"success": True, "stealth_mode": self._stealth}
 
-        // 模拟真实的 chrome.automation 对象
-        if (!window.chrome.automation) {
-            Object.defineProperty(window.chrome, 'automation', {
-                get: () => ({
-                    isAutomation: false,
-                    getAutomationId: () => null
-                }),
-                configurable: true
-            });
-        }
-        """
+    def _get_stealth_script(self) -> str:
+        """获取反检测 JavaScript 脚本"""
+        return _STEALTH_SCRIPT
+
+    def _set_page(self, page):
+        """切换当前页面，并通过页面事件跟踪 DOM 就绪状态"""
+        self.page = page
+        self._dom_ready = False
+        if page not in self._tracked_pages:
+            page.on("framenavigated", self._on_frame_navigated)
+            page.on("domcontentloaded", self._on_dom_content_loaded)
+            self._tracked_pages.add(page)
+
+    def _on_frame_navigated(self, frame):
+        if frame.parent_frame is None and frame.page is self.page:
+            self._dom_ready = False
+
+    def _on_dom_content_loaded(self, page):
+        if page is self.page:
+            self._dom_ready = True
+
+    def _ensure_dom_ready(self, timeout: int):
+        """等待当前页面 DOM 就绪，已就绪时直接返回"""
+        if self._dom_ready:
+            return
+        try:
+            self.page.wait_for_load_state("domcontentloaded", timeout=timeout)
+            self._dom_ready = True
+        except Exception:
+            pass  # 忽略加载状态超时
 
     def execute_action(self, action: dict) -> dict:
         """执行操作 - 同步版本"""
@@ -319,240 +570,394 @@ class BrowserController:
 
         try:
             action_type = action.get("type", "")
-            selector = action.get("selector", "")
-            selector_type = action.get("selector_type", "css")
+            logger.info("[BrowserController] 执行动作: %s, selector=%s, type=%s", action_type,
+                        action.get("selector", ""), action.get("selector_type", "css"))
+
+            handler = self._handlers.get(action_type)
+            result = handler(action) if handler else None
+            if result is not None:
+                return result
 
-            logger.info(f"[BrowserController] 执行动作: {action_type}, selector={selector}, type={selector_type}")
+            return {"success": False, "error": f"Unknown action type: {action_type}"}
+
+        except Exception as e:
+            logger.error(f"[BrowserController] 执行动作失败: {e}", exc_info=True)
+            return {"success": False, "error": str(e)}
 
-            if action_type == "goto":
-                url = action.get("url", "")
-                self.page.goto(url, wait_until='networkidle', timeout=30000)
+    def _action_selector(self, action: dict) -> str:
+        """取出动作中的选择器并转换为 Playwright 格式，未提供时返回空字符串"""
+        return self.convert_selector(action.get("selector", ""), action.get("selector_type", "css"))
+
+    # 以下 _do_* 为各动作的处理函数，返回 None 表示参数不完整，按未知动作处理
+
+    def _do_goto(self, action: dict) -> dict:
+        url = action.get("url", "")
+        # 默认 DOM 就绪即返回；需要等网络空闲的页面可在动作中指定 wait_until
+        wait_until = action.get("wait_until", "domcontentloaded")
+        self.page.goto(url, wait_until=wait_until, timeout=30000)
+        if wait_until != "commit":
+            self._dom_ready = True
+        return {"success": True}
+
+    def _do_click(self, action: dict) -> dict:
+        converted = self._action_selector(action)
+        if converted:
+            try:
+                self.page.click(converted, timeout=5000)
                 return {"success": True}
+            except Exception as e:
+                logger.error(f"[BrowserController] 点击失败: {e}")
+                return {"success": False, "error": str(e)}
+        return {"success": False, "error": "未提供选择器"}
 
-            elif action_type == "click":
-                if selector:
-                    converted = self.convert_selector(selector, selector_type)
-                    try:
-                        self.page.click(converted, timeout=5000)
-                        return {"success": True}
-                    except Exception as e:
-                        logger.error(f"[BrowserController] 点击失败: {e}")
-                        return {"success": False, "error": str(e)}
-                return {"success": False, "error": "未提供选择器"}
-
-            elif action_type == "input":
-                if selector:
-                    converted = self.convert_selector(selector, selector_type)
-                    value = action.get("value", "")
-                    clear = action.get("clear", True)
-
-                    if clear:
-                        self.page.fill(converted, value)
-                    else:
-                        # 不清空，直接追加
-                        current = self.page.locator(converted).input_value()
-                        self.page.fill(converted, current + value)
+    def _do_input(self, action: dict) -> dict:
+        converted = self._action_selector(action)
+        if not converted:
+            return None
+
+        value = action.get("value", "")
+        clear = action.get("clear", True)
+
+        if clear:
+            self.page.fill(converted, value)
+        else:
+            # 不清空，直接追加
+            current = self.page.locator(converted).input_value()
+            self.page.fill(converted, current + value)
 
-                    # 检查是否需要按回车
-                    if action.get("press_enter"):
-                        self.page.press(converted, "Enter")
+        # 检查是否需要按回车
+        if action.get("press_enter"):
+            self.page.press(converted, "Enter")
 
-                    return {"success": True}
+        return {"success": True}
 
-            elif action_type == "wait":
-                import time
-                timeout = action.get("timeout", 1000)
-                time.sleep(timeout / 1000)
+    def _do_wait(self, action: dict) -> dict:
+        timeout = action.get("timeout", 1000)
+        # 管理后台的动作配置以 wait_type 表示等待类型（selector / timeout）
+        condition = action.get("condition") or action.get("wait_type")
+        converted = self._action_selector(action)
+        # 指定了等待条件时，条件满足即返回；timeout 为最长等待时间
+        if condition == "selector" and converted:
+            self.page.wait_for_selector(converted, state=action.get("state", "visible"), timeout=timeout)
+        elif condition == "function" and action.get("script"):
+            self.page.wait_for_function(action["script"], timeout=timeout)
+        elif condition in ("load", "domcontentloaded", "networkidle"):
+            self.page.wait_for_load_state(condition, timeout=timeout)
+        else:
+            # 固定时长等待交给 Playwright 事件循环，而不是阻塞线程
+            self.page.wait_for_timeout(timeout)
+        return {"success": True}
+
+    def _do_wait_element(self, action: dict) -> dict:
+        converted = self._action_selector(action)
+        if converted:
+            try:
+                state = action.get("state", "present")
+                timeout = action.get("timeout", 30000)
+                locator = self.page.locator(converted)
+                if state == "present":
+                    locator.wait_for(state="attached", timeout=timeout)
+                else:
+                    locator.wait_for(state="detached", timeout=timeout)
                 return {"success": True}
+            except Exception as e:
+                logger.error(f"[BrowserController] 等待元素失败: {e}")
+                return {"success": False, "error": str(e)}
+        return {"success": False, "error": "未提供选择器"}
 
-            elif action_type == "wait_element":
-                if selector:
-                    try:
-                        converted = self.convert_selector(selector, selector_type)
-                        state = action.get("state", "present")
-                        timeout = action.get("timeout", 30000)
-                        locator = self.page.locator(converted)
-                        if state == "present":
-                            locator.wait_for(state="attached", timeout=timeout)
-                        else:
-                            locator.wait_for(state="detached", timeout=timeout)
-                        return {"success": True}
-                    except Exception as e:
-                        logger.error(f"[BrowserController] 等待元素失败: {e}")
-                        return {"success": False, "error": str(e)}
-                return {"success": False, "error": "未提供选择器"}
-
-            elif action_type == "scroll":
-                try:
-                    direction = action.get("direction", "down")
-                    amount = action.get("amount", 500)
-                    if direction == "down":
-                        self.page.evaluate(f"window.scrollBy(0, {amount})")
-                    elif direction == "up":
-                        self.page.evaluate(f"window.scrollBy(0, -{amount})")
-                    elif direction == "top":
-                        self.page.evaluate("window.scrollTo(0, 0)")
-                    elif direction == "bottom":
-                        self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                    return {"success": True}
-                except Exception as e:
-                    logger.error(f"[BrowserController] 滚动失败: {e}")
-                    return {"success": False, "error": str(e)}
-
-            elif action_type == "press":
-                keys = action.get("keys", [])
-                if keys:
-                    self.page.keyboard.press("+".join(keys))
-                if action.get("press_enter"):
-                    self.page.keyboard.press("Enter")
+    def _do_scroll(self, action: dict) -> dict:
+        try:
+            direction = action.get("direction", "down")
+            amount = action.get("amount", 500)
+            if direction == "down":
+                self.page.evaluate(f"window.scrollBy(0, {amount})")
+            elif direction == "up":
+                self.page.evaluate(f"window.scrollBy(0, -{amount})")
+            elif direction == "top":
+                self.page.evaluate("window.scrollTo(0, 0)")
+            elif direction == "bottom":
+                self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+            return {"success": True}
+        except Exception as e:
+            logger.error(f"[BrowserController] 滚动失败: {e}")
+            return {"success": False, "error": str(e)}
+
+    def _do_press(self, action: dict) -> dict:
+        keys = action.get("keys", [])
+        if keys:
+            self.page.keyboard.press("+".join(keys))
+        if action.get("press_enter"):
+            self.page.keyboard.press("Enter")
+        return {"success": True}
+
+    def _do_hover(self, action: dict) -> dict:
+        converted = self._action_selector(action)
+        if converted:
+            try:
+                self.page.hover(converted, timeout=5000)
                 return {"success": True}
+            except Exception as e:
+                logger.error(f"[BrowserController] 悬停失败: {e}")
+                return {"success": False, "error": str(e)}
+        return {"success": False, "error": "未提供选择器"}
+
+    def _do_screenshot(self, action: dict) -> dict:
+        try:
+            # 确保页面加载完成
+            self._ensure_dom_ready(timeout=5000)
+
+            screenshot_type = action.get("screenshotType", "viewport")
+            selector = action.get("selector", "")
+            full_page = action.get("fullPage", False)
+            save_path = action.get("savePath", "")
+            # 仅保存到文件时可关闭返回截图数据，避免整张图片再经管道回传
+            return_screenshot = action.get("returnScreenshot", True)
 
-            elif action_type == "hover":
-                if selector:
-                    try:
-                        converted = self.convert_selector(selector, selector_type)
-                        self.page.hover(converted, timeout=5000)
-                        return {"success": True}
-                    except Exception as e:
-                        logger.error(f"[BrowserController] 悬停失败: {e}")
-                        return {"success": False, "error": str(e)}
-                return {"success": False, "error": "未提供选择器"}
-
-            elif action_type == "screenshot":
-                if not self.page:
-                    logger.error("[BrowserController] 截图失败: Page not available")
-                    return {"success": False, "error": "Page not available"}
+            logger.info("[BrowserController] 截图: screenshotType=%s, fullPage=%s, selector=%s, savePath=%s",
+                        screenshot_type, full_page, selector, save_path)
 
+            # 先解析保存路径，由 Playwright 在截图时直接写入文件
+            if save_path:
                 try:
-                    # 确保页面加载完成
-                    try:
-                        self.page.wait_for_load_state("domcontentloaded", timeout=5000)
-                    except Exception:
-                        pass  # 忽略加载状态超时
-
-                    screenshot_type = action.get("screenshotType", "viewport")
-                    selector = action.get("selector", "")
-                    selector_type = action.get("selector_type", "css")
-                    full_page = action.get("fullPage", False)
-                    save_path = action.get("savePath", "")
-
-                    logger.info(f"[BrowserController] 截图: action_type={action_type}, screenshotType={screenshot_type}, fullPage={full_page}, selector={selector}, savePath={save_path}")
-
-                    if screenshot_type == "selector" and selector:
-                        # 元素截图
-                        converted = self.convert_selector(selector, selector_type)
-                        element = self.page.locator(converted)
-                        screenshot_bytes = element.screenshot(type='jpeg', quality=80)
-                    elif full_page or screenshot_type == "fullpage":
-                        # 整页截图
-                        screenshot_bytes = self.page.screenshot(type='jpeg', quality=80, full_page=True)
-                    else:
-                        # 可视区域截图
-                        screenshot_bytes = self.page.screenshot(type='jpeg', quality=80, full_page=False)
-
-                    # 保存到文件
-                    saved_path = ""
-                    if save_path:
-                        try:
-                            import os
-                            from pathlib import Path
-                            # 如果是相对路径，转换为绝对路径（基于项目根目录）
-                            if not os.path.isabs(save_path):
-                                # 获取项目根目录
-                                project_root = Path(__file__).parent.parent.resolve()
-                                save_path = str(project_root / save_path)
-                            # 确保目录存在
-                            save_dir = os.path.dirname(save_path)
-                            if save_dir:
-                                os.makedirs(save_dir, exist_ok=True)
-                            # 保存文件
-                            with open(save_path, 'wb') as f:
-                                f.write(screenshot_bytes)
-                            saved_path = save_path
-                            logger.info(f"[BrowserController] 截图已保存到: {save_path}")
-                        except Exception as save_err:
-                            logger.warning(f"[BrowserController] 保存截图失败: {save_err}")
-
-                    import base64
-                    screenshot_b64 = base64.b64encode(screenshot_bytes).decode()
-                    result = {"success": True, "screenshot": screenshot_b64}
-                    if saved_path:
-                        result["saved_path"] = saved_path
-                    logger.info(f"[BrowserController] 截图完成: screenshot_size={len(screenshot_b64)}, saved_path={saved_path}")
-                    return result
-                except Exception as e:
-                    logger.error(f"[BrowserController] 截图失败: {e}", exc_info=True)
-                    return {"success": False, "error": str(e)}
-
-            elif action_type == "extract":
-                selectors = action.get("selectors", [])
-                extracted_data = {}
-                for sel in selectors:
-                    key = sel.get("name", f"field_{len(extracted_data)}")
-                    sel_selector = sel.get("selector", "")
-                    sel_type = sel.get("selectorType", "css")
-                    sel_extract_type = sel.get("extractType", "text")
-                    attr = sel.get("attribute", "href")
-
-                    if sel_selector:
-                        converted = self.convert_selector(sel_selector, sel_type)
-                        element = self.page.locator(converted)
-                        if sel_extract_type == "text":
-                            extracted_data[key] = element.inner_text()
-                        elif sel_extract_type == "html":
-                            extracted_data[key] = element.inner_html()
-                        elif sel_extract_type == "attribute":
-                            extracted_data[key] = element.get_attribute(attr)
-                return {"success": True, "data": extracted_data}
-
-            elif action_type == "evaluate":
-                script = action.get("script", "")
-                if script:
-                    self.page.evaluate(script)
-                    return {"success": True}
-
-            elif action_type == "close_tab":
-                self.page.close()
-                return {"success": True}
+                    # 如果是相对路径，转换为绝对路径（基于项目根目录）
+                    if not os.path.isabs(save_path):
+                        save_path = str(_PROJECT_ROOT / save_path)
+                    # 确保目录存在
+                    save_dir = os.path.dirname(save_path)
+                    if save_dir and save_dir not in self._ensured_dirs:
+                        os.makedirs(save_dir, exist_ok=True)
+                        self._ensured_dirs.add(save_dir)
+                except Exception as save_err:
+                    logger.warning(f"[BrowserController] 保存截图失败: {save_err}")
+                    save_path = ""
+
+            screenshot_options = {"type": "jpeg", "quality": 80}
+            if save_path:
+                screenshot_options["path"] = save_path
+
+            if screenshot_type == "selector" and selector:
+                # 元素截图
+                capture = self.page.locator(self._action_selector(action)).screenshot
+            elif full_page or screenshot_type == "fullpage":
+                # 整页截图
+                capture = functools.partial(self.page.screenshot, full_page=True)
+            else:
+                # 可视区域截图
+                capture = functools.partial(self.page.screenshot, full_page=False)
 
-            elif action_type == "upload":
-                if selector:
-                    converted = self.convert_selector(selector, selector_type)
-                    file_paths = action.get("file_paths", [])
-                    self.page.set_input_files(converted, file_paths)
-                    return {"success": True}
+            try:
+                screenshot_bytes = capture(**screenshot_options)
+            except OSError as save_err:
+                if not save_path:
+                    raise
+                # 写入文件失败不影响截图本身：记录警告后不带 path 重新截取，仍返回截图数据
+                logger.warning(f"[BrowserController] 保存截图失败: {save_err}")
+                save_path = ""
+                del screenshot_options["path"]
+                screenshot_bytes = capture(**screenshot_options)
+
+            if save_path:
+                logger.info("[BrowserController] 截图已保存到: %s", save_path)
+
+            result = {"success": True}
+            if return_screenshot or not save_path:
+                result["screenshot"] = screenshot_bytes
+            if save_path:
+                result["saved_path"] = save_path
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[BrowserController] 截图完成: screenshot_size=%d, saved_path=%s",
+                            len(screenshot_bytes), save_path)
+            return result
+        except Exception as e:
+            logger.error(f"[BrowserController] 截图失败: {e}", exc_info=True)
+            return {"success": False, "error": str(e)}
+
+    def _do_extract(self, action: dict) -> dict:
+        selectors = action.get("selectors", [])
+        extracted_data = {}
+        fields = []
+        for sel in selectors:
+            key = sel.get("name", f"field_{len(extracted_data)}")
+            sel_selector = sel.get("selector", "")
+            sel_type = sel.get("selectorType", "css")
+            sel_extract_type = sel.get("extractType", "text")
+            attr = sel.get("attribute", "href")
+
+            if sel_selector and sel_extract_type in _EXTRACT_TYPES:
+                converted = self.convert_selector(sel_selector, sel_type)
+                # 先占位，保证 field_N 默认字段名与逐个提取时一致
+                extracted_data[key] = None
+                fields.append((key, converted, sel_extract_type, attr))
+
+        if fields:
+            # 一次 evaluate 批量取回所有字段，避免每个字段一次 CDP 往返
+            specs = [_dom_query_spec(converted, extract_type, attr)
+                     for _, converted, extract_type, attr in fields]
+            values = self.page.evaluate(_EXTRACT_SCRIPT, specs)
+            for (key, converted, extract_type, attr), value in zip(fields, values):
+                if value.get("found"):
+                    extracted_data[key] = value.get("value")
+                else:
+                    # 原生 DOM 查询不到（Playwright 专有语法、元素尚未出现等）时回退到 locator
+                    extracted_data[key] = self._extract_with_locator(converted, extract_type, attr)
+        return {"success": True, "data": extracted_data}
+
+    def _do_evaluate(self, action: dict) -> dict:
+        script = action.get("script", "")
+        if not script:
+            return None
+        self.page.evaluate(script)
+        return {"success": True}
 
-            elif action_type in ("start", "end"):
+    def _do_close_tab(self, action: dict) -> dict:
+        page = self.page
+        others = [p for p in self.context.pages if p is not page and not p.is_closed()]
+        if not others:
+            # 最后一个标签页不关闭：导航到空白页后继续使用，避免重新创建 target 和注入初始化脚本
+            try:
+                page.goto("about:blank")
+                self._set_page(page)
                 return {"success": True}
+            except Exception as e:
+                logger.debug(f"[BrowserController] 复用最后一个标签页失败，改为新建: {e}")
+                others = [self.context.new_page()]
+        # 还有其他标签页时真正关闭，切换到最近打开的一个
+        self._tracked_pages.discard(page)
+        page.close()
+        self._set_page(others[-1])
+        return {"success": True}
 
-            return {"success": False, "error": f"Unknown action type: {action_type}"}
+    def _do_upload(self, action: dict) -> dict:
+        converted = self._action_selector(action)
+        if not converted:
+            return None
+        file_paths = action.get("file_paths", [])
+        self.page.set_input_files(converted, file_paths)
+        return {"success": True}
+
+    def _do_noop(self, action: dict) -> dict:
+        return {"success": True}
 
+    def _extract_with_locator(self, selector: str, extract_type: str, attribute: str):
+        """通过 Playwright locator 提取单个字段（会自动等待元素出现）"""
+        element = self.page.locator(selector)
+        if extract_type == "text":
+            return element.inner_text()
+        elif extract_type == "html":
+            return element.inner_html()
+        return element.get_attribute(attribute)
+
+    def _cdp_session(self):
+        """当前页面的 CDP 会话（按页面缓存），不可用时返回 None"""
+        if self._cdp_page is not self.page:
+            self._cdp_page = self.page
+            if self._cdp is not None:
+                # 旧会话属于之前的页面（或已关闭的上下文），先分离以免会话泄漏
+                try:
+                    self._cdp.detach()
+                except Exception:
+                    pass
+                self._cdp = None
+            try:
+                self._cdp = self.context.new_cdp_session(self.page)
+            except Exception as e:
+                logger.debug(f"[BrowserController] 创建 CDP 会话失败: {e}")
+                self._cdp = None
+        return self._cdp
+
+    def _warm_screenshot(self):
+        """预热实时截图链路：页面仍为空白时建立 CDP 会话并截取 1x1 区域一次，
+        首帧实时截图不再承担会话创建与 JPEG 编码器初始化的延迟"""
+        cdp = self._cdp_session()
+        if cdp is None:
+            return
+        try:
+            cdp.send("Page.captureScreenshot", {
+                "format": "jpeg", "quality": 1, "captureBeyondViewport": False, "optimizeForSpeed": True,
+                "clip": {"x": 0, "y": 0, "width": 1, "height": 1, "scale": 1},
+            })
         except Exception as e:
-            logger.error(f"[BrowserController] 执行动作失败: {e}", exc_info=True)
-            return {"success": False, "error": str(e)}
+            logger.debug(f"[BrowserController] 截图预热失败: {e}")
+
+    def take_screenshot(self, quality: int = 50, image_format: str = "jpeg",
+                        max_width: int = None) -> dict:
+        """截图 - 同步版本（用于实时截图，默认较低质量以减小传输的数据量）
 
-    def take_screenshot(self) -> dict:
-        """截图 - 同步版本（用于实时截图）"""
+        优先通过 CDP Page.captureScreenshot 截取：超过 max_width 时由 Chrome 按比例缩放，
+        主进程无需解码或重新编码即可转发
+        """
         if not self.page:
             logger.warning("[BrowserController] take_screenshot: page not available")
             return {"success": False, "error": "Page not available"}
 
         try:
-            # 确保页面加载完成
-            try:
-                self.page.wait_for_load_state("domcontentloaded", timeout=3000)
-            except Exception:
-                pass  # 忽略加载状态超时
-
-            screenshot_bytes = self.page.screenshot(type='jpeg', quality=70, full_page=False)
-            import base64
-            result = {"success": True, "screenshot": base64.b64encode(screenshot_bytes).decode()}
-            logger.debug(f"[BrowserController] 截图成功, 大小: {len(screenshot_bytes)} bytes")
+            # 确保页面加载完成（DOM 已就绪时跳过，省去每帧一次 CDP 往返）
+            self._ensure_dom_ready(timeout=3000)
+
+            cdp = self._cdp_session() if self.context is not None else None
+            if cdp is not None:
+                params = {"format": image_format, "captureBeyondViewport": False}
+                if image_format != "png":
+                    # 实时画面只求低延迟：让 Chrome 走快速 JPEG 编码路径，以少量体积换取编码耗时
+                    params["quality"] = quality
+                    params["optimizeForSpeed"] = True
+                viewport = self.page.viewport_size
+                if max_width and viewport and viewport["width"] > max_width:
+                    # clip 坐标相对于文档而非视口：按当前滚动位置偏移，截取用户实际看到的区域
+                    metrics = cdp.send("Page.getLayoutMetrics")
+                    visual = metrics.get("cssVisualViewport") or metrics.get("visualViewport") or {}
+                    params["clip"] = {
+                        "x": visual.get("pageX", 0), "y": visual.get("pageY", 0),
+                        "width": viewport["width"], "height": viewport["height"],
+                        "scale": max_width / viewport["width"],
+                    }
+                # base64 在控制器进程中解码，主进程收到原始字节后直接以二进制帧转发
+                screenshot_bytes = base64.b64decode(cdp.send("Page.captureScreenshot", params)["data"])
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("[BrowserController] 截图成功, 大小: %d bytes", len(screenshot_bytes))
+                return {"success": True, "screenshot": screenshot_bytes}
+
+            if image_format == "png":
+                screenshot_bytes = self.page.screenshot(type='png', full_page=False)
+            else:
+                screenshot_bytes = self.page.screenshot(type='jpeg', quality=quality, full_page=False)
+            result = {"success": True, "screenshot": screenshot_bytes}
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[BrowserController] 截图成功, 大小: %d bytes", len(screenshot_bytes))
             return result
         except Exception as e:
             logger.error(f"[BrowserController] 截图失败: {e}")
             return {"success": False, "error": str(e)}
 
+    def _wait_process_exit(self, timeout: float) -> bool:
+        """等待 Chrome 进程退出，返回是否在超时前退出
+
+        Linux 上通过 pidfd + poll 单次阻塞等待退出事件，其他平台回退到 Popen.wait 的轮询实现
+        """
+        pidfd_open = getattr(os, "pidfd_open", None)
+        if pidfd_open is not None:
+            try:
+                fd = pidfd_open(self.process.pid)
+            except OSError:
+                fd = None  # 内核不支持 pidfd 或进程已被回收
+            if fd is not None:
+                try:
+                    poller = select.poll()
+                    poller.register(fd, select.POLLIN)
+                    if not poller.poll(timeout * 1000):
+                        return False
+                finally:
+                    os.close(fd)
+                # 进程已退出，交给 Popen 回收以记录 returncode（不会阻塞）
+                self.process.wait()
+                return True
+
+        try:
+            self.process.wait(timeout=timeout)
+            return True
+        except subprocess.TimeoutExpired:
+            return False
+
     def close(self):
         """关闭浏览器"""
         logger.info("[BrowserController] 关闭浏览器...")
@@ -584,86 +989,111 @@ class BrowserController:
         if self.process:
             try:
                 self.process.terminate()
-                self.process.wait(timeout=5)
+                if not self._wait_process_exit(timeout=5):
+                    raise subprocess.TimeoutExpired(self.process.args, 5)
             except Exception:
                 try:
                     self.process.kill()
                 except Exception:
                     pass
 
+        if self.user_data_dir:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+            self.user_data_dir = None
+
         logger.info("[BrowserController] 浏览器已关闭")
 
+    def attach_socket(self, conn: socket.socket):
+        """改用已连接的 IPC 套接字收发帧"""
+        self._stdin = conn.makefile("rb")
+        self._send_frame = functools.partial(send_frame, conn)
+
+    def send_ready(self):
+        """主循环启动前发送 ready 帧，主进程收到后才发送第一个命令"""
+        self._send_frame({"ready": True, "pid": os.getpid()})
+
+    def _send(self, result: dict):
+        """向主进程写回一帧响应"""
+        if self._req_id is not None:
+            result["req_id"] = self._req_id
+        self._send_frame(result)
+
+    # 以下 _cmd_* 为各 IPC 命令的处理函数，返回写回主进程的响应
+
+    def _cmd_start(self, msg: dict) -> dict:
+        return self.start_browser(
+            msg.get("chrome_path"), msg.get("port"), msg.get("url"),
+            enable_stealth=msg.get("enable_stealth", True),
+            viewport_width=msg.get("viewport_width", 1920),
+            viewport_height=msg.get("viewport_height", 1080),
+            user_agent=msg.get("user_agent"),
+            locale=msg.get("locale", "zh-CN"),
+            timezone=msg.get("timezone", "Asia/Shanghai"),
+            wait_until=msg.get("wait_until", "domcontentloaded")
+        )
+
+    def _cmd_reset(self, msg: dict) -> dict:
+        return self.reset_browser(
+            msg.get("url"),
+            viewport_width=msg.get("viewport_width", 1920),
+            viewport_height=msg.get("viewport_height", 1080),
+            user_agent=msg.get("user_agent"),
+            locale=msg.get("locale", "zh-CN"),
+            timezone=msg.get("timezone", "Asia/Shanghai"),
+            wait_until=msg.get("wait_until", "domcontentloaded")
+        )
+
+    def _cmd_action(self, msg: dict) -> dict:
+        return self.execute_action(msg.get("action"))
+
+    def _cmd_screenshot(self, msg: dict) -> dict:
+        return self.take_screenshot(
+            quality=msg.get("quality", 50),
+            image_format=msg.get("format", "jpeg"),
+            max_width=msg.get("max_width")
+        )
+
+    def _cmd_close(self, msg: dict) -> dict:
+        self.close()
+        # 写回响应后退出主循环
+        self.running = False
+        return {"success": True}
+
+    def _cmd_ping(self, msg: dict) -> dict:
+        return {"success": True, "running": True}
+
     def run(self):
-        """主循环：通过 stdin/stdout 通信"""
+        """主循环：逐帧读取命令并写回响应"""
         logger.info("[BrowserController] 启动主循环...")
+        stdin = self._stdin
 
         while self.running:
             try:
                 # 读取命令
-                line = sys.stdin.readline()
-                if not line:
-                    break
-
-                line = line.strip()
-                if not line:
+                try:
+                    msg = read_frame(stdin)
+                except ValueError as e:
+                    logger.error(f"[BrowserController] 帧解析失败: {e}")
+                    self._send({"success": False, "error": "Invalid frame"})
                     continue
 
-                logger.debug(f"[BrowserController] 收到命令: {line[:100]}...")
-
-                try:
-                    msg = json.loads(line)
-                    cmd = msg.get("cmd")
-
-                    if cmd == "start":
-                        chrome_path = msg.get("chrome_path")
-                        port = msg.get("port")
-                        url = msg.get("url")
-                        # 反检测配置
-                        enable_stealth = msg.get("enable_stealth", True)
-                        viewport_width = msg.get("viewport_width", 1920)
-                        viewport_height = msg.get("viewport_height", 1080)
-                        user_agent = msg.get("user_agent")
-                        locale = msg.get("locale", "zh-CN")
-                        timezone = msg.get("timezone", "Asia/Shanghai")
-                        # 调用同步版本
-                        result = self.start_browser(
-                            chrome_path, port, url,
-                            enable_stealth=enable_stealth,
-                            viewport_width=viewport_width,
-                            viewport_height=viewport_height,
-                            user_agent=user_agent,
-                            locale=locale,
-                            timezone=timezone
-                        )
-                        print(json.dumps(result), flush=True)
-
-                    elif cmd == "action":
-                        action = msg.get("action")
-                        result = self.execute_action(action)
-                        print(json.dumps(result), flush=True)
-
-                    elif cmd == "screenshot":
-                        result = self.take_screenshot()
-                        print(json.dumps(result), flush=True)
-
-                    elif cmd == "close":
-                        self.close()
-                        print(json.dumps({"success": True}), flush=True)
-                        break
+                if msg is None:
+                    break
 
-                    elif cmd == "ping":
-                        print(json.dumps({"success": True, "running": True}), flush=True)
+                cmd = msg.get("cmd")
+                self._req_id = msg.get("req_id")
+                logger.debug("[BrowserController] 收到命令: %s", cmd)
 
+                try:
+                    handler = self._commands.get(cmd)
+                    if handler is None:
+                        self._send({"success": False, "error": f"Unknown cmd: {cmd}"})
                     else:
-                        print(json.dumps({"success": False, "error": f"Unknown cmd: {cmd}"}), flush=True)
-
-                except json.JSONDecodeError as e:
-                    logger.error(f"[BrowserController] JSON 解析失败: {e}")
-                    print(json.dumps({"success": False, "error": "Invalid JSON"}), flush=True)
+                        self._send(handler(msg))
 
                 except Exception as e:
                     logger.error(f"[BrowserController] 处理命令失败: {e}", exc_info=True)
-                    print(json.dumps({"success": False, "error": str(e)}), flush=True)
+                    self._send({"success": False, "error": str(e)})
 
             except Exception as e:
                 logger.error(f"[BrowserController] 主循环异常: {e}", exc_info=True)
@@ -672,9 +1102,34 @@ class BrowserController:
         logger.info("[BrowserController] 退出主循环")
 
 
+def _connect_ipc(socket_path: str = None, port: int = None) -> socket.socket:
+    """连接主进程监听的 IPC 地址"""
+    if socket_path:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(socket_path)
+        except OSError:
+            conn.close()
+            raise
+        return conn
+    return socket.create_connection(("127.0.0.1", port))
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="浏览器控制器")
+    parser.add_argument("--socket", help="Unix 域套接字路径")
+    parser.add_argument("--ipc-port", type=int, help="回环 TCP 端口（Windows）")
+    args = parser.parse_args()
+
     controller = BrowserController()
 
+    if args.socket or args.ipc_port:
+        try:
+            controller.attach_socket(_connect_ipc(args.socket, args.ipc_port))
+        except OSError as e:
+            logger.error(f"[BrowserController] 连接主进程失败: {e}")
+            sys.exit(1)
+
     # 注册信号处理
     def signal_handler(sig, frame):
         logger.info(f"[BrowserController] 收到信号: {sig}")
@@ -684,4 +1139,6 @@ if __name__ == "__main__":
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
+    # 通知主进程已可接收命令
+    controller.send_ready()
     controller.run()
@@ -4,17 +4,81 @@
 """
 import os
 import sys
+import functools
 from pathlib import Path
 from typing import Any, Dict, Optional
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields, replace
 import logging
-import yaml
+
+__all__ = [
+    "PROJECT_ROOT",
+    "BrowserConfig", "TaskConfig", "WebSocketConfig", "StorageConfig", "LoggingConfig",
+    "ApiConfig", "SimulationConfig", "PerformanceConfig", "Config",
+    "ConfigLoader", "get_config", "reload_config", "clear_env_cache",
+    "setup_logging", "ensure_log_dir",
+]
+
+# Python 3.10+ 的 dataclass 支持 slots，去掉实例 __dict__；旧版本回退为普通 dataclass
+_DATACLASS_OPTIONS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
 # 项目根目录
 PROJECT_ROOT = Path(__file__).parent.parent
+_DEFAULT_CONFIG_PATH = (PROJECT_ROOT / "config.yaml").resolve()
+
+
+# 环境变量在进程生命周期内视为不变，读取结果及解析结果均缓存，reload 时清空
+@functools.lru_cache(maxsize=None)
+def _cached_env(key: str) -> Optional[str]:
+    return os.environ.get(key)
+
+
+# 视为"真"的布尔环境变量取值（不区分大小写）
+_TRUE_VALUES = frozenset({'true', '1', 'yes', 'on', 'y', 't'})
+
+_env_int_cache: Dict[str, Optional[int]] = {}
+_env_bool_cache: Dict[str, bool] = {}
+_env_float_cache: Dict[str, Optional[float]] = {}
+
+
+def _cached_env_int(key: str) -> Optional[int]:
+    """读取并解析整数环境变量，未设置或无法解析时返回 None"""
+    if key not in _env_int_cache:
+        value = _cached_env(key)
+        try:
+            _env_int_cache[key] = int(value) if value is not None else None
+        except ValueError:
+            _env_int_cache[key] = None
+    return _env_int_cache[key]
+
 
+def _cached_env_bool(key: str) -> Optional[bool]:
+    """读取并解析布尔环境变量，未设置时返回 None"""
+    if key not in _env_bool_cache:
+        value = _cached_env(key)
+        _env_bool_cache[key] = value.strip().lower() in _TRUE_VALUES if value is not None else None
+    return _env_bool_cache[key]
 
-@dataclass
+
+def _cached_env_float(key: str) -> Optional[float]:
+    """读取并解析浮点数环境变量，未设置或无法解析时返回 None"""
+    if key not in _env_float_cache:
+        value = _cached_env(key)
+        try:
+            _env_float_cache[key] = float(value) if value is not None else None
+        except ValueError:
+            _env_float_cache[key] = None
+    return _env_float_cache[key]
+
+
+def clear_env_cache():
+    """清空环境变量缓存"""
+    _cached_env.cache_clear()
+    _env_int_cache.clear()
+    _env_bool_cache.clear()
+    _env_float_cache.clear()
+
+
+@dataclass(**_DATACLASS_OPTIONS)
 class BrowserConfig:
     """浏览器配置"""
     chrome_path: str = "E:\\chrome-win64\\chrome.exe"
@@ -23,8 +87,13 @@ class BrowserConfig:
     headless: bool = False
     page_timeout: int = 30000
     action_timeout: int = 5000
-    screenshot_quality: int = 70
+    screenshot_quality: int = 50
+    screenshot_max_width: int = 1920
     start_timeout: int = 10
+    # 浏览器池：常驻子进程数（0 表示每个任务单独启动浏览器）及单个实例最多服务的任务数；
+    # 并发任务超过常驻数时按需启动临时实例，同时存活的实例数上限为 max(pool_size, task.max_concurrent)（max_concurrent 为 0 时不限制）
+    pool_size: int = 2
+    pool_recycle_after: int = 100
     # 反检测配置
     enable_stealth: bool = False
     viewport_width: int = 1920
@@ -34,24 +103,28 @@ class BrowserConfig:
     timezone: str = "Asia/Shanghai"
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class TaskConfig:
     """任务配置"""
     max_retries: int = 3
     retry_delay: int = 1000
     cleanup_timeout: int = 5
+    # 同时执行的任务数上限，超出的任务排队等待（0 表示不限制）
+    max_concurrent: int = 4
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class WebSocketConfig:
     """WebSocket配置"""
     ping_interval: int = 30000
     pong_timeout: int = 10000
     max_reconnect_attempts: int = 5
     reconnect_delay_base: int = 3000
+    # 发送窗口 (毫秒)：同一连接在窗口内产生的消息合并为一帧发送，0 表示立即发送
+    write_delay: int = 0
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class StorageConfig:
     """存储配置"""
     db_path: str = "./scrapy_project/data/storage.db"
@@ -60,7 +133,7 @@ class StorageConfig:
     history_retention_days: int = 30
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class LoggingConfig:
     """日志配置"""
     level: str = "INFO"
@@ -70,7 +143,7 @@ class LoggingConfig:
     backup_count: int = 5
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class ApiConfig:
     """API配置"""
     host: str = "0.0.0.0"
@@ -79,16 +152,15 @@ class ApiConfig:
     debug: bool = False
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class SimulationConfig:
     """模拟模式配置"""
     enabled: bool = True
-    action_delay: float = 0.3
-    browser_start_delay: float = 0.5
-    browser_close_delay: float = 0.2
+    # 模拟浏览器启动时的等待 (秒)，为 0 时不等待
+    delay: float = 0.0
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class PerformanceConfig:
     """性能优化配置"""
     batch_log_enabled: bool = True
@@ -96,9 +168,12 @@ class PerformanceConfig:
     batch_log_size: int = 10
     disable_realtime_screenshot: bool = False
     screenshot_interval: int = 1
+    # 两帧实时截图之间的最小间隔 (毫秒)，0 表示不限制
+    screenshot_min_interval: int = 200
+    io_thread_pool_size: int = 64
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class Config:
     """主配置类"""
     browser: BrowserConfig = field(default_factory=BrowserConfig)
@@ -111,28 +186,102 @@ class Config:
     performance: PerformanceConfig = field(default_factory=PerformanceConfig)
 
 
+# 共享的默认配置模板。加载后的配置视为只读：缺省的配置节直接引用这里的实例，不要原地修改
+_DEFAULT_CONFIG = Config()
+
+# 配置节表：(config.yaml 中的节名, 配置类, {字段: (环境变量名, 类型)})
+_SECTIONS = (
+    ("browser", BrowserConfig, {
+        "chrome_path": ("BROWSER_CHROME_PATH", str),
+        "headless": ("BROWSER_HEADLESS", bool),
+        "pool_size": ("BROWSER_POOL_SIZE", int),
+        "pool_recycle_after": ("BROWSER_POOL_RECYCLE_AFTER", int),
+    }),
+    ("task", TaskConfig, {
+        "max_concurrent": ("TASK_MAX_CONCURRENT", int),
+    }),
+    ("websocket", WebSocketConfig, {}),
+    ("storage", StorageConfig, {
+        "db_path": ("STORAGE_DB_PATH", str),
+        "data_dir": ("STORAGE_DATA_DIR", str),
+    }),
+    ("logging", LoggingConfig, {
+        "level": ("LOG_LEVEL", str),
+    }),
+    ("api", ApiConfig, {
+        "host": ("API_HOST", str),
+        "port": ("API_PORT", int),
+    }),
+    ("simulation", SimulationConfig, {
+        "enabled": ("SIMULATION_ENABLED", bool),
+        "delay": ("SIMULATION_DELAY", float),
+    }),
+    ("performance", PerformanceConfig, {
+        "io_thread_pool_size": ("AUTO_TOOLS_THREAD_POOL_SIZE", int),
+    }),
+)
+
+# 所有可覆盖配置的环境变量名
+_ENV_KEYS = tuple(env_key for _, _, env_overrides in _SECTIONS for env_key, _ in env_overrides.values())
+
+# 配置类 -> ((字段名, 扁平键 "节名.字段名"), ...)
+_SECTION_FIELDS = {
+    cls: tuple((f.name, f"{name}.{f.name}") for f in fields(cls))
+    for name, cls, _ in _SECTIONS
+}
+
+
+def _flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """把嵌套配置展开为 "节名.字段名" 形式的扁平字典（字典值本身也保留在其键下）"""
+    flat = {}
+    for key, value in data.items():
+        flat_key = f"{prefix}{key}"
+        flat[flat_key] = value
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{flat_key}."))
+    return flat
+
+
+@functools.lru_cache(maxsize=None)
+def _yaml_support():
+    """首次读取配置文件时才导入 yaml，返回 (yaml 模块, 加载器)
+
+    优先使用 libyaml 的 C 加速加载器，未编译 libyaml 时回退到纯 Python 实现
+    """
+    import yaml
+    return yaml, getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
 class ConfigLoader:
     """配置加载器"""
 
     def __init__(self, config_path: str = None):
-        self.config_path = config_path or PROJECT_ROOT / "config.yaml"
+        self.config_path = config_path or _DEFAULT_CONFIG_PATH
         self._config: Optional[Config] = None
         self._raw_config: Dict[str, Any] = {}
+        self._flat_config: Dict[str, Any] = {}
+        # 上次解析时的 (mtime_ns, size, 环境变量取值)，用于 reload 时跳过未变化的重新解析
+        self._signature: Optional[tuple] = None
 
     def load(self) -> Config:
         """加载配置"""
         if self._config is not None:
             return self._config
 
+        self._signature = self._current_signature()
         self._raw_config = self._read_yaml()
+        self._flat_config = _flatten(self._raw_config)
+        self._apply_env_overrides(self._flat_config)
         self._config = self._parse_config()
         return self._config
 
     def _read_yaml(self) -> Dict[str, Any]:
         """读取YAML配置文件"""
+        yaml, loader = _yaml_support()
         try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f) or {}
+            with open(self.config_path, 'rb') as f:
+                data = f.read()
+            return yaml.load(data, Loader=loader) or {}
         except FileNotFoundError:
             logging.warning(f"Config file not found: {self.config_path}")
             return {}
@@ -140,130 +289,75 @@ class ConfigLoader:
             logging.error(f"Failed to parse config file: {e}")
             return {}
 
+    def _apply_env_overrides(self, flat: Dict[str, Any]):
+        """把设置了的环境变量合并到扁平配置上"""
+        env_getters = {
+            str: self._get_env, int: self._get_env_int, bool: self._get_env_bool, float: self._get_env_float,
+        }
+        for name, _, env_overrides in _SECTIONS:
+            for field_name, (env_key, value_type) in env_overrides.items():
+                value = env_getters[value_type](env_key, None)
+                if value is not None:
+                    flat[f"{name}.{field_name}"] = value
+
     def _parse_config(self) -> Config:
-        """解析配置"""
-        config = Config()
-
-        # 浏览器配置
-        if 'browser' in self._raw_config:
-            browser_cfg = self._raw_config['browser']
-            config.browser = BrowserConfig(
-                chrome_path=self._get_env('BROWSER_CHROME_PATH', browser_cfg.get('chrome_path', config.browser.chrome_path)),
-                debug_port_min=browser_cfg.get('debug_port_min', config.browser.debug_port_min),
-                debug_port_max=browser_cfg.get('debug_port_max', config.browser.debug_port_max),
-                headless=self._get_env_bool('BROWSER_HEADLESS', browser_cfg.get('headless', config.browser.headless)),
-                page_timeout=browser_cfg.get('page_timeout', config.browser.page_timeout),
-                action_timeout=browser_cfg.get('action_timeout', config.browser.action_timeout),
-                screenshot_quality=browser_cfg.get('screenshot_quality', config.browser.screenshot_quality),
-                start_timeout=browser_cfg.get('start_timeout', config.browser.start_timeout),
-                enable_stealth=browser_cfg.get('enable_stealth', config.browser.enable_stealth),
-                viewport_width=browser_cfg.get('viewport_width', config.browser.viewport_width),
-                viewport_height=browser_cfg.get('viewport_height', config.browser.viewport_height),
-                user_agent=browser_cfg.get('user_agent', config.browser.user_agent),
-                locale=browser_cfg.get('locale', config.browser.locale),
-                timezone=browser_cfg.get('timezone', config.browser.timezone),
-            )
-
-        # 任务配置
-        if 'task' in self._raw_config:
-            task_cfg = self._raw_config['task']
-            config.task = TaskConfig(
-                max_retries=task_cfg.get('max_retries', config.task.max_retries),
-                retry_delay=task_cfg.get('retry_delay', config.task.retry_delay),
-                cleanup_timeout=task_cfg.get('cleanup_timeout', config.task.cleanup_timeout),
-            )
-
-        # WebSocket配置
-        if 'websocket' in self._raw_config:
-            ws_cfg = self._raw_config['websocket']
-            config.websocket = WebSocketConfig(
-                ping_interval=ws_cfg.get('ping_interval', config.websocket.ping_interval),
-                pong_timeout=ws_cfg.get('pong_timeout', config.websocket.pong_timeout),
-                max_reconnect_attempts=ws_cfg.get('max_reconnect_attempts', config.websocket.max_reconnect_attempts),
-                reconnect_delay_base=ws_cfg.get('reconnect_delay_base', config.websocket.reconnect_delay_base),
-            )
-
-        # 存储配置
-        if 'storage' in self._raw_config:
-            storage_cfg = self._raw_config['storage']
-            config.storage = StorageConfig(
-                db_path=self._get_env('STORAGE_DB_PATH', storage_cfg.get('db_path', config.storage.db_path)),
-                data_dir=self._get_env('STORAGE_DATA_DIR', storage_cfg.get('data_dir', config.storage.data_dir)),
-                max_history=storage_cfg.get('max_history', config.storage.max_history),
-                history_retention_days=storage_cfg.get('history_retention_days', config.storage.history_retention_days),
-            )
-
-        # 日志配置
-        if 'logging' in self._raw_config:
-            log_cfg = self._raw_config['logging']
-            config.logging = LoggingConfig(
-                level=self._get_env('LOG_LEVEL', log_cfg.get('level', config.logging.level)),
-                console=log_cfg.get('console', config.logging.console),
-                file_path=log_cfg.get('file_path', config.logging.file_path),
-                max_file_size=log_cfg.get('max_file_size', config.logging.max_file_size),
-                backup_count=log_cfg.get('backup_count', config.logging.backup_count),
-            )
-
-        # API配置
-        if 'api' in self._raw_config:
-            api_cfg = self._raw_config['api']
-            config.api = ApiConfig(
-                host=self._get_env('API_HOST', api_cfg.get('host', config.api.host)),
-                port=self._get_env_int('API_PORT', api_cfg.get('port', config.api.port)),
-                cors_origins=api_cfg.get('cors_origins', config.api.cors_origins),
-                debug=api_cfg.get('debug', config.api.debug),
-            )
-
-        # 模拟模式配置
-        if 'simulation' in self._raw_config:
-            sim_cfg = self._raw_config['simulation']
-            config.simulation = SimulationConfig(
-                enabled=self._get_env_bool('SIMULATION_ENABLED', sim_cfg.get('enabled', config.simulation.enabled)),
-                action_delay=sim_cfg.get('action_delay', config.simulation.action_delay),
-                browser_start_delay=sim_cfg.get('browser_start_delay', config.simulation.browser_start_delay),
-                browser_close_delay=sim_cfg.get('browser_close_delay', config.simulation.browser_close_delay),
-            )
-
-        # 性能优化配置
-        if 'performance' in self._raw_config:
-            perf_cfg = self._raw_config['performance']
-            config.performance = PerformanceConfig(
-                batch_log_enabled=perf_cfg.get('batch_log_enabled', config.performance.batch_log_enabled),
-                batch_log_interval=perf_cfg.get('batch_log_interval', config.performance.batch_log_interval),
-                batch_log_size=perf_cfg.get('batch_log_size', config.performance.batch_log_size),
-                disable_realtime_screenshot=perf_cfg.get('disable_realtime_screenshot', config.performance.disable_realtime_screenshot),
-                screenshot_interval=perf_cfg.get('screenshot_interval', config.performance.screenshot_interval),
-            )
+        """解析配置：按 _SECTIONS 表逐节读取扁平配置，缺省字段取 dataclass 默认值"""
+        config = replace(_DEFAULT_CONFIG)
+        flat = self._flat_config
+
+        for name, cls, _ in _SECTIONS:
+            # 与原行为一致：配置文件中没有的节（含其环境变量覆盖）使用默认配置
+            if self._raw_config.get(name) is None:
+                continue
+
+            defaults = getattr(_DEFAULT_CONFIG, name)
+            kwargs = {
+                field_name: flat.get(flat_key, getattr(defaults, field_name))
+                for field_name, flat_key in _SECTION_FIELDS[cls]
+            }
+            setattr(config, name, cls(**kwargs))
 
         return config
 
     def _get_env(self, key: str, default: str) -> str:
         """获取环境变量（字符串）"""
-        return os.environ.get(key, default)
+        value = _cached_env(key)
+        return default if value is None else value
 
     def _get_env_int(self, key: str, default: int) -> int:
         """获取环境变量（整数）"""
-        value = os.environ.get(key)
-        if value is not None:
-            try:
-                return int(value)
-            except ValueError:
-                return default
-        return default
+        value = _cached_env_int(key)
+        return default if value is None else value
 
     def _get_env_bool(self, key: str, default: bool) -> bool:
         """获取环境变量（布尔值）"""
-        value = os.environ.get(key)
-        if value is not None:
-            return value.lower() in ('true', '1', 'yes')
-        return default
+        value = _cached_env_bool(key)
+        return default if value is None else value
+
+    def _get_env_float(self, key: str, default: float) -> float:
+        """获取环境变量（浮点数）"""
+        value = _cached_env_float(key)
+        return default if value is None else value
 
     def get_raw(self) -> Dict[str, Any]:
         """获取原始配置"""
         return self._raw_config
 
+    def _current_signature(self) -> Optional[tuple]:
+        """配置文件与相关环境变量的当前状态，文件不存在时返回 None"""
+        try:
+            st = os.stat(self.config_path)
+        except OSError:
+            return None
+        env_values = tuple(_cached_env(env_key) for env_key in _ENV_KEYS)
+        return st.st_mtime_ns, st.st_size, env_values
+
     def reload(self) -> Config:
-        """重新加载配置"""
+        """重新加载配置（文件与环境变量均未变化时直接返回已解析的配置）"""
+        clear_env_cache()
+        signature = self._current_signature()
+        if self._config is not None and signature is not None and signature == self._signature:
+            return self._config
         self._config = None
         return self.load()
 
@@ -272,68 +366,135 @@ class ConfigLoader:
 _config: Optional[Config] = None
 
 
+@functools.lru_cache(maxsize=None)
+def _loader_for(config_path: Path) -> ConfigLoader:
+    """按（已解析的）配置文件路径复用加载器，同一路径只加载一次"""
+    return ConfigLoader(config_path)
+
+
+def _resolve_config_path(config_path: Optional[str]) -> Path:
+    if config_path is None:
+        return _DEFAULT_CONFIG_PATH
+    return Path(config_path).resolve()
+
+
 def get_config(config_path: str = None) -> Config:
     """获取配置单例"""
     global _config
-    if _config is None:
-        loader = ConfigLoader(config_path)
-        _config = loader.load()
+    if _config is not None:
+        return _config
+    _config = _loader_for(_resolve_config_path(config_path)).load()
     return _config
 
 
 def reload_config(config_path: str = None) -> Config:
     """重新加载配置"""
     global _config
-    loader = ConfigLoader(config_path)
-    _config = loader.load()
+    _config = _loader_for(_resolve_config_path(config_path)).reload()
     return _config
 
 
+class _AppLogFormatter(logging.Formatter):
+    """日志格式化器：记录带有 frames（traceback.StackSummary）时追加渲染这些堆栈帧"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        frames = getattr(record, 'frames', None)
+        if frames:
+            text = f"{text}\nTraceback (most recent call last):\n{''.join(frames.format()).rstrip()}"
+        return text
+
+
+class _LazyFileHandler(logging.Handler):
+    """延迟创建的轮转文件日志处理器：第一条记录到达时才创建日志目录并打开 RotatingFileHandler"""
+
+    def __init__(self, file_path: str, max_bytes: int, backup_count: int):
+        super().__init__()
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._handler: Optional[logging.Handler] = None
+
+    def emit(self, record: logging.LogRecord):
+        if self._handler is None:
+            from logging.handlers import RotatingFileHandler
+            try:
+                ensure_log_dir()
+                _ensure_dir(Path(self.file_path).parent)
+                handler = RotatingFileHandler(
+                    self.file_path,
+                    maxBytes=self.max_bytes,
+                    backupCount=self.backup_count,
+                    encoding='utf-8'
+                )
+            except Exception:
+                self.handleError(record)
+                return
+            handler.setFormatter(self.formatter)
+            handler.setLevel(self.level)
+            self._handler = handler
+        self._handler.emit(record)
+
+    def close(self):
+        if self._handler is not None:
+            self._handler.close()
+            self._handler = None
+        super().close()
+
+
+# 日志格式（所有处理器共用）
+_LOG_FORMATTER = _AppLogFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
 def setup_logging(config: Config = None):
-    """配置日志"""
+    """配置日志（可重复调用，先移除上次安装的处理器，避免重复输出）"""
     if config is None:
         config = get_config()
 
     log_level = getattr(logging, config.logging.level.upper(), logging.INFO)
+    root_logger = logging.getLogger()
 
-    # 创建日志目录
-    log_file = Path(config.logging.file_path)
-    log_file.parent.mkdir(parents=True, exist_ok=True)
+    # 移除之前由本函数安装的处理器
+    for handler in root_logger.handlers[:]:
+        if getattr(handler, '_installed_by_app', False):
+            root_logger.removeHandler(handler)
+            handler.close()
 
-    # 配置日志格式
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
+    handlers = []
 
-    # 文件日志
+    # 文件日志（首条记录写出时才创建目录并打开文件）
     if config.logging.file_path:
-        from logging.handlers import RotatingFileHandler
-        file_handler = RotatingFileHandler(
+        handlers.append(_LazyFileHandler(
             config.logging.file_path,
-            maxBytes=config.logging.max_file_size,
-            backupCount=config.logging.backup_count,
-            encoding='utf-8'
-        )
-        file_handler.setFormatter(formatter)
-        file_handler.setLevel(log_level)
-        logging.getLogger().addHandler(file_handler)
+            max_bytes=config.logging.max_file_size,
+            backup_count=config.logging.backup_count
+        ))
 
     # 控制台日志
     if config.logging.console:
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        console_handler.setLevel(log_level)
-        logging.getLogger().addHandler(console_handler)
+        handlers.append(logging.StreamHandler())
+
+    for handler in handlers:
+        handler.setFormatter(_LOG_FORMATTER)
+        handler.setLevel(log_level)
+        handler._installed_by_app = True
+        root_logger.addHandler(handler)
 
     # 设置根日志级别
-    logging.getLogger().setLevel(log_level)
+    root_logger.setLevel(log_level)
 
 
-# 创建logs目录
-def ensure_log_dir():
-    """确保日志目录存在"""
-    log_dir = PROJECT_ROOT / "logs"
-    log_dir.mkdir(parents=True, exist_ok=True)
+# 本进程内已确认存在的目录
+_ENSURED_DIRS = set()
+
+
+def _ensure_dir(path: Path):
+    """创建目录（每个目录每进程只创建一次）"""
+    if path not in _ENSURED_DIRS:
+        path.mkdir(parents=True, exist_ok=True)
+        _ENSURED_DIRS.add(path)
 
 
-ensure_log_dir()
+def ensure_log_dir():
+    """确保日志目录存在"""
+    _ensure_dir(PROJECT_ROOT / "logs")
@@ -2,17 +2,56 @@
 错误处理模块
 提供统一的错误码规范和错误处理机制
 """
-from enum import Enum
-from typing import Optional, Dict, Any
+from enum import Enum, unique
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Mapping
 from dataclasses import dataclass, field
-from datetime import datetime
 import logging
 import json
+import sys
+import time
 import traceback
 
+try:
+    import orjson
+
+    def _json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+except ImportError:
+    def _json_dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
 logger = logging.getLogger(__name__)
 
+# 错误日志中附带的最大堆栈帧数
+LOG_TRACEBACK_FRAMES = 5
+
+# Python 3.10+ 的 dataclass 支持 slots，旧版本回退为普通 dataclass
+_DATACLASS_OPTIONS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+# 最近一次格式化的 (毫秒时间戳, ISO 字符串)，同一毫秒内的错误复用同一字符串
+_last_iso = (-1, "")
+
 
+def _iso_from_ns(timestamp_ns: int) -> str:
+    """纳秒时间戳转为本地时间 ISO 字符串（毫秒精度，按毫秒缓存）"""
+    global _last_iso
+    ms = timestamp_ns // 1_000_000
+    cached_ms, cached_iso = _last_iso
+    if ms == cached_ms:
+        return cached_iso
+    seconds, millis = divmod(ms, 1000)
+    iso = f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(seconds))}.{millis:03d}000"
+    _last_iso = (ms, iso)
+    return iso
+
+
+def _now_iso() -> str:
+    """当前时间的 ISO 字符串"""
+    return _iso_from_ns(time.time_ns())
+
+
+@unique
 class ErrorCode(str, Enum):
     """错误码枚举"""
     # 浏览器错误 (ERR-BRWSR)
@@ -59,17 +98,31 @@ class ErrorCode(str, Enum):
     ERR_SYS_UNKNOWN = "ERR_SYS_999"         # 未知错误
 
 
-@dataclass
+# 错误码 -> 驻留后的字符串值，替代每次 isinstance 判断；非 ErrorCode 的值原样返回
+_ERR_VALUES = MappingProxyType({code: sys.intern(code.value) for code in ErrorCode})
+
+# 没有详细信息的错误共享的只读空映射，不再为每个 ErrorDetail 新建 dict
+EMPTY_DETAILS: Mapping[str, Any] = MappingProxyType({})
+
+
+@dataclass(**_DATACLASS_OPTIONS)
 class ErrorDetail:
     """错误详情"""
     code: str
     message: str
     reason: Optional[str] = None
     suggestion: Optional[str] = None
-    details: Dict[str, Any] = field(default_factory=dict)
-    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
+    details: Mapping[str, Any] = field(default_factory=lambda: EMPTY_DETAILS)
+    timestamp: int = field(default_factory=time.time_ns)  # 纳秒时间戳，输出时再格式化
     task_id: Optional[str] = None
     action_index: Optional[int] = None
+    # to_json 结果缓存（ErrorDetail 创建后视为不可变）
+    _json_cache: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def timestamp_iso(self) -> str:
+        """ISO 格式的错误时间"""
+        return _iso_from_ns(self.timestamp)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -77,14 +130,17 @@ class ErrorDetail:
             "message": self.message,
             "reason": self.reason,
             "suggestion": self.suggestion,
-            "details": self.details,
-            "timestamp": self.timestamp,
+            # 共享的只读空映射无法被 json/orjson 序列化，输出时换成普通空 dict
+            "details": self.details or {},
+            "timestamp": self.timestamp_iso,
             "task_id": self.task_id,
             "action_index": self.action_index
         }
 
     def to_json(self) -> str:
-        return json.dumps(self.to_dict(), ensure_ascii=False)
+        if self._json_cache is None:
+            self._json_cache = _json_dumps(self.to_dict())
+        return self._json_cache
 
     def to_frontend(self) -> Dict[str, Any]:
         """返回前端友好的错误格式"""
@@ -96,95 +152,153 @@ class ErrorDetail:
         }
 
 
+# ErrorMessages 模板：错误码 -> (消息, 原因模板, 建议)
+_TEMPLATES = MappingProxyType({
+    ErrorCode.ERR_BRWSR_START_FAILED: (
+        "浏览器启动失败", "{reason}",
+        "请检查Chrome路径配置是否正确，或尝试手动启动Chrome调试模式"),
+    ErrorCode.ERR_BRWSR_NOT_FOUND: (
+        "Chrome浏览器未找到", "文件不存在: {path}",
+        "请确认Chrome已安装，或在config.yaml中配置正确的路径"),
+    ErrorCode.ERR_PAGE_LOAD_TIMEOUT: (
+        "页面加载超时", "页面 {url} 在 {timeout}ms 内未加载完成",
+        "1. 检查网络连接 2. 增加超时时间 3. 使用wait_until='domcontentloaded'"),
+    ErrorCode.ERR_ELEM_NOT_FOUND: (
+        "元素未找到", "无法找到选择器: {selector}",
+        "1. 检查选择器是否正确 2. 确认元素是否在iframe中 3. 添加等待时间"),
+    ErrorCode.ERR_ELEM_NOT_VISIBLE: (
+        "元素不可见", "元素 {selector} 存在但不可见",
+        "1. 滚动到元素可见 2. 检查元素是否被遮挡 3. 等待元素加载完成"),
+    ErrorCode.ERR_ACT_TIMEOUT: (
+        "操作超时", "{action} 操作在 {timeout}ms 内未完成",
+        "1. 增加超时时间 2. 检查页面状态 3. 简化操作步骤"),
+    ErrorCode.ERR_SCREEN_FAILED: (
+        "截图失败", "{reason}",
+        "1. 检查页面是否加载完成 2. 确认元素是否存在 3. 尝试减少截图区域"),
+    ErrorCode.ERR_TASK_NOT_FOUND: (
+        "任务不存在", "任务ID: {task_id}",
+        "请检查任务ID是否正确，或重新创建任务"),
+    ErrorCode.ERR_ACT_UNSUPPORTED: (
+        "不支持的操作", "操作类型: {action_type}",
+        "请检查操作类型是否正确，或联系开发者添加支持"),
+})
+
+
 class ErrorMessages:
     """错误消息模板"""
 
     @staticmethod
-    def browser_start_failed(reason: str = None) -> ErrorDetail:
+    def render(code: ErrorCode, details: Dict[str, Any] = None, **kwargs) -> ErrorDetail:
+        """按 _TEMPLATES 中的模板生成错误详情，kwargs 用于填充原因模板"""
+        message, reason, suggestion = _TEMPLATES[code]
         return ErrorDetail(
-            code=ErrorCode.ERR_BRWSR_START_FAILED,
-            message="浏览器启动失败",
+            code=code,
+            message=message,
+            reason=reason.format(**kwargs),
+            suggestion=suggestion,
+            details=EMPTY_DETAILS if details is None else details
+        )
+
+    @staticmethod
+    def browser_start_failed(reason: str = None) -> ErrorDetail:
+        return ErrorMessages.render(
+            ErrorCode.ERR_BRWSR_START_FAILED,
             reason=reason or "未知原因",
-            suggestion="请检查Chrome路径配置是否正确，或尝试手动启动Chrome调试模式",
             details={"chrome_path": "检查 config.yaml 中的 browser.chrome_path"}
         )
 
     @staticmethod
     def browser_not_found(path: str) -> ErrorDetail:
-        return ErrorDetail(
-            code=ErrorCode.ERR_BRWSR_NOT_FOUND,
-            message="Chrome浏览器未找到",
-            reason=f"文件不存在: {path}",
-            suggestion="请确认Chrome已安装，或在config.yaml中配置正确的路径"
-        )
+        return ErrorMessages.render(ErrorCode.ERR_BRWSR_NOT_FOUND, path=path)
 
     @staticmethod
     def page_load_timeout(url: str, timeout: int) -> ErrorDetail:
-        return ErrorDetail(
-            code=ErrorCode.ERR_PAGE_LOAD_TIMEOUT,
-            message="页面加载超时",
-            reason=f"页面 {url} 在 {timeout}ms 内未加载完成",
-            suggestion="1. 检查网络连接 2. 增加超时时间 3. 使用wait_until='domcontentloaded'",
+        return ErrorMessages.render(
+            ErrorCode.ERR_PAGE_LOAD_TIMEOUT, url=url, timeout=timeout,
             details={"url": url, "timeout": timeout}
         )
 
     @staticmethod
     def element_not_found(selector: str, action: str = None) -> ErrorDetail:
-        return ErrorDetail(
-            code=ErrorCode.ERR_ELEM_NOT_FOUND,
-            message="元素未找到",
-            reason=f"无法找到选择器: {selector}",
-            suggestion="1. 检查选择器是否正确 2. 确认元素是否在iframe中 3. 添加等待时间",
+        return ErrorMessages.render(
+            ErrorCode.ERR_ELEM_NOT_FOUND, selector=selector,
             details={"selector": selector, "action": action}
         )
 
     @staticmethod
     def element_not_visible(selector: str) -> ErrorDetail:
-        return ErrorDetail(
-            code=ErrorCode.ERR_ELEM_NOT_VISIBLE,
-            message="元素不可见",
-            reason=f"元素 {selector} 存在但不可见",
-            suggestion="1. 滚动到元素可见 2. 检查元素是否被遮挡 3. 等待元素加载完成",
+        return ErrorMessages.render(
+            ErrorCode.ERR_ELEM_NOT_VISIBLE, selector=selector,
             details={"selector": selector}
         )
 
     @staticmethod
     def action_timeout(action: str, timeout: int) -> ErrorDetail:
-        return ErrorDetail(
-            code=ErrorCode.ERR_ACT_TIMEOUT,
-            message="操作超时",
-            reason=f"{action} 操作在 {timeout}ms 内未完成",
-            suggestion="1. 增加超时时间 2. 检查页面状态 3. 简化操作步骤",
+        return ErrorMessages.render(
+            ErrorCode.ERR_ACT_TIMEOUT, action=action, timeout=timeout,
             details={"action": action, "timeout": timeout}
         )
 
     @staticmethod
     def screenshot_failed(reason: str) -> ErrorDetail:
-        return ErrorDetail(
-            code=ErrorCode.ERR_SCREEN_FAILED,
-            message="截图失败",
-            reason=reason,
-            suggestion="1. 检查页面是否加载完成 2. 确认元素是否存在 3. 尝试减少截图区域",
+        return ErrorMessages.render(
+            ErrorCode.ERR_SCREEN_FAILED, reason=reason,
             details={"reason": reason}
         )
 
     @staticmethod
     def task_not_found(task_id: str) -> ErrorDetail:
-        return ErrorDetail(
-            code=ErrorCode.ERR_TASK_NOT_FOUND,
-            message="任务不存在",
-            reason=f"任务ID: {task_id}",
-            suggestion="请检查任务ID是否正确，或重新创建任务"
-        )
+        return ErrorMessages.render(ErrorCode.ERR_TASK_NOT_FOUND, task_id=task_id)
 
     @staticmethod
     def unsupported_action(action_type: str) -> ErrorDetail:
-        return ErrorDetail(
-            code=ErrorCode.ERR_ACT_UNSUPPORTED,
-            message="不支持的操作",
-            reason=f"操作类型: {action_type}",
-            suggestion="请检查操作类型是否正确，或联系开发者添加支持"
-        )
+        return ErrorMessages.render(ErrorCode.ERR_ACT_UNSUPPORTED, action_type=action_type)
+
+
+# 异常类型名 -> 错误码（按类型名匹配，Playwright 等库的同名 TimeoutError 也能命中）
+_EXCEPTION_TO_CODE = MappingProxyType({
+    "FileNotFoundError": ErrorCode.ERR_BRWSR_NOT_FOUND,
+    "TimeoutError": ErrorCode.ERR_ACT_TIMEOUT,
+    "ValueError": ErrorCode.ERR_ELEM_NOT_FOUND,
+    "IndexError": ErrorCode.ERR_ELEM_NOT_FOUND,
+    "AttributeError": ErrorCode.ERR_SYS_UNKNOWN,
+    "ConnectionError": ErrorCode.ERR_BRWSR_CONNECTION_LOST,
+    "ProcessLookupError": ErrorCode.ERR_BRWSR_PROCESS_EXITED,
+})
+
+# 错误码 -> 错误消息
+_MESSAGES = MappingProxyType({
+    ErrorCode.ERR_BRWSR_START_FAILED: "浏览器启动失败",
+    ErrorCode.ERR_BRWSR_NOT_FOUND: "Chrome浏览器未找到",
+    ErrorCode.ERR_BRWSR_CONNECTION_LOST: "浏览器连接断开",
+    ErrorCode.ERR_PAGE_LOAD_FAILED: "页面加载失败",
+    ErrorCode.ERR_PAGE_LOAD_TIMEOUT: "页面加载超时",
+    ErrorCode.ERR_ELEM_NOT_FOUND: "元素未找到",
+    ErrorCode.ERR_ELEM_NOT_VISIBLE: "元素不可见",
+    ErrorCode.ERR_ELEM_NOT_INTERACTABLE: "元素不可交互",
+    ErrorCode.ERR_ACT_TIMEOUT: "操作超时",
+    ErrorCode.ERR_ACT_FAILED: "操作执行失败",
+    ErrorCode.ERR_ACT_UNSUPPORTED: "不支持的操作",
+    ErrorCode.ERR_SCREEN_FAILED: "截图失败",
+    ErrorCode.ERR_TASK_NOT_FOUND: "任务不存在",
+    ErrorCode.ERR_TASK_CANCELLED: "任务已取消",
+    ErrorCode.ERR_TASK_TIMEOUT: "任务执行超时",
+    ErrorCode.ERR_TASK_FAILED: "任务执行失败",
+    ErrorCode.ERR_SYS_CONFIG: "系统配置错误",
+    ErrorCode.ERR_SYS_STORAGE: "存储错误",
+    ErrorCode.ERR_SYS_WEBSOCKET: "WebSocket错误",
+    ErrorCode.ERR_SYS_UNKNOWN: "未知错误",
+})
+
+# 错误码 -> 处理建议
+_SUGGESTIONS = MappingProxyType({
+    ErrorCode.ERR_BRWSR_START_FAILED: "请检查Chrome路径配置，或手动启动Chrome调试模式测试",
+    ErrorCode.ERR_BRWSR_NOT_FOUND: "请在config.yaml中配置正确的Chrome路径",
+    ErrorCode.ERR_PAGE_LOAD_TIMEOUT: "建议增加超时时间或使用wait_until='domcontentloaded'",
+    ErrorCode.ERR_ELEM_NOT_FOUND: "请检查选择器是否正确，确认元素是否在iframe中",
+    ErrorCode.ERR_ACT_TIMEOUT: "请增加超时时间或简化操作步骤",
+    ErrorCode.ERR_SCREEN_FAILED: "请确认页面已加载完成，元素存在",
+})
 
 
 class ErrorHandler:
@@ -212,7 +326,7 @@ class ErrorHandler:
         details = ErrorHandler._extract_details(exception)
 
         error_detail = ErrorDetail(
-            code=error_code.value if isinstance(error_code, ErrorCode) else error_code,
+            code=_ERR_VALUES.get(error_code, error_code),
             message=ErrorHandler._get_message(error_code),
             reason=reason,
             suggestion=suggestion,
@@ -221,12 +335,18 @@ class ErrorHandler:
             action_index=action_index
         )
 
-        # 记录错误日志
-        logger.error(
-            f"[{error_detail.code}] {error_detail.message}",
-            extra={"task_id": task_id, "action_index": action_index},
-            exc_info=True
-        )
+        # 记录错误日志：只附带最内层的若干帧（结构化），由日志格式化器按需渲染，
+        # 避免每次都格式化完整堆栈
+        if logger.isEnabledFor(logging.ERROR):
+            logger.error(
+                "[%s] %s: %s: %s", error_detail.code, error_detail.message,
+                type(exception).__name__, exception,
+                extra={
+                    "task_id": task_id,
+                    "action_index": action_index,
+                    "frames": traceback.extract_tb(exception.__traceback__, limit=-LOG_TRACEBACK_FRAMES),
+                }
+            )
 
         return error_detail
 
@@ -236,60 +356,17 @@ class ErrorHandler:
         default_code: ErrorCode
     ) -> ErrorCode:
         """根据异常类型映射错误码"""
-
-        exception_type = type(exception).__name__
-
-        mappings = {
-            "FileNotFoundError": ErrorCode.ERR_BRWSR_NOT_FOUND,
-            "TimeoutError": ErrorCode.ERR_ACT_TIMEOUT,
-            "ValueError": ErrorCode.ERR_ELEM_NOT_FOUND,
-            "IndexError": ErrorCode.ERR_ELEM_NOT_FOUND,
-            "AttributeError": ErrorCode.ERR_SYS_UNKNOWN,
-            "ConnectionError": ErrorCode.ERR_BRWSR_CONNECTION_LOST,
-            "ProcessLookupError": ErrorCode.ERR_BRWSR_PROCESS_EXITED,
-        }
-
-        return mappings.get(exception_type, default_code)
+        return _EXCEPTION_TO_CODE.get(type(exception).__name__, default_code)
 
     @staticmethod
     def _get_message(error_code: ErrorCode) -> str:
         """获取错误码对应的消息"""
-        messages = {
-            ErrorCode.ERR_BRWSR_START_FAILED: "浏览器启动失败",
-            ErrorCode.ERR_BRWSR_NOT_FOUND: "Chrome浏览器未找到",
-            ErrorCode.ERR_BRWSR_CONNECTION_LOST: "浏览器连接断开",
-            ErrorCode.ERR_PAGE_LOAD_FAILED: "页面加载失败",
-            ErrorCode.ERR_PAGE_LOAD_TIMEOUT: "页面加载超时",
-            ErrorCode.ERR_ELEM_NOT_FOUND: "元素未找到",
-            ErrorCode.ERR_ELEM_NOT_VISIBLE: "元素不可见",
-            ErrorCode.ERR_ELEM_NOT_INTERACTABLE: "元素不可交互",
-            ErrorCode.ERR_ACT_TIMEOUT: "操作超时",
-            ErrorCode.ERR_ACT_FAILED: "操作执行失败",
-            ErrorCode.ERR_ACT_UNSUPPORTED: "不支持的操作",
-            ErrorCode.ERR_SCREEN_FAILED: "截图失败",
-            ErrorCode.ERR_TASK_NOT_FOUND: "任务不存在",
-            ErrorCode.ERR_TASK_CANCELLED: "任务已取消",
-            ErrorCode.ERR_TASK_TIMEOUT: "任务执行超时",
-            ErrorCode.ERR_TASK_FAILED: "任务执行失败",
-            ErrorCode.ERR_SYS_CONFIG: "系统配置错误",
-            ErrorCode.ERR_SYS_STORAGE: "存储错误",
-            ErrorCode.ERR_SYS_WEBSOCKET: "WebSocket错误",
-            ErrorCode.ERR_SYS_UNKNOWN: "未知错误",
-        }
-        return messages.get(error_code, "发生错误")
+        return _MESSAGES.get(error_code, "发生错误")
 
     @staticmethod
     def _get_suggestion(error_code: ErrorCode, exception: Exception = None) -> str:
         """获取错误处理建议"""
-        suggestions = {
-            ErrorCode.ERR_BRWSR_START_FAILED: "请检查Chrome路径配置，或手动启动Chrome调试模式测试",
-            ErrorCode.ERR_BRWSR_NOT_FOUND: "请在config.yaml中配置正确的Chrome路径",
-            ErrorCode.ERR_PAGE_LOAD_TIMEOUT: "建议增加超时时间或使用wait_until='domcontentloaded'",
-            ErrorCode.ERR_ELEM_NOT_FOUND: "请检查选择器是否正确，确认元素是否在iframe中",
-            ErrorCode.ERR_ACT_TIMEOUT: "请增加超时时间或简化操作步骤",
-            ErrorCode.ERR_SCREEN_FAILED: "请确认页面已加载完成，元素存在",
-        }
-        return suggestions.get(error_code, "请检查输入参数和网络连接")
+        return _SUGGESTIONS.get(error_code, "请检查输入参数和网络连接")
 
     @staticmethod
     def _extract_details(exception: Exception) -> Dict[str, Any]:
@@ -317,12 +394,12 @@ class ErrorHandler:
     ) -> Dict[str, Any]:
         """创建任务错误响应"""
         return {
-            "error_code": error_code.value if isinstance(error_code, ErrorCode) else error_code,
+            "error_code": _ERR_VALUES.get(error_code, error_code),
             "message": message,
             "task_id": task_id,
             "reason": reason,
             "suggestion": suggestion,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _now_iso()
         }
 
 
@@ -347,5 +424,5 @@ def create_error_response(error_detail: ErrorDetail) -> Dict[str, Any]:
     return {
         "success": False,
         "error": error_detail.to_frontend(),
-        "timestamp": error_detail.timestamp
+        "timestamp": error_detail.timestamp_iso
     }
@@ -1,123 +1,358 @@
 """
 任务执行引擎模块
-使用子进程方式运行浏览器，避免 asyncio 子进程兼容性问题
+使用子进程方式运行浏览器（asyncio 子进程，事件循环不支持时回退到 subprocess.Popen）
 """
 import sys
 import asyncio
-import base64
 import subprocess
-import json
-import signal
+import tempfile
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from types import MappingProxyType
+from typing import Dict, Any, Optional, List, Mapping, Tuple
+from dataclasses import dataclass, field
 from datetime import datetime
 import logging
 import os
 import uuid
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from fastapi import BackgroundTasks
-
-sys.path.insert(0, str(Path(__file__).parent.parent))
-
-from scrapy_project.utils.scheduler import TaskStatus, TaskPriority
-from scrapy_project.utils.storage import storage_manager
-from api_service.websocket_manager import ws_manager, WebSocketMessageType
+from api_service.websocket_manager import ws_manager
 from api_service.config import get_config
-from api_service.errors import ErrorCode, ErrorHandler, ErrorDetail
+from api_service.errors import ErrorCode, ErrorHandler
+from api_service.ipc import FrameDecoder, pack_frame
 
 logger = logging.getLogger(__name__)
 
 
-def convert_selector(selector: str, selector_type: str = "css") -> str:
-    """将不同类型的选择器转换为Playwright可识别的格式"""
-    if not selector:
-        return selector
+_DATACLASS_OPTIONS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+# 操作类型 -> 展示名称（只读）
+_ACTION_NAMES: Mapping[str, str] = MappingProxyType({
+    "goto": "访问页面",
+    "click": "点击元素",
+    "input": "输入内容",
+    "wait": "等待",
+    "scroll": "页面滚动",
+    "screenshot": "截图",
+    "extract": "提取数据",
+    "press": "键盘操作",
+    "hover": "悬停",
+    "upload": "上传文件",
+    "evaluate": "执行脚本",
+    "switch_frame": "切换框架",
+    "switch_tab": "切换标签页",
+    "new_tab": "打开新标签页",
+    "close_tab": "关闭标签页",
+    "drag": "拖拽元素",
+    "keyboard": "键盘操作"
+})
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+
+
+def io_executor() -> ThreadPoolExecutor:
+    """浏览器子进程阻塞 I/O 共用的线程池（首次使用时按 performance.io_thread_pool_size 创建）"""
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(
+            max_workers=get_config().performance.io_thread_pool_size,
+            thread_name_prefix="autotools-io"
+        )
+    return _io_pool
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class TaskInfo:
+    """正在执行的任务状态（由 execute_task 登记，结束时移除）"""
+    task_id: str
+    url: str
+    actions_count: int
+    start_time: datetime
+    headless: bool = False
+    current_action: int = 0
+    status: str = "pending"
+    current_action_name: Optional[str] = None
+    end_time: Optional[datetime] = None
+    progress: Optional[int] = None
+    error: Optional[str] = None
+    # 单调时钟起点，耗时按它计算（不受系统时间调整影响），不对外输出
+    started_monotonic: float = field(default_factory=time.monotonic)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为接口返回的字典，未设置的可选字段不输出"""
+        data = {
+            "task_id": self.task_id,
+            "url": self.url,
+            "actions_count": self.actions_count,
+            "current_action": self.current_action,
+            "status": self.status,
+            "start_time": self.start_time,
+            "headless": self.headless,
+        }
+        for key in ("current_action_name", "end_time", "progress", "error"):
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value
+        return data
+
+
+@dataclass(frozen=True, **_DATACLASS_OPTIONS)
+class ScreenshotSettings:
+    """实时截图配置快照，任务开始时读取一次，之后每帧不再查询配置"""
+    enabled: bool
+    interval: int
+    quality: int
+    max_width: int
+    min_interval: float = 0.0  # 两帧之间的最小间隔（秒）
+
+    @classmethod
+    def from_config(cls, config) -> "ScreenshotSettings":
+        return cls(
+            enabled=not config.performance.disable_realtime_screenshot,
+            interval=config.performance.screenshot_interval,
+            quality=config.browser.screenshot_quality,
+            max_width=config.browser.screenshot_max_width,
+            min_interval=config.performance.screenshot_min_interval / 1000,
+        )
+
+
+def _loggable(data: Any) -> Any:
+    """日志用的响应摘要：二进制字段（截图）只记录长度，避免把整张图片的 repr 格式化进日志"""
+    if isinstance(data, dict) and any(isinstance(value, (bytes, bytearray)) for value in data.values()):
+        return {
+            key: f"<{len(value)} bytes>" if isinstance(value, (bytes, bytearray)) else value
+            for key, value in data.items()
+        }
+    return data
+
+
+def _log_controller_line(line: bytes):
+    """将控制器 stderr 的一行转发到主日志"""
+    logger.info(f"[BrowserController] {line.decode('utf-8', errors='replace').strip()}")
+
+
+# 控制器 stderr 中未换行内容的缓冲上限，超出时直接转发，避免不输出换行的进程让缓冲区无限增长
+_STDERR_LINE_LIMIT = 2 ** 16
+
+
+class _ControllerProcessProtocol(asyncio.SubprocessProtocol):
+    """控制器子进程协议：stderr 数据在事件循环回调中按行转发到日志，无需为每个浏览器保留读取任务"""
+
+    def __init__(self, loop):
+        self._stderr_buffer = bytearray()
+        self._stderr_open = True
+        self._transport = None
+        self.exited = loop.create_future()
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def pipe_data_received(self, fd, data):
+        if fd != 2:
+            return
+        buffer = self._stderr_buffer
+        buffer += data
+        end = buffer.rfind(b"\n")
+        if end >= 0:
+            for line in buffer[:end].split(b"\n"):
+                _log_controller_line(line)
+            del buffer[:end + 1]
+        if len(buffer) > _STDERR_LINE_LIMIT:
+            _log_controller_line(buffer)
+            buffer.clear()
+
+    def pipe_connection_lost(self, fd, exc):
+        if fd != 2:
+            return
+        if self._stderr_buffer:
+            _log_controller_line(self._stderr_buffer)
+            self._stderr_buffer.clear()
+        self._stderr_open = False
+        self._maybe_close_transport()
+
+    def process_exited(self):
+        if not self.exited.done():
+            self.exited.set_result(None)
+        self._maybe_close_transport()
+
+    def _maybe_close_transport(self):
+        # 进程已退出且 stderr 已读完时释放传输
+        if self.exited.done() and not self._stderr_open and self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
 
-    selector_type = selector_type.lower() if selector_type else "css"
+class _ControllerProcess:
+    """loop.subprocess_exec 返回的传输与协议的包装，提供 SubprocessBrowser 用到的 pid / returncode / wait / terminate / kill"""
 
-    if selector_type == "xpath":
-        return selector
-    elif selector_type == "id":
-        if not selector.startswith("#"):
-            return f"#{selector}"
-        return selector
-    elif selector_type == "class":
-        if not selector.startswith("."):
-            classes = selector.split()
-            return ".".join(classes) if classes else f".{selector}"
-        return selector
-    elif selector_type == "name":
-        return f'[name="{selector}"]'
-    else:
-        return selector
+    __slots__ = ("_transport", "_protocol", "pid")
+
+    def __init__(self, transport: asyncio.SubprocessTransport, protocol: _ControllerProcessProtocol):
+        self._transport = transport
+        self._protocol = protocol
+        self.pid = transport.get_pid()
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._transport.get_returncode()
+
+    async def wait(self) -> int:
+        # shield：wait_for 超时取消的是本次等待，不能取消协议中共享的退出 future
+        await asyncio.shield(self._protocol.exited)
+        return self.returncode
+
+    def terminate(self):
+        self._transport.terminate()
+
+    def kill(self):
+        self._transport.kill()
+
+
+class _ControllerConnection(asyncio.Protocol):
+    """IPC 连接协议：数据到达时在事件循环回调中解析帧，按 req_id 唤醒等待的请求
+
+    控制器连接后先发送 {"ready": true} 帧，收到后以传输对象完成 ready
+    """
+
+    def __init__(self, browser: "SubprocessBrowser", ready: Optional[asyncio.Future] = None):
+        self._browser = browser
+        self._ready = ready
+        self._decoder = FrameDecoder()
+        self._transport = None
+
+    def connection_made(self, transport):
+        if self._ready is not None and self._ready.done():
+            # 已有控制器连接（或已超时放弃），多余的连接直接断开
+            transport.close()
+            return
+        self._transport = transport
+
+    def data_received(self, data):
+        try:
+            responses = self._decoder.feed(data)
+        except ValueError as e:
+            logger.error(f"[Browser] 读取响应失败: {e}")
+            self._transport.close()
+            return
+        for response in responses:
+            if response.get("ready") and self._ready is not None:
+                if not self._ready.done():
+                    self._ready.set_result(self._transport)
+                continue
+            self._browser._on_response(response)
+
+    def connection_lost(self, exc):
+        if self._transport is None:
+            return
+        if self._ready is not None and not self._ready.done():
+            self._ready.set_exception(Exception("浏览器子进程在就绪前断开连接"))
+        self._browser._fail_pending(Exception("子进程无响应"))
 
 
 class SubprocessBrowser:
     """使用子进程运行浏览器的控制器"""
 
     def __init__(self):
-        self.process: Optional[subprocess.Popen] = None
+        # _ControllerProcess；事件循环不支持子进程时为 subprocess.Popen
+        self.process = None
         self.port: Optional[int] = None
         self.task_id: Optional[str] = None
-        self._input_reader = None
-        self._output_writer = None
-        self._stderr_reader_task = None
-
-    def _find_free_port(self) -> int:
-        """查找可用端口"""
-        import socket
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind(('', 0))
-            return s.getsockname()[1]
+        self._ipc_path: Optional[str] = None  # Unix 域套接字路径（Windows 下为 None，改用回环 TCP）
+        self._transport: Optional[asyncio.Transport] = None
+        self._pending: Dict[int, asyncio.Future] = {}  # req_id -> 等待响应的 Future
+        self._next_req_id = 0
+        self._stderr_reader_task = None  # 仅 Popen 回退方案使用
+        self.stealth = False  # Chrome 启动时是否启用了反检测模式
+        self.use_count = 0  # 浏览器池中已服务的任务数
+        self.pooled = False  # 是否来自浏览器池
+        self._closed = False
+
+    # 已确认存在的 Chrome 路径，之后启动不再检查；不存在的路径不缓存，安装 Chrome 后无需重启服务
+    _verified_chrome_paths: set = set()
+
+    # 进程内共享的调试端口轮转迭代器（browser.debug_port_min ~ debug_port_max），首次启动时创建
+    _debug_ports = None
+
+    @classmethod
+    def _next_debug_port(cls, config) -> int:
+        """按顺序分配 Chrome 调试端口，占用冲突由子进程检测并改用空闲端口"""
+        if cls._debug_ports is None:
+            cls._debug_ports = itertools.cycle(
+                range(config.browser.debug_port_min, config.browser.debug_port_max + 1)
+            )
+        return next(cls._debug_ports)
+
+    def _returncode(self) -> Optional[int]:
+        """子进程退出码，仍在运行时为 None"""
+        if isinstance(self.process, subprocess.Popen):
+            return self.process.poll()
+        return self.process.returncode
+
+    def is_alive(self) -> bool:
+        """子进程是否仍在运行"""
+        return self.process is not None and self._returncode() is None
+
+    def _browser_options(self, config, browser_config: dict = None) -> dict:
+        """合并全局配置与任务级反检测配置"""
+        options = {
+            "enable_stealth": config.browser.enable_stealth,
+            "viewport_width": config.browser.viewport_width,
+            "viewport_height": config.browser.viewport_height,
+            "user_agent": config.browser.user_agent,
+            "locale": config.browser.locale,
+            "timezone": config.browser.timezone,
+        }
+        if browser_config:
+            for key in options:
+                if key in browser_config:
+                    options[key] = browser_config[key]
+        return options
 
-    async def start(self, task_id: str, url: str, headless: bool = False, config=None,
-                    browser_config: dict = None) -> bool:
-        """启动浏览器子进程"""
+    async def launch(self, config, url: str = None, browser_config: dict = None) -> bool:
+        """启动浏览器子进程和 Chrome；url 为空时只打开空白页，供浏览器池预热"""
         chrome_path = config.browser.chrome_path
-        if not os.path.exists(chrome_path):
-            raise FileNotFoundError(f"Chrome not found at: {chrome_path}")
+        if chrome_path not in self._verified_chrome_paths:
+            if not os.path.exists(chrome_path):
+                raise FileNotFoundError(f"Chrome not found at: {chrome_path}")
+            self._verified_chrome_paths.add(chrome_path)
 
-        self.task_id = task_id
-        self.port = self._find_free_port()
+        self.port = self._next_debug_port(config)
 
         logger.info(f"[Browser] 启动 Chrome: {chrome_path}, 端口: {self.port}")
 
         # 获取当前文件目录，构建浏览器控制器路径
         controller_path = Path(__file__).parent / "browser_controller.py"
 
-        # 启动子进程
-        self.process = subprocess.Popen(
-            [sys.executable, str(controller_path)],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=0  # 行缓冲
-        )
+        # 先监听 IPC 地址再启动子进程，控制器就绪后主动连接并发送 ready 帧
+        ready = asyncio.get_running_loop().create_future()
+        server, ipc_args = await self._listen(ready)
 
-        logger.info(f"[Browser] 子进程已启动, PID: {self.process.pid}")
+        try:
+            try:
+                self.process = await self._spawn(sys.executable, str(controller_path), *ipc_args)
+            except NotImplementedError:
+                # Windows 的 SelectorEventLoop 不支持 asyncio 子进程，回退到 Popen，stderr 在线程池中读取
+                self.process = subprocess.Popen(
+                    [sys.executable, str(controller_path), *ipc_args],
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                    bufsize=0
+                )
+                self._stderr_reader_task = asyncio.create_task(self._read_stderr_blocking())
+        except BaseException:
+            # 子进程未能启动：关闭监听并删除套接字文件，不留下无人连接的 server
+            self._stop_listening(server, ready)
+            raise
 
-        # 启动 stderr 读取任务
-        self._stderr_reader_task = asyncio.create_task(self._read_stderr())
+        logger.info(f"[Browser] 子进程已启动, PID: {self.process.pid}")
 
-        # 等待子进程初始化
-        await asyncio.sleep(0.5)
+        await self._wait_ready(server, ready, config.browser.start_timeout)
 
-        # 获取反检测配置
-        if browser_config:
-            enable_stealth = browser_config.get("enable_stealth", config.browser.enable_stealth)
-            viewport_width = browser_config.get("viewport_width", config.browser.viewport_width)
-            viewport_height = browser_config.get("viewport_height", config.browser.viewport_height)
-            user_agent = browser_config.get("user_agent", config.browser.user_agent)
-            locale = browser_config.get("locale", config.browser.locale)
-            timezone = browser_config.get("timezone", config.browser.timezone)
-        else:
-            enable_stealth = config.browser.enable_stealth
-            viewport_width = config.browser.viewport_width
-            viewport_height = config.browser.viewport_height
-            user_agent = config.browser.user_agent
-            locale = config.browser.locale
-            timezone = config.browser.timezone
+        options = self._browser_options(config, browser_config)
+        self.stealth = options["enable_stealth"]
 
         # 发送启动命令
         start_cmd = {
@@ -125,18 +360,10 @@ class SubprocessBrowser:
             "chrome_path": chrome_path,
             "port": self.port,
             "url": url,
-            "enable_stealth": enable_stealth,
-            "viewport_width": viewport_width,
-            "viewport_height": viewport_height,
-            "user_agent": user_agent,
-            "locale": locale,
-            "timezone": timezone
+            **options
         }
         logger.info(f"[Browser] 发送启动命令...")
-        await self._send_command(start_cmd)
-
-        # 等待响应
-        response = await self._read_response()
+        response = await self._request(start_cmd)
         logger.info(f"[Browser] 启动响应: {response}")
 
         if not response.get("success"):
@@ -145,9 +372,30 @@ class SubprocessBrowser:
             # 启动失败不需要关闭browser，因为browser还没有启动
             raise Exception(f"浏览器启动失败: {error}")
 
+        self.port = response.get("port", self.port)
         logger.info(f"[Browser] 浏览器启动成功")
         return True
 
+    async def start(self, task_id: str, url: str, headless: bool = False, config=None,
+                    browser_config: dict = None) -> bool:
+        """启动独占的浏览器子进程并打开任务页面"""
+        self.task_id = task_id
+        return await self.launch(config, url, browser_config)
+
+    async def reset(self, task_id: str, url: str, config=None, browser_config: dict = None) -> bool:
+        """复用已启动的浏览器：新建干净的上下文（cookie、缓存、页面全部丢弃）并打开任务页面"""
+        self.task_id = task_id
+        options = self._browser_options(config, browser_config)
+        # 反检测模式在 Chrome 启动时确定，重置时无法切换
+        options.pop("enable_stealth")
+
+        response = await self._request({"cmd": "reset", "url": url, **options})
+        logger.info(f"[Browser] 重置响应: {response}")
+
+        if not response.get("success"):
+            raise Exception(f"浏览器重置失败: {response.get('error', 'Unknown error')}")
+        return True
+
     async def execute_action(self, action: dict) -> tuple[bool, any]:
         """执行操作"""
         cmd = {
@@ -155,35 +403,34 @@ class SubprocessBrowser:
             "action": action
         }
 
-        logger.debug(f"[Browser] 发送动作命令: {action.get('type')}")
-        await self._send_command(cmd)
+        logger.debug("[Browser] 发送动作命令: %s", action.get("type"))
+        response = await self._request(cmd)
+        logger.info("[Browser] 动作响应: %s", _loggable(response))
 
-        response = await self._read_response()
-        logger.info(f"[Browser] 动作响应: {response}")
-
-        success = response.get("success", False)
+        # 响应是刚解码的新字典，直接取出 success 字段，其余数据原样交给调用方处理不同类型的结果
+        success = response.pop("success", False)
         if success:
-            # 返回完整的响应数据（排除success字段），让调用方处理不同类型的结果
-            result_data = {k: v for k, v in response.items() if k != "success"}
-            return success, result_data
+            return success, response
         else:
             return success, response.get("error")
 
-    async def take_screenshot(self) -> Optional[bytes]:
-        """截图"""
-        cmd = {"cmd": "screenshot"}
-        await self._send_command(cmd)
-
-        response = await self._read_response()
+    async def take_screenshot(self, quality: int = 50, image_format: str = "jpeg",
+                              max_width: int = None) -> Optional[bytes]:
+        """截图（实时截图用，quality 仅对 jpeg 生效，超过 max_width 时由 Chrome 缩放）"""
+        cmd = {"cmd": "screenshot", "quality": quality, "format": image_format, "max_width": max_width}
+        response = await self._request(cmd)
         if response.get("success") and response.get("screenshot"):
-            return base64.b64decode(response["screenshot"])
+            return response["screenshot"]
         return None
 
     async def close(self):
-        """关闭浏览器"""
+        """关闭浏览器（幂等，重复调用直接返回）"""
+        if self._closed:
+            return
+        self._closed = True
         logger.info(f"[Browser] 关闭浏览器...")
 
-        # 取消 stderr 读取任务
+        # 取消 stderr 读取任务（Popen 回退方案）
         if self._stderr_reader_task and not self._stderr_reader_task.done():
             self._stderr_reader_task.cancel()
             try:
@@ -192,92 +439,316 @@ class SubprocessBrowser:
                 pass
 
         if self.process:
-            # 发送关闭命令
+            # 发送关闭命令，控制器关闭 Chrome 后才会响应
             try:
-                await self._send_command({"cmd": "close"}, timeout=2)
-                await asyncio.sleep(0.5)
+                await self._request({"cmd": "close"}, timeout=2)
             except Exception as e:
                 logger.debug(f"[Browser] 发送关闭命令失败: {e}")
 
-            # 强制终止进程
-            try:
-                self.process.stdin.close()
-                self.process.stdout.close()
-                self.process.stderr.close()
-            except Exception:
-                pass
+            self._disconnect()
 
             try:
-                self.process.terminate()
-                self.process.wait(timeout=3)
-            except subprocess.TimeoutExpired:
-                self.process.kill()
-                self.process.wait()
+                if self._returncode() is None:
+                    self.process.terminate()
+                if not await self._wait_exit(3):
+                    self.process.kill()
+                    await self._wait_exit(None)
+            except ProcessLookupError:
+                pass
             except Exception as e:
                 logger.debug(f"[Browser] 终止进程失败: {e}")
 
+            if isinstance(self.process, subprocess.Popen) and self.process.stderr:
+                self.process.stderr.close()
+
             self.process = None
             logger.info(f"[Browser] 浏览器已关闭")
 
-    async def _read_stderr(self):
-        """读取子进程的 stderr 输出"""
+    async def _wait_exit(self, timeout: Optional[float]) -> bool:
+        """等待子进程退出而不阻塞事件循环，返回是否在超时前退出"""
+        try:
+            if isinstance(self.process, subprocess.Popen):
+                await asyncio.get_running_loop().run_in_executor(io_executor(), self.process.wait, timeout)
+            else:
+                await asyncio.wait_for(self.process.wait(), timeout)
+        except (subprocess.TimeoutExpired, asyncio.TimeoutError):
+            return False
+        return True
+
+    @staticmethod
+    async def _spawn(*args) -> _ControllerProcess:
+        """通过 loop.subprocess_exec 启动子进程，stderr 由 _ControllerProcessProtocol 在事件循环回调中转发"""
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.subprocess_exec(
+            lambda: _ControllerProcessProtocol(loop), *args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        return _ControllerProcess(transport, protocol)
+
+    async def _read_stderr_blocking(self):
+        """Popen 回退方案：在线程池中逐行阻塞读取 stderr，转发到主日志"""
+        loop = asyncio.get_running_loop()
         try:
             while self.process and self.process.poll() is None:
-                try:
-                    line = await asyncio.wait_for(
-                        asyncio.get_event_loop().run_in_executor(None, self.process.stderr.readline),
-                        timeout=1.0
-                    )
-                    if line:
-                        # 将 stderr 日志输出到主日志
-                        logger.info(f"[BrowserController] {line.strip()}")
-                except asyncio.TimeoutError:
-                    continue
-                except Exception:
+                line = await loop.run_in_executor(io_executor(), self.process.stderr.readline)
+                if not line:
                     break
+                _log_controller_line(line)
         except Exception as e:
             logger.debug(f"[Browser] stderr 读取结束: {e}")
 
-    async def _send_command(self, cmd: dict, timeout: float = 10.0):
-        """发送命令到子进程"""
-        if not self.process or self.process.stdin.closed:
-            raise Exception("子进程已关闭")
+    async def _listen(self, ready: asyncio.Future):
+        """监听 IPC 地址（Unix 域套接字，Windows 下为回环 TCP），返回 server 与传给控制器的参数"""
+        loop = asyncio.get_running_loop()
 
-        line = json.dumps(cmd) + "\n"
-        self.process.stdin.write(line)
-        self.process.stdin.flush()
-        logger.debug(f"[Browser] 已发送命令: {cmd.get('cmd')}")
+        def protocol_factory():
+            return _ControllerConnection(self, ready)
 
-    async def _read_response(self, timeout: float = 30.0) -> dict:
-        """读取子进程响应"""
-        if not self.process:
-            raise Exception("子进程不存在")
+        if sys.platform == "win32":
+            server = await loop.create_server(protocol_factory, "127.0.0.1", 0)
+            return server, ["--ipc-port", str(server.sockets[0].getsockname()[1])]
 
-        line = await asyncio.wait_for(
-            asyncio.get_event_loop().run_in_executor(None, self.process.stdout.readline),
-            timeout=timeout
-        )
+        self._ipc_path = os.path.join(tempfile.gettempdir(), f"auto-tools-{uuid.uuid4().hex}.sock")
+        server = await loop.create_unix_server(protocol_factory, self._ipc_path)
+        return server, ["--socket", self._ipc_path]
+
+    async def _wait_ready(self, server, ready: asyncio.Future, timeout: float):
+        """等待控制器连接并发送 ready 帧，子进程提前退出或超时时抛出异常；只接受一个连接"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            while True:
+                try:
+                    # 定期醒来只为检查子进程是否已退出，ready 帧到达时立即返回
+                    self._transport = await asyncio.wait_for(asyncio.shield(ready), 0.5)
+                    return
+                except asyncio.TimeoutError:
+                    if self._returncode() is not None:
+                        raise Exception(f"浏览器子进程已退出, 退出码: {self._returncode()}")
+                    if loop.time() >= deadline:
+                        raise Exception("等待浏览器子进程就绪超时")
+        finally:
+            self._stop_listening(server, ready)
 
-        if not line:
-            raise Exception("子进程无响应")
+    def _stop_listening(self, server, ready: asyncio.Future):
+        """停止接受控制器连接，删除 Unix 域套接字文件"""
+        ready.cancel()
+        server.close()
+        if self._ipc_path:
+            try:
+                os.unlink(self._ipc_path)
+            except OSError:
+                pass
+
+    def _disconnect(self):
+        """关闭 IPC 连接并让所有未完成的请求失败"""
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        self._fail_pending(Exception("子进程已关闭"))
+
+    def _fail_pending(self, error: Exception):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    def _on_response(self, response: dict):
+        """按 req_id 把响应交给对应的请求"""
+        future = self._pending.pop(response.pop("req_id", None), None)
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    async def _request(self, cmd: dict, timeout: float = 30.0) -> dict:
+        """发送命令并等待对应 req_id 的响应；多个请求可同时在途"""
+        if self._transport is None or self._transport.is_closing():
+            raise Exception("子进程已关闭")
 
-        line = line.strip()
-        if not line:
-            return {}
+        self._next_req_id += 1
+        req_id = self._next_req_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[req_id] = future
 
         try:
-            return json.loads(line)
-        except json.JSONDecodeError as e:
-            logger.error(f"[Browser] 解析响应失败: {e}, 内容: {line[:200]}")
+            self._transport.write(pack_frame({**cmd, "req_id": req_id}))
+            logger.debug(f"[Browser] 已发送命令: {cmd.get('cmd')}")
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(req_id, None)
+
+
+class BrowserPool:
+    """常驻浏览器子进程池
+
+    预先启动若干浏览器子进程（Chrome 已就绪），任务到来时取出空闲实例并发送 reset 命令
+    换一个干净的上下文，省去每个任务启动 Python 解释器、导入 Playwright 和启动 Chrome 的开销。
+    实例服务满 recycle_after 个任务后关闭，并在后台补充新实例。
+    同时存活的实例数上限为 limit（不小于 size，0 表示不限制，与 task.max_concurrent 一致）：
+    常驻实例都被占用时按需启动临时实例，归还时若常驻数量已满且没有任务在等待则直接关闭；
+    达到 limit 后 acquire 等待其他任务归还。
+    """
+
+    def __init__(self, size: int, recycle_after: int, limit: int = 0):
+        self.size = size
+        self.recycle_after = recycle_after
+        self.limit: Optional[int] = max(size, limit) if limit > 0 else None
+        self._idle: Optional[asyncio.Queue] = None
+        self._in_use: set = set()
+        self._pending = 0  # 正在启动的实例数
+        self._waiting = 0  # 在 acquire 中等待归还的任务数
+        self._background: set = set()  # 后台补充实例的任务（关闭时取消）
+        self._created = 0
+        self._recycled = 0
+
+    @property
+    def idle(self) -> asyncio.Queue:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+        return self._idle
+
+    def _live_count(self) -> int:
+        # 被外部直接 close() 的实例（如取消任务）不再占用名额
+        self._in_use = {b for b in self._in_use if b.process is not None}
+        return self.idle.qsize() + len(self._in_use) + self._pending
+
+    async def _spawn(self) -> SubprocessBrowser:
+        """启动一个新的浏览器实例"""
+        browser = SubprocessBrowser()
+        self._pending += 1
+        try:
+            await browser.launch(get_config())
+        except BaseException:
+            await browser.close()
             raise
+        finally:
+            self._pending -= 1
+        self._created += 1
+        return browser
+
+    async def _spawn_idle(self):
+        """后台补充一个空闲实例"""
+        try:
+            self.idle.put_nowait(await self._spawn())
+        except Exception as e:
+            logger.warning(f"[BrowserPool] 补充浏览器实例失败: {e}")
+
+    def _below_limit(self) -> bool:
+        return self.limit is None or self._live_count() < self.limit
+
+    def _replenish(self):
+        """实例数不足时在后台补充：常驻数量不足 size，或有任务在等待且未达到 limit"""
+        if self._live_count() < self.size or (self._waiting and self._below_limit()):
+            task = asyncio.create_task(self._spawn_idle())
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def warmup(self):
+        """预热：并发启动浏览器实例直到池满"""
+        missing = self.size - self._live_count()
+        if missing <= 0:
+            return
+        logger.info(f"[BrowserPool] 预热 {missing} 个浏览器实例")
+        await asyncio.gather(*(self._spawn_idle() for _ in range(missing)))
+
+    async def acquire(self) -> SubprocessBrowser:
+        """取出一个空闲实例；未达到 limit 时直接启动新实例，否则等待其他任务归还"""
+        while True:
+            if not self.idle.empty():
+                browser = self.idle.get_nowait()
+            elif self._below_limit():
+                browser = await self._spawn()
+            else:
+                self._waiting += 1
+                try:
+                    browser = await self.idle.get()
+                finally:
+                    self._waiting -= 1
+
+            if browser.is_alive():
+                self._in_use.add(browser)
+                return browser
+            # 空闲期间子进程已退出
+            await browser.close()
+
+    async def release(self, browser: SubprocessBrowser):
+        """归还实例；已失效或达到复用上限的实例关闭并在后台替换，多出的临时实例直接关闭"""
+        self._in_use.discard(browser)
+        browser.use_count += 1
+        browser.task_id = None
+
+        if browser.is_alive() and browser.use_count < self.recycle_after:
+            if self._waiting or self._live_count() < self.size:
+                self.idle.put_nowait(browser)
+                return
+        elif browser.is_alive():
+            self._recycled += 1
+            logger.info(f"[BrowserPool] 实例已服务 {browser.use_count} 个任务，回收重启")
+        await self.discard(browser)
+
+    async def discard(self, browser: SubprocessBrowser):
+        """关闭一个实例（状态不可信或需中断进行中的操作），需要时在后台补充，唤醒等待的任务"""
+        self._in_use.discard(browser)
+        await browser.close()
+        self._replenish()
+
+    async def close(self):
+        """取消后台补充并关闭所有空闲实例（服务关闭时调用）"""
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        while not self.idle.empty():
+            await self.idle.get_nowait().close()
+
+    def stats(self) -> Dict[str, int]:
+        """池状态统计"""
+        return {
+            "size": self.size,
+            "idle": self.idle.qsize(),
+            "limit": self.limit,
+            "in_use": len(self._in_use),
+            "starting": self._pending,
+            "waiting": self._waiting,
+            "created": self._created,
+            "recycled": self._recycled,
+        }
 
 
 class ExecutionEngine:
     """任务执行引擎"""
 
     def __init__(self):
-        self.executing_tasks: Dict[str, Dict[str, Any]] = {}
+        # 执行中任务登记表：execute_task 结束时显式移除（不依赖引用计数，失败任务的异常可能形成引用环）
+        self.executing_tasks: Dict[str, TaskInfo] = {}
         self.browser_contexts: Dict[str, SubprocessBrowser] = {}
+        self._browser_pool: Optional[BrowserPool] = None
+        self._task_slots: Optional[asyncio.Semaphore] = None
+        self._task_slots_created = False
+        self._screenshot_queues: Dict[str, asyncio.Queue] = {}
+        self._screenshot_senders: Dict[str, asyncio.Task] = {}
+
+    def install_io_executor(self):
+        """把共享 I/O 线程池设为当前事件循环的默认执行器（服务启动时调用）"""
+        asyncio.get_running_loop().set_default_executor(io_executor())
+
+    @property
+    def browser_pool(self) -> BrowserPool:
+        """浏览器池（首次访问时按配置创建，同时存活的实例数可达 task.max_concurrent）"""
+        if self._browser_pool is None:
+            config = get_config()
+            self._browser_pool = BrowserPool(config.browser.pool_size, config.browser.pool_recycle_after,
+                                             config.task.max_concurrent)
+        return self._browser_pool
+
+    @property
+    def task_slots(self) -> Optional[asyncio.Semaphore]:
+        """限制同时执行任务数的信号量（首次访问时按配置创建，task.max_concurrent 为 0 时不限制）"""
+        if not self._task_slots_created:
+            max_concurrent = get_config().task.max_concurrent
+            self._task_slots = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+            self._task_slots_created = True
+        return self._task_slots
 
     async def execute_task(
         self,
@@ -290,21 +761,39 @@ class ExecutionEngine:
         headless: bool = False,
         browser_config: dict = None
     ):
-        task_info = {
-            "task_id": task_id,
-            "url": url,
-            "actions_count": len(actions),
-            "current_action": 0,
-            "status": "pending",
-            "logs": [],
-            "start_time": datetime.now(),
-            "headless": headless
-        }
+        task_info = TaskInfo(
+            task_id=task_id,
+            url=url,
+            actions_count=len(actions),
+            start_time=datetime.now(),
+            headless=headless
+        )
 
         self.executing_tasks[task_id] = task_info
         logger.info(f"[Task {task_id}] execute_task 开始, URL: {url}, 动作数: {len(actions)}")
 
+        slots = self.task_slots
+        slot_acquired = False
         try:
+            # 并发任务数达到上限时排队，避免同时启动过多浏览器
+            if slots is not None:
+                if slots.locked():
+                    task_info.status = "queued"
+                    logger.info(f"[Task {task_id}] 并发任务数已达上限，排队等待")
+                    await ws_manager.send_task_status(
+                        task_id=task_id,
+                        status="queued",
+                        progress=0,
+                        current_action="排队中",
+                        message="并发任务数已达上限，等待其他任务完成"
+                    )
+                await slots.acquire()
+                slot_acquired = True
+                # 排队期间被取消的任务不再执行
+                if task_info.status == "cancelled":
+                    return
+                task_info.status = "pending"
+
             await ws_manager.send_task_status(
                 task_id=task_id,
                 status="starting",
@@ -313,14 +802,15 @@ class ExecutionEngine:
                 message="正在准备执行环境"
             )
 
-            await self._run_actions(task_id, url, actions, headless=headless, browser_config=browser_config)
+            await self._run_actions(task_id, task_info, url, actions, headless=headless, browser_config=browser_config)
 
-            # 检查任务状态，避免覆盖失败状态
-            # _run_actions 内部可能会设置 status = "failed"
-            if task_info.get("status") != "failed":
-                task_info["status"] = "completed"
-                task_info["end_time"] = datetime.now()
-                task_info["progress"] = 100
+            # 检查任务状态，避免覆盖失败或取消状态
+            # _run_actions 内部可能会设置 status = "failed"，取消接口会设置 status = "cancelled"
+            if task_info.status not in ("failed", "cancelled"):
+                task_info.status = "completed"
+                task_info.end_time = datetime.now()
+                task_info.progress = 100
+                duration = time.monotonic() - task_info.started_monotonic
 
                 await ws_manager.send_task_status(
                     task_id=task_id,
@@ -334,24 +824,24 @@ class ExecutionEngine:
                     "task_id": task_id,
                     "status": "completed",
                     "url": url,
-                    "actions_executed": task_info["current_action"],
-                    "start_time": task_info["start_time"].isoformat(),
-                    "end_time": task_info["end_time"].isoformat(),
-                    "duration_seconds": (task_info["end_time"] - task_info["start_time"]).total_seconds()
+                    "actions_executed": task_info.current_action,
+                    "start_time": task_info.start_time.isoformat(),
+                    "end_time": task_info.end_time.isoformat(),
+                    "duration_seconds": round(duration, 3)
                 }
 
                 await ws_manager.send_task_result(task_id, result)
                 logger.info(f"Task {task_id} completed successfully")
 
         except asyncio.CancelledError:
-            task_info["status"] = "cancelled"
-            task_info["end_time"] = datetime.now()
+            task_info.status = "cancelled"
+            task_info.end_time = datetime.now()
             logger.warning(f"[Task {task_id}] 任务被取消 (CancelledError)")
 
             await ws_manager.send_task_status(
                 task_id=task_id,
                 status="cancelled",
-                progress=task_info.get("current_action", 0) * 100 // max(1, task_info.get("actions_count", 1)),
+                progress=task_info.current_action * 100 // max(1, task_info.actions_count),
                 current_action="任务已取消",
                 message="用户取消了任务执行"
             )
@@ -365,9 +855,9 @@ class ExecutionEngine:
                 error_code=ErrorCode.ERR_TASK_FAILED,
                 task_id=task_id
             )
-            task_info["status"] = "failed"
-            task_info["end_time"] = datetime.now()
-            task_info["error"] = error_detail.to_json()
+            task_info.status = "failed"
+            task_info.end_time = datetime.now()
+            task_info.error = error_detail.to_json()
 
             await ws_manager.send_task_error(
                 task_id=task_id,
@@ -384,14 +874,18 @@ class ExecutionEngine:
             except Exception as e:
                 logger.debug(f"Failed to flush logs: {e}")
 
-            await self._close_browser(task_id)
-
-            if task_id in self.executing_tasks:
+            # 屏蔽取消：清理过程中再次被取消也要关闭或归还浏览器，不泄漏 Chrome 进程
+            await asyncio.shield(self._close_browser(task_id))
+            # 只移除自己登记的记录（取消接口可能已移除，同一 task_id 也可能已被重新提交）
+            if self.executing_tasks.get(task_id) is task_info:
                 del self.executing_tasks[task_id]
+            if slot_acquired:
+                slots.release()
 
     async def _run_actions(
         self,
         task_id: str,
+        task_info: TaskInfo,
         url: str,
         actions: List[Dict[str, Any]],
         headless: bool = False,
@@ -416,11 +910,21 @@ class ExecutionEngine:
         )
 
         config = get_config()
-        browser = SubprocessBrowser()
-        self.browser_contexts[task_id] = browser
+        screenshot_settings = ScreenshotSettings.from_config(config)
+        pool = self.browser_pool
+        requested_stealth = (browser_config or {}).get("enable_stealth", config.browser.enable_stealth)
 
         try:
-            await browser.start(task_id, url, headless, config, browser_config)
+            # 反检测模式与池中实例不一致时（需重新启动 Chrome），使用独占的浏览器
+            if pool.size > 0 and requested_stealth == config.browser.enable_stealth:
+                browser = await pool.acquire()
+                browser.pooled = True
+                self.browser_contexts[task_id] = browser
+                await browser.reset(task_id, url, config, browser_config)
+            else:
+                browser = SubprocessBrowser()
+                self.browser_contexts[task_id] = browser
+                await browser.start(task_id, url, headless, config, browser_config)
             logger.info(f"[Task {task_id}] 浏览器启动成功")
 
             await ws_manager.send_task_log(
@@ -431,10 +935,18 @@ class ExecutionEngine:
             )
 
             # 发送初始截图
-            await self._send_screenshot(task_id, browser, 0)
+            await self._send_screenshot(task_id, browser, 0, screenshot_settings)
 
         except Exception as e:
+            # 启动期间被取消：取消接口已关闭浏览器，不当作启动失败上报
+            if task_info.status == "cancelled":
+                logger.info(f"[Task {task_id}] 任务在浏览器启动期间被取消")
+                return
             logger.error(f"[Task {task_id}] 启动浏览器失败: {e}")
+            # 重置失败的池实例状态不可信，关闭后由浏览器池补充
+            failed = self.browser_contexts.get(task_id)
+            if failed is not None and failed.pooled:
+                await pool.discard(failed)
             await ws_manager.send_task_log(
                 task_id=task_id,
                 level="error",
@@ -444,10 +956,16 @@ class ExecutionEngine:
             await self._simulate_browser_start(task_id, url)
             return
 
+        # 循环前一次性算出每个操作的展示名称与完成后的进度，循环内不再重复查表和计算
+        steps = []
         for index, action in enumerate(actions):
-            # 检查任务是否被取消
-            task_info = self.executing_tasks.get(task_id)
-            if task_info and task_info.get("status") == "cancelled":
+            action_type = action.get("type", "unknown")
+            action_name = _ACTION_NAMES.get(action_type) or f"未知操作({action_type})"
+            steps.append((action, action_name, (index + 1) * 100 // total_actions))
+
+        for index, (action, action_name, progress) in enumerate(steps):
+            # 检查任务是否被取消（浏览器与任务记录由 execute_task 的 finally 统一清理）
+            if task_info.status == "cancelled":
                 logger.info(f"[Task {task_id}] 任务已取消，停止执行")
                 await ws_manager.send_task_log(
                     task_id=task_id,
@@ -455,124 +973,104 @@ class ExecutionEngine:
                     message="任务已被用户取消",
                     action_name="cancelled"
                 )
-                break
-
-            action_type = action.get("type", "unknown")
-            action_name = self._get_action_name(action_type)
+                return
 
-            logger.info(f"[Task {task_id}] 执行操作 {index+1}/{total_actions}: {action_name}")
-            logger.debug(f"[Task {task_id}] 操作详情: {action}")
+            logger.info("[Task %s] 执行操作 %d/%d: %s", task_id, index + 1, total_actions, action_name)
+            logger.debug("[Task %s] 操作详情: %s", task_id, action)
 
-            if task_info:
-                task_info["current_action"] = index + 1
-                task_info["current_action_name"] = action_name
+            task_info.current_action = index + 1
+            task_info.current_action_name = action_name
 
-            progress = int(((index + 1) / total_actions) * 90)
+            # 每个操作检查一次：无人订阅时跳过逐操作的事件构造与发送（任务状态消息仍照常发送）
+            listening = ws_manager.has_listeners(task_id)
 
-            await ws_manager.send_task_progress(
-                task_id=task_id,
-                action_index=index + 1,
-                total_actions=total_actions,
-                action_name=action_name,
-                details=action
-            )
-
-            await ws_manager.send_task_log(
-                task_id=task_id,
-                level="info",
-                message=f"执行操作 [{index + 1}/{total_actions}]: {action_name}",
-                action_name=action_name
-            )
+            # 操作开始前的进度与日志合并为一帧
+            if listening:
+                await ws_manager.send_task_event_batch(task_id, [
+                    ws_manager.task_progress_event(task_id, index + 1, total_actions, action_name, action),
+                    ws_manager.task_log_event(
+                        task_id, "info", f"执行操作 [{index + 1}/{total_actions}]: {action_name}", action_name
+                    ),
+                ])
 
             action_failed = False
             action_error = None
+            # 操作结束后的日志与结果收集后一次发送，截图操作的图片单独以二进制帧发送
+            events = []
+            screenshot_bytes = None
 
             try:
                 success, result = await browser.execute_action(action)
-                logger.info(f"[Task {task_id}] 操作执行完成: success={success}, result={result}")
+                logger.info("[Task %s] 操作执行完成: success=%s, result=%s", task_id, success, _loggable(result))
 
                 if success:
-                    await ws_manager.send_task_log(
-                        task_id=task_id,
-                        level="success",
-                        message=f"操作 [{index + 1}/{total_actions}] 完成: {action_name}",
-                        action_name=action_name
-                    )
+                    events.append(ws_manager.task_log_event(
+                        task_id, "success", f"操作 [{index + 1}/{total_actions}] 完成: {action_name}", action_name
+                    ))
 
                     if result and isinstance(result, dict):
-                        # 如果是截图操作，单独处理
-                        if result.get("screenshot"):
-                            await ws_manager.send_task_screenshot(
-                                task_id=task_id,
-                                screenshot_data=result["screenshot"],
-                                action_index=index
-                            )
+                        # 如果是截图操作，单独处理（仅保存到文件时不带截图数据）
+                        if result.get("screenshot") or result.get("saved_path"):
+                            if result.get("screenshot"):
+                                screenshot_bytes = result["screenshot"]
                             if result.get("saved_path"):
-                                await ws_manager.send_task_log(
-                                    task_id=task_id,
-                                    level="info",
-                                    message=f"截图已保存到: {result['saved_path']}",
-                                    action_name=action_name
-                                )
+                                events.append(ws_manager.task_log_event(
+                                    task_id, "info", f"截图已保存到: {result['saved_path']}", action_name
+                                ))
                         else:
-                            await ws_manager.send_task_result(task_id, {
+                            events.append(ws_manager.task_result_event(task_id, {
                                 "extracted_data": result,
                                 "action_index": index
-                            })
+                            }))
                 else:
                     # 操作失败，停止执行
                     logger.warning(f"[Task {task_id}] 操作失败: {result}")
-                    await ws_manager.send_task_log(
-                        task_id=task_id,
-                        level="error",
-                        message=f"操作失败: {result}",
-                        action_name=action_name
-                    )
+                    events.append(ws_manager.task_log_event(task_id, "error", f"操作失败: {result}", action_name))
                     action_failed = True
                     action_error = result
 
             except Exception as e:
                 # 操作异常，停止执行
                 logger.error(f"[Task {task_id}] 操作执行异常: {e}", exc_info=True)
-                await ws_manager.send_task_log(
-                    task_id=task_id,
-                    level="error",
-                    message=f"操作执行异常: {str(e)}",
-                    action_name=action_name
-                )
+                events.append(ws_manager.task_log_event(task_id, "error", f"操作执行异常: {str(e)}", action_name))
                 action_failed = True
                 action_error = str(e)
 
             # 如果操作失败，停止执行整个任务
             if action_failed:
                 logger.error(f"[Task {task_id}] 任务执行失败，停止后续操作")
-                await ws_manager.send_task_log(
-                    task_id=task_id,
-                    level="error",
-                    message="任务执行中止，已停止后续操作",
-                    action_name="task_aborted"
-                )
-                await self._close_browser(task_id)
+                events.append(ws_manager.task_log_event(
+                    task_id, "error", "任务执行中止，已停止后续操作", "task_aborted"
+                ))
+
+            if listening:
+                await ws_manager.send_task_event_batch(task_id, events)
+                if screenshot_bytes:
+                    await ws_manager.send_task_screenshot_binary(task_id, screenshot_bytes, index)
+
+            if action_failed and task_info.status == "cancelled":
+                # 取消时浏览器被关闭，进行中的操作随之失败，不算作任务失败
+                logger.info(f"[Task {task_id}] 任务已取消，进行中的操作已中断")
+                return
 
+            if action_failed:
                 # 更新任务状态为失败
-                task_info["status"] = "failed"
-                task_info["end_time"] = datetime.now()
-                task_info["error"] = f"操作 {action_name} 执行失败: {action_error}"
+                task_info.status = "failed"
+                task_info.end_time = datetime.now()
+                task_info.error = f"操作 {action_name} 执行失败: {action_error}"
 
                 await ws_manager.send_task_status(
                     task_id=task_id,
                     status="failed",
-                    progress=int(((index + 1) / total_actions) * 100),
+                    progress=progress,
                     current_action="任务失败",
                     message=f"操作 {action_name} 执行失败，任务已中止"
                 )
 
-                # 清理并返回
-                if task_id in self.executing_tasks:
-                    del self.executing_tasks[task_id]
+                # 浏览器与任务记录由 execute_task 的 finally 统一清理
                 return
 
-            await self._send_screenshot(task_id, browser, index + 1)
+            await self._send_screenshot(task_id, browser, index + 1, screenshot_settings)
 
         await ws_manager.send_task_status(
             task_id=task_id,
@@ -592,11 +1090,11 @@ class ExecutionEngine:
         )
 
     async def _close_browser(self, task_id: str):
-        """关闭浏览器"""
+        """关闭浏览器（先从记录中取出，重复调用或外部已移除时不做任何事）"""
+        await self._stop_screenshot_sender(task_id)
+        browser = self.browser_contexts.pop(task_id, None)
         try:
-            if task_id in self.browser_contexts:
-                browser = self.browser_contexts[task_id]
-
+            if browser is not None:
                 await ws_manager.send_task_log(
                     task_id=task_id,
                     level="info",
@@ -604,7 +1102,10 @@ class ExecutionEngine:
                     action_name="browser_close"
                 )
 
-                await browser.close()
+                if browser.pooled:
+                    await self.browser_pool.release(browser)
+                else:
+                    await browser.close()
 
                 await ws_manager.send_task_log(
                     task_id=task_id,
@@ -615,63 +1116,92 @@ class ExecutionEngine:
 
                 logger.info(f"Browser closed for task {task_id}")
 
-                del self.browser_contexts[task_id]
-
         except Exception as e:
             logger.error(f"Error closing browser: {e}")
 
-    async def _send_screenshot(self, task_id: str, browser: SubprocessBrowser, action_index: int, force: bool = False):
-        """发送页面截图"""
-        try:
-            config = get_config()
-            perf_config = config.performance
-
-            if perf_config.disable_realtime_screenshot and not force:
-                return
+    async def _send_screenshot(self, task_id: str, browser: SubprocessBrowser, action_index: int,
+                               settings: ScreenshotSettings, force: bool = False):
+        """请求发送页面截图
 
-            if not force and action_index % perf_config.screenshot_interval != 0:
-                return
+        截图由每个任务一个的后台发送协程完成，队列只保留最新一帧：操作执行快于截图时中间帧被丢弃，
+        任务本身不等待截图往返；没有连接订阅该任务时不截图
+        """
+        if not ws_manager.has_listeners(task_id):
+            return
 
-            screenshot_bytes = await browser.take_screenshot()
+        if not force and (not settings.enabled or action_index % settings.interval != 0):
+            return
 
-            if not screenshot_bytes:
-                return
+        queue = self._screenshot_queues.get(task_id)
+        if queue is None:
+            queue = self._screenshot_queues[task_id] = asyncio.Queue(maxsize=1)
+            self._screenshot_senders[task_id] = asyncio.create_task(
+                self._screenshot_sender_loop(task_id, browser, queue, settings)
+            )
 
+        try:
+            queue.put_nowait(action_index)
+        except asyncio.QueueFull:
+            # 用最新一帧替换尚未发送的旧帧
+            queue.get_nowait()
+            queue.task_done()
+            queue.put_nowait(action_index)
+
+    async def _screenshot_sender_loop(self, task_id: str, browser: SubprocessBrowser, queue: asyncio.Queue,
+                                      settings: ScreenshotSettings):
+        """逐帧截图并推送到 WebSocket
+
+        两次截图至少间隔 settings.min_interval，等待期间到达的请求只截取最新一帧；
+        与上一帧字节完全相同的截图（页面没有变化）不再发送
+        """
+        last_image = None
+        next_capture = 0.0
+        while True:
+            action_index = await queue.get()
             try:
-                import io
-                from PIL import Image
-
-                img = Image.open(io.BytesIO(screenshot_bytes))
-                max_width = config.browser.screenshot_max_width
-
-                if img.width > max_width:
-                    ratio = max_width / img.width
-                    new_height = int(img.height * ratio)
-                    img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-
-                output = io.BytesIO()
-                img.save(output, format='JPEG', quality=config.browser.screenshot_quality, optimize=True)
-                compressed_bytes = output.getvalue()
+                wait = next_capture - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    if not queue.empty():
+                        queue.task_done()
+                        action_index = queue.get_nowait()
+                next_capture = time.monotonic() + settings.min_interval
+
+                # 子进程已按配置质量编码 JPEG 并缩放到最大宽度以内，原始字节以二进制帧直接转发
+                screenshot_bytes = await browser.take_screenshot(
+                    quality=settings.quality,
+                    max_width=settings.max_width
+                )
 
-                screenshot_base64 = base64.b64encode(compressed_bytes).decode('utf-8')
-            except ImportError:
-                screenshot_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
+                if screenshot_bytes and screenshot_bytes != last_image:
+                    last_image = screenshot_bytes
+                    await ws_manager.send_task_screenshot_binary(task_id, screenshot_bytes, action_index)
 
-            await ws_manager.send_task_screenshot(
-                task_id=task_id,
-                screenshot_data=screenshot_base64,
-                action_index=action_index
-            )
+            except Exception as e:
+                logger.debug(f"Failed to send screenshot: {e}")
+            finally:
+                queue.task_done()
+
+    async def _stop_screenshot_sender(self, task_id: str, timeout: float = 5.0):
+        """发完最后一帧后停止任务的截图发送协程"""
+        queue = self._screenshot_queues.pop(task_id, None)
+        sender = self._screenshot_senders.pop(task_id, None)
+        if sender is None:
+            return
 
-        except Exception as e:
-            logger.debug(f"Failed to send screenshot: {e}")
+        try:
+            await asyncio.wait_for(queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.debug(f"[Task {task_id}] 等待截图发送超时")
+        sender.cancel()
+        try:
+            await sender
+        except asyncio.CancelledError:
+            pass
 
     async def _simulate_browser_start(self, task_id: str, url: str):
-        """模拟浏览器启动过程"""
-        config = get_config()
-        sim_config = config.simulation
-
-        await asyncio.sleep(sim_config.browser_start_delay)
+        """模拟浏览器启动过程（只在配置了 simulation.delay 时等待一次）"""
+        delay = get_config().simulation.delay
 
         await ws_manager.send_task_log(
             task_id=task_id,
@@ -680,7 +1210,8 @@ class ExecutionEngine:
             action_name="browser_start"
         )
 
-        await asyncio.sleep(sim_config.action_delay)
+        if delay:
+            await asyncio.sleep(delay)
 
         await ws_manager.send_task_log(
             task_id=task_id,
@@ -689,36 +1220,36 @@ class ExecutionEngine:
             action_name="browser_start"
         )
 
-    def _get_action_name(self, action_type: str) -> str:
-        """获取操作名称"""
-        names = {
-            "goto": "访问页面",
-            "click": "点击元素",
-            "input": "输入内容",
-            "wait": "等待",
-            "scroll": "页面滚动",
-            "screenshot": "截图",
-            "extract": "提取数据",
-            "press": "键盘操作",
-            "hover": "悬停",
-            "upload": "上传文件",
-            "evaluate": "执行脚本",
-            "switch_frame": "切换框架",
-            "switch_tab": "切换标签页",
-            "new_tab": "打开新标签页",
-            "close_tab": "关闭标签页",
-            "drag": "拖拽元素",
-            "keyboard": "键盘操作"
-        }
-        return names.get(action_type, f"未知操作({action_type})")
+    async def cancel_task(self, task_id: str, reason: str = "cancel") -> bool:
+        """取消执行中的任务，返回是否找到该任务
 
-    def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
-        if task_id in self.executing_tasks:
-            return self.executing_tasks[task_id]
-        return None
+        先把任务标记为已取消并移出执行列表（执行循环在下一个操作前停止），再关闭其浏览器中断进行中的操作；
+        浏览器先从记录中取出，execute_task 的清理不会再次关闭它。池实例交由浏览器池关闭，
+        由池补充实例并唤醒等待 acquire 的任务
+        """
+        task_info = self.executing_tasks.pop(task_id, None)
+        if task_info is not None:
+            task_info.status = "cancelled"
+
+        browser = self.browser_contexts.pop(task_id, None)
+        if browser is not None:
+            try:
+                if browser.pooled:
+                    await self.browser_pool.discard(browser)
+                else:
+                    await browser.close()
+                logger.info(f"Browser closed for task {task_id} ({reason})")
+            except Exception as e:
+                logger.error(f"Error closing browser during {reason}: {e}")
+
+        return task_info is not None or browser is not None
+
+    def get_task_status(self, task_id: str) -> Optional[TaskInfo]:
+        return self.executing_tasks.get(task_id)
 
-    def get_all_executing_tasks(self) -> Dict[str, Dict[str, Any]]:
-        return self.executing_tasks
+    def get_all_executing_tasks(self) -> List[Tuple[str, str, int]]:
+        """执行中任务的轻量快照 (task_id, status, current_action)，不暴露可变记录；需要完整信息时用 get_task_status"""
+        return [(info.task_id, info.status, info.current_action) for info in list(self.executing_tasks.values())]
 
 
 execution_engine = ExecutionEngine()
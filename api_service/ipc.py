@@ -0,0 +1,110 @@
+"""
+浏览器控制器 IPC 协议
+主进程与 browser_controller 子进程之间使用 "4 字节大端长度前缀 + MessagePack 负载" 的二进制帧通信，
+截图等二进制数据以 msgpack bin 类型直接传输，无需 base64。
+传输通道为 Unix 域套接字（Windows 下为回环 TCP），由主进程监听、控制器连接后先发送 {"ready": true} 帧；
+请求携带 req_id，响应原样带回用于匹配
+"""
+import asyncio
+import os
+import socket
+import struct
+from typing import Any, BinaryIO, Dict, List, Optional
+
+import msgpack
+
+_HEADER = struct.Struct(">I")
+HEADER_SIZE = _HEADER.size
+
+
+def pack_frame(message: Dict[str, Any]) -> bytes:
+    """编码一帧：长度前缀 + MessagePack 负载"""
+    payload = msgpack.packb(message, use_bin_type=True)
+    return _HEADER.pack(len(payload)) + payload
+
+
+def _read_exact(stream: BinaryIO, size: int) -> Optional[bytes]:
+    """读取恰好 size 字节（无缓冲管道可能短读），流结束时返回 None"""
+    data = stream.read(size)
+    if data is None or len(data) == size:
+        return data
+
+    chunks = [data]
+    remaining = size - len(data)
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(stream: BinaryIO) -> Optional[Dict[str, Any]]:
+    """从阻塞的二进制流读取一帧，流结束时返回 None"""
+    header = _read_exact(stream, HEADER_SIZE)
+    if not header:
+        return None
+
+    (length,) = _HEADER.unpack(header)
+    payload = _read_exact(stream, length)
+    if payload is None:
+        return None
+
+    return msgpack.unpackb(payload, raw=False)
+
+
+def write_frame(stream: BinaryIO, message: Dict[str, Any]):
+    """向阻塞的二进制流写入一帧并立即刷新"""
+    stream.write(pack_frame(message))
+    stream.flush()
+
+
+def write_frame_fd(fd: int, message: Dict[str, Any]):
+    """直接通过 os.write 向文件描述符写入一帧，绕过 BufferedWriter，通常一次系统调用完成"""
+    view = memoryview(pack_frame(message))
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def send_frame(sock: socket.socket, message: Dict[str, Any]):
+    """向阻塞套接字写入一帧（sendall 处理部分写入）"""
+    sock.sendall(pack_frame(message))
+
+
+async def read_frame_async(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    """从 asyncio 流读取一帧，连接关闭时返回 None"""
+    try:
+        header = await reader.readexactly(HEADER_SIZE)
+        (length,) = _HEADER.unpack(header)
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+
+    return msgpack.unpackb(payload, raw=False)
+
+
+class FrameDecoder:
+    """增量帧解码器：喂入任意切分的字节流，返回其中已完整到达的消息（供 asyncio.Protocol 回调使用）"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        buffer = self._buffer
+        buffer += data
+
+        messages = []
+        offset = 0
+        while len(buffer) - offset >= HEADER_SIZE:
+            (length,) = _HEADER.unpack_from(buffer, offset)
+            end = offset + HEADER_SIZE + length
+            if len(buffer) < end:
+                break
+            messages.append(msgpack.unpackb(buffer[offset + HEADER_SIZE:end], raw=False))
+            offset = end
+
+        if offset:
+            del buffer[:offset]
+        return messages
@@ -19,7 +19,7 @@ from datetime import datetime
 import uuid
 import httpx
 import asyncio
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from scrapy_project.utils.scheduler import TaskPriority, TaskStatus, Task
 from scrapy_project.utils.storage import storage_manager
@@ -35,10 +35,24 @@ setup_logging(config)
 logger = logging.getLogger(__name__)
 
 
+def _event_loop_name() -> str:
+    """当前事件循环的实现（安装 uvloop 时 uvicorn 会自动选用）"""
+    return type(asyncio.get_running_loop()).__module__.split(".")[0]
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    logger.info("API服务启动")
+    logger.info(f"API服务启动, 事件循环: {_event_loop_name()}")
+    execution_engine.install_io_executor()
+    ws_manager.write_delay = config.websocket.write_delay / 1000
+    # 后台预热浏览器池，不阻塞服务启动
+    warmup_task = asyncio.create_task(execution_engine.browser_pool.warmup())
     yield
+    # 等待预热真正停止后再关闭池：启动到一半的实例被取消时会自行关闭，不会在池清空后才放入
+    warmup_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await warmup_task
+    await execution_engine.browser_pool.close()
     logger.info("API服务关闭")
 
 
@@ -323,7 +337,7 @@ async def get_task_status(task_id: str):
         return {
             "task_id": task_id,
             "status": "running",
-            "executing": task_info
+            "executing": task_info.to_dict()
         }
 
     if task_id not in tasks_db:
@@ -347,17 +361,16 @@ async def get_task_status(task_id: str):
 @app.delete("/api/tasks/{task_id}", tags=["任务管理"])
 async def delete_task(task_id: str):
     # 检查任务是否在待执行队列中
-    if task_id in tasks_db:
-        task = tasks_db[task_id]
+    task = tasks_db.pop(task_id, None)
+    if task is not None:
         task.status = TaskStatus.CANCELLED
-        del tasks_db[task_id]
         return {"message": "任务已从队列中删除"}
 
     # 检查任务是否正在执行
-    from api_service.execution_engine import execution_engine
-    if task_id in execution_engine.executing_tasks:
+    task_info = execution_engine.get_task_status(task_id)
+    if task_info is not None:
         # 标记任务为已取消，执行引擎会在下一次检查时停止
-        execution_engine.executing_tasks[task_id]["status"] = "cancelled"
+        task_info.status = "cancelled"
         return {"message": "任务正在取消中"}
 
     # 任务不存在
@@ -420,30 +433,8 @@ async def cancel_task(task_id: str):
         message="正在取消任务..."
     )
 
-    # 首先关闭浏览器（如果正在运行）
-    if task_id in execution_engine.browser_contexts:
-        try:
-            browser = execution_engine.browser_contexts[task_id]
-            # browser_contexts 存储的是 SubprocessBrowser 对象
-            if hasattr(browser, 'close'):
-                await browser.close()
-            logger.info(f"Browser closed for cancelled task: {task_id}")
-        except Exception as e:
-            logger.error(f"Error closing browser during cancel: {e}")
-
-    # 设置任务状态为已取消
-    task_info = execution_engine.get_task_status(task_id)
-
-    if task_info:
-        task_info["status"] = "cancelled"
-
-    # 从执行任务中移除（这会触发CancelledError）
-    if task_id in execution_engine.executing_tasks:
-        del execution_engine.executing_tasks[task_id]
-
-    # 从浏览器上下文中移除
-    if task_id in execution_engine.browser_contexts:
-        del execution_engine.browser_contexts[task_id]
+    # 标记为已取消并关闭浏览器（如果正在运行）
+    await execution_engine.cancel_task(task_id, "cancel")
 
     if task_id not in tasks_db:
         await ws_manager.send_task_status(
@@ -515,18 +506,8 @@ async def delete_tasks_batch(request: BatchTaskDelete):
 
     for task_id in request.task_ids:
         try:
-            if task_id in tasks_db:
-                del tasks_db[task_id]
-            if task_id in execution_engine.executing_tasks:
-                del execution_engine.executing_tasks[task_id]
-            if task_id in execution_engine.browser_contexts:
-                try:
-                    browser = execution_engine.browser_contexts[task_id]
-                    if hasattr(browser, 'close'):
-                        await browser.close()
-                    del execution_engine.browser_contexts[task_id]
-                except Exception as e:
-                    logger.error(f"Error closing browser during batch delete: {e}")
+            tasks_db.pop(task_id, None)
+            await execution_engine.cancel_task(task_id, "batch delete")
 
             deleted.append(task_id)
         except Exception as e:
@@ -569,15 +550,8 @@ async def cancel_tasks_batch(request: BatchTaskCancel):
                 message="正在批量取消任务..."
             )
 
-            # 关闭浏览器
-            if task_id in execution_engine.browser_contexts:
-                try:
-                    browser = execution_engine.browser_contexts[task_id]
-                    if hasattr(browser, 'close'):
-                        await browser.close()
-                    del execution_engine.browser_contexts[task_id]
-                except Exception as e:
-                    logger.error(f"Error closing browser during batch cancel: {e}")
+            # 标记为已取消并关闭浏览器
+            await execution_engine.cancel_task(task_id, "batch cancel")
 
             task.status = TaskStatus.CANCELLED
             await ws_manager.send_task_status(
@@ -964,9 +938,13 @@ async def get_history_statistics(
 
 @app.get("/api/executing-tasks", tags=["监控"])
 async def get_executing_tasks():
+    tasks = execution_engine.get_all_executing_tasks()
     return {
-        "count": len(execution_engine.executing_tasks),
-        "tasks": execution_engine.get_all_executing_tasks()
+        "count": len(tasks),
+        "tasks": [
+            {"task_id": task_id, "status": status, "current_action": current_action}
+            for task_id, status, current_action in tasks
+        ]
     }
 
 
@@ -1001,5 +979,7 @@ async def health_check():
         "timestamp": datetime.now(),
         "version": "1.0.0",
         "executing_tasks": len(execution_engine.executing_tasks),
-        "total_tasks": len(tasks_db)
+        "total_tasks": len(tasks_db),
+        "browser_pool": execution_engine.browser_pool.stats(),
+        "event_loop": _event_loop_name()
     }
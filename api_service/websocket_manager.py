@@ -3,16 +3,58 @@ WebSocket服务模块
 提供任务状态实时推送功能
 """
 import asyncio
-from typing import Dict, Set, Any, List
+import functools
+import struct
+from collections import deque
+from typing import Dict, Set, Any, List, Optional, Union
 from datetime import datetime
 import json
 import logging
 from enum import Enum
 
-from fastapi import WebSocket, WebSocketDisconnect
+# 直接从 starlette 导入（FastAPI 的 WebSocket 即为其再导出）：导入 fastapi 包会加载路由、
+# OpenAPI 模型等完整依赖图，执行引擎被命令行工具单独导入时无需承担这部分开销
+from starlette.websockets import WebSocket, WebSocketState
+
+try:
+    import orjson
+
+    def _json_dumps_bytes(obj: Any) -> bytes:
+        """编码为 UTF-8 JSON 字节（二进制帧头部直接使用，无需再 encode）"""
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    def _json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+except ImportError:
+    def _json_default(obj: Any) -> Any:
+        # 与 orjson 保持一致：datetime 输出为 ISO 8601 字符串
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def _json_dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, default=_json_default)
+
+    def _json_dumps_bytes(obj: Any) -> bytes:
+        """编码为 UTF-8 JSON 字节（二进制帧头部直接使用）"""
+        return _json_dumps(obj).encode('utf-8')
 
 logger = logging.getLogger(__name__)
 
+# 二进制帧格式：4 字节大端头部长度 + UTF-8 JSON 头部 + 图片原始字节
+_BINARY_HEADER = struct.Struct(">I")
+
+
+@functools.lru_cache(maxsize=256)
+def _batch_frame_prefix(task_id: str) -> str:
+    """任务 batch 帧中不随事件变化的前半部分，每个任务只编码一次"""
+    encoded_id = _json_dumps(task_id)
+    return '{"type":"batch","task_id":' + encoded_id + ',"payload":{"task_id":' + encoded_id + ',"events":'
+
+
+# 单个连接最多积压的待发送消息数，客户端过慢时丢弃最旧的消息
+_OUTBOX_LIMIT = 1000
+
 
 class WebSocketMessageType(str, Enum):
     """WebSocket消息类型"""
@@ -22,6 +64,7 @@ class WebSocketMessageType(str, Enum):
     TASK_RESULT = "task_result"
     TASK_ERROR = "task_error"
     TASK_SCREENSHOT = "task_screenshot"  # 实时截图
+    BATCH = "batch"  # 同一任务的多条事件合并为一帧
     CONNECT = "connect"
     DISCONNECT = "disconnect"
     SUBSCRIBE = "subscribe"
@@ -38,6 +81,7 @@ class WebSocketMessage:
         self.payload = payload
         self.task_id = task_id
         self.timestamp = datetime.now().isoformat()
+        self._json = None  # 序列化结果缓存，广播给多个连接时只编码一次
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -48,59 +92,175 @@ class WebSocketMessage:
         }
     
     def to_json(self) -> str:
-        return json.dumps(self.to_dict(), ensure_ascii=False)
+        if self._json is None:
+            self._json = _json_dumps(self.to_dict())
+        return self._json
+
+
+class _ConnectionOutbox:
+    """单个连接的发送队列
+
+    广播只把编码好的消息追加到 deque 并唤醒写协程，不等待网络发送；写协程一次取出积压的全部文本消息，
+    多条时合并为一个 batch 帧以一次 send_text 发出。慢客户端不会阻塞任务执行。
+    write_delay 大于 0 时，写协程被唤醒后先等待这段时间（秒）再取出消息，使同一时段产生的消息合并为一帧
+    """
+
+    __slots__ = ("websocket", "refs", "write_delay", "_queue", "_waiter", "_writer")
+
+    def __init__(self, websocket: WebSocket, write_delay: float = 0.0):
+        self.websocket = websocket
+        self.refs = 0  # 该连接在全局频道与任务订阅中的登记次数
+        self.write_delay = write_delay
+        self._queue: deque = deque(maxlen=_OUTBOX_LIMIT)
+        self._waiter: Optional[asyncio.Future] = None
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def put(self, data: Union[str, bytes]):
+        self._queue.append(data)
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def close(self):
+        self._writer.cancel()
+
+    def _take_texts(self) -> str:
+        """取出队首连续的文本消息，多条时合并为一个 batch 帧"""
+        queue = self._queue
+        texts = [queue.popleft()]
+        while queue and isinstance(queue[0], str):
+            texts.append(queue.popleft())
+        if len(texts) == 1:
+            return texts[0]
+        return '{"type":"batch","task_id":null,"payload":{"events":[' + ",".join(texts) + ']}}'
+
+    async def _write_loop(self):
+        websocket = self.websocket
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        while True:
+            if not queue:
+                self._waiter = loop.create_future()
+                await self._waiter
+                self._waiter = None
+                if self.write_delay:
+                    await asyncio.sleep(self.write_delay)
+                continue
+
+            if isinstance(queue[0], bytes):
+                data = queue.popleft()
+            else:
+                data = self._take_texts()
+
+            if websocket.client_state is not WebSocketState.CONNECTED:
+                continue
+            try:
+                if isinstance(data, bytes):
+                    await websocket.send_bytes(data)
+                else:
+                    await websocket.send_text(data)
+            except Exception as e:
+                logger.debug(f"Failed to send message (connection may be closed): {e}")
 
 
 class ConnectionManager:
     """WebSocket连接管理器"""
     
-    def __init__(self):
+    def __init__(self, write_delay: float = 0.0):
         self.active_connections: Dict[str, Set[WebSocket]] = {}
         self.global_connections: Set[WebSocket] = set()
+        self._outboxes: Dict[WebSocket, _ConnectionOutbox] = {}
+        # 发送窗口（秒）：新建连接的发送队列按此合并消息，0 表示唤醒后立即发送
+        self.write_delay = write_delay
     
     async def connect(self, websocket: WebSocket, task_id: str = None):
-        try:
-            await websocket.accept()
-        except RuntimeError as e:
-            logger.warning(f"WebSocket already connected or closed: {e}")
-            return
+        # /ws/tasks 上的订阅复用已接受的连接
+        if websocket.application_state is WebSocketState.CONNECTING:
+            try:
+                await websocket.accept()
+            except RuntimeError as e:
+                logger.warning(f"WebSocket already connected or closed: {e}")
+                return
 
         if task_id:
-            if task_id not in self.active_connections:
-                self.active_connections[task_id] = set()
-            self.active_connections[task_id].add(websocket)
+            connections = self.active_connections.setdefault(task_id, set())
             logger.info(f"Client connected to task: {task_id}")
         else:
-            self.global_connections.add(websocket)
+            connections = self.global_connections
             logger.info("Client connected to global channel")
+
+        if websocket not in connections:
+            connections.add(websocket)
+            self._retain(websocket)
     
     def disconnect(self, websocket: WebSocket, task_id: str = None):
-        if task_id and task_id in self.active_connections:
-            self.active_connections[task_id].discard(websocket)
-            if not self.active_connections[task_id]:
-                del self.active_connections[task_id]
-        else:
+        """取消任务订阅；不指定 task_id 时表示连接已关闭，移除该连接的全部登记"""
+        if task_id:
+            connections = self.active_connections.get(task_id)
+            if connections is not None and websocket in connections:
+                connections.discard(websocket)
+                if not connections:
+                    del self.active_connections[task_id]
+                self._release(websocket)
+            return
+
+        if websocket in self.global_connections:
             self.global_connections.discard(websocket)
+            self._release(websocket)
+        for subscribed_task_id, connections in list(self.active_connections.items()):
+            if websocket in connections:
+                self.disconnect(websocket, subscribed_task_id)
+
+    def _retain(self, websocket: WebSocket):
+        outbox = self._outboxes.get(websocket)
+        if outbox is None:
+            outbox = self._outboxes[websocket] = _ConnectionOutbox(websocket, self.write_delay)
+        outbox.refs += 1
+
+    def _release(self, websocket: WebSocket):
+        outbox = self._outboxes.get(websocket)
+        if outbox is None:
+            return
+        outbox.refs -= 1
+        if outbox.refs <= 0:
+            del self._outboxes[websocket]
+            outbox.close()
+
+    def _recipients(self, task_id: str = None) -> Set[WebSocket]:
+        """任务订阅者与全局连接（同一连接只出现一次）"""
+        subscribers = self.active_connections.get(task_id) if task_id else None
+        if not subscribers:
+            return self.global_connections
+        return subscribers | self.global_connections
     
+    def has_listeners(self, task_id: str = None) -> bool:
+        """是否有连接会收到该任务的消息（任务订阅者或全局连接），无人订阅时调用方可跳过构造与发送"""
+        return bool(self.global_connections) or bool(task_id and self.active_connections.get(task_id))
+
     async def send_message(self, websocket: WebSocket, message: WebSocketMessage):
+        """直接向单个连接发送消息（不经过发送队列）"""
         try:
             # 检查连接是否仍然有效
-            if websocket.client.state != 2:  # WebSocketState.CONNECTED
+            if websocket.client_state is not WebSocketState.CONNECTED:
                 return
             await websocket.send_text(message.to_json())
         except Exception as e:
             logger.debug(f"Failed to send message (connection may be closed): {e}")
     
     async def broadcast(self, message: WebSocketMessage, task_id: str = None):
-        connections = set()
-        
-        if task_id and task_id in self.active_connections:
-            connections = self.active_connections[task_id]
-        
-        connections.update(self.global_connections)
-        
-        for connection in connections:
-            await self.send_message(connection, message)
+        """把消息放入各接收连接的发送队列（只编码一次，不等待网络发送）"""
+        self._enqueue(message.to_json(), task_id)
+
+    async def broadcast_bytes(self, data: bytes, task_id: str = None):
+        """向任务订阅者和全局连接广播二进制帧"""
+        self._enqueue(data, task_id)
+
+    def _enqueue(self, data: Union[str, bytes], task_id: str = None):
+        outboxes = self._outboxes
+        for connection in self._recipients(task_id):
+            outbox = outboxes.get(connection)
+            if outbox is not None:
+                outbox.put(data)
     
     async def send_task_status(
         self,
@@ -127,6 +287,60 @@ class ConnectionManager:
             task_id
         )
     
+    @staticmethod
+    def task_progress_event(
+        task_id: str,
+        action_index: int,
+        total_actions: int,
+        action_name: str,
+        details: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
+        """构造任务进度事件（用于 send_task_event_batch）"""
+        progress = action_index * 100 // total_actions if total_actions > 0 else 0
+
+        return {
+            "type": WebSocketMessageType.TASK_PROGRESS.value,
+            "payload": {
+                "task_id": task_id,
+                "action_index": action_index,
+                "total_actions": total_actions,
+                "progress": progress,
+                "action_name": action_name,
+                "details": details or {}
+            }
+        }
+
+    @staticmethod
+    def task_log_event(
+        task_id: str,
+        level: str,
+        message: str,
+        action_name: str = None,
+        details: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
+        """构造任务日志事件（用于 send_task_event_batch）"""
+        return {
+            "type": WebSocketMessageType.TASK_LOG.value,
+            "payload": {
+                "task_id": task_id,
+                "level": level,
+                "message": message,
+                "action_name": action_name,
+                "details": details or {}
+            }
+        }
+
+    @staticmethod
+    def task_result_event(task_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """构造任务结果事件（用于 send_task_event_batch）"""
+        return {
+            "type": WebSocketMessageType.TASK_RESULT.value,
+            "payload": {
+                "task_id": task_id,
+                "result": result
+            }
+        }
+
     async def send_task_progress(
         self,
         task_id: str,
@@ -135,21 +349,12 @@ class ConnectionManager:
         action_name: str,
         details: Dict[str, Any] = None
     ):
-        progress = int((action_index / total_actions) * 100) if total_actions > 0 else 0
-        
-        payload = {
-            "task_id": task_id,
-            "action_index": action_index,
-            "total_actions": total_actions,
-            "progress": progress,
-            "action_name": action_name,
-            "details": details or {}
-        }
-        
+        event = self.task_progress_event(task_id, action_index, total_actions, action_name, details)
+
         await self.broadcast(
             WebSocketMessage(
                 type=WebSocketMessageType.TASK_PROGRESS,
-                payload=payload,
+                payload=event["payload"],
                 task_id=task_id
             ),
             task_id
@@ -163,37 +368,38 @@ class ConnectionManager:
         action_name: str = None,
         details: Dict[str, Any] = None
     ):
-        payload = {
-            "task_id": task_id,
-            "level": level,
-            "message": message,
-            "action_name": action_name,
-            "details": details or {}
-        }
-        
+        event = self.task_log_event(task_id, level, message, action_name, details)
+
         await self.broadcast(
             WebSocketMessage(
                 type=WebSocketMessageType.TASK_LOG,
-                payload=payload,
+                payload=event["payload"],
                 task_id=task_id
             ),
             task_id
         )
     
     async def send_task_result(self, task_id: str, result: Dict[str, Any]):
-        payload = {
-            "task_id": task_id,
-            "result": result
-        }
-        
         await self.broadcast(
             WebSocketMessage(
                 type=WebSocketMessageType.TASK_RESULT,
-                payload=payload,
+                payload=self.task_result_event(task_id, result)["payload"],
                 task_id=task_id
             ),
             task_id
         )
+
+    async def send_task_event_batch(self, task_id: str, events: List[Dict[str, Any]]):
+        """把同一任务的多条事件（task_progress_event 等构造的 {"type", "payload"}）合并为一帧发送"""
+        if not events:
+            return
+
+        # 与 WebSocketMessage(BATCH).to_json() 等价，task_id 部分取自按任务缓存的前缀，只编码可变的事件列表
+        frame = (
+            _batch_frame_prefix(task_id) + _json_dumps(events)
+            + '},"timestamp":"' + datetime.now().isoformat() + '"}'
+        )
+        self._enqueue(frame, task_id)
     
     async def send_task_error(self, task_id: str, error: str, details: Dict[str, Any] = None):
         payload = {
@@ -211,23 +417,23 @@ class ConnectionManager:
             task_id
         )
     
-    async def send_task_screenshot(self, task_id: str, screenshot_data: str, action_index: int = 0):
-        """发送实时截图"""
-        payload = {
+    async def send_task_screenshot_binary(
+        self,
+        task_id: str,
+        image: bytes,
+        action_index: int = 0,
+        mime: str = "image/jpeg"
+    ):
+        """以二进制帧发送实时截图，省去 base64 编码及其在 JSON 文本中的 33% 体积"""
+        header = _json_dumps_bytes({
+            "type": WebSocketMessageType.TASK_SCREENSHOT.value,
             "task_id": task_id,
-            "screenshot": screenshot_data,  # base64编码的图片数据
             "action_index": action_index,
+            "mime": mime,
             "timestamp": datetime.now().isoformat()
-        }
+        })
 
-        await self.broadcast(
-            WebSocketMessage(
-                type=WebSocketMessageType.TASK_SCREENSHOT,
-                payload=payload,
-                task_id=task_id
-            ),
-            task_id
-        )
+        await self.broadcast_bytes(_BINARY_HEADER.pack(len(header)) + header + image, task_id)
 
     def get_connection_count(self, task_id: str = None) -> int:
         if task_id and task_id in self.active_connections:
@@ -289,26 +495,25 @@ class BatchLogManager:
         }
 
         async with self._lock:
-            if task_id not in self.pending_logs:
-                self.pending_logs[task_id] = []
-
-            self.pending_logs[task_id].append(log_entry)
-            log_count = len(self.pending_logs[task_id])
+            logs = self.pending_logs.setdefault(task_id, [])
+            logs.append(log_entry)
+            flush_now = len(logs) >= self.batch_size
 
             # 如果有正在运行的任务，取消它
-            if task_id in self._tasks and not self._tasks[task_id].done():
-                self._tasks[task_id].cancel()
+            pending = self._tasks.pop(task_id, None)
+            if pending is not None and not pending.done():
+                pending.cancel()
 
-            # 创建新的刷新任务
-            if log_count >= self.batch_size:
-                # 达到批量大小，立即发送
-                await self._flush_logs(task_id)
-            else:
+            if not flush_now:
                 # 设置延迟发送任务
                 self._tasks[task_id] = asyncio.create_task(
                     self._delayed_flush(task_id)
                 )
 
+        # 达到批量大小，立即发送（_flush_logs 自己加锁，必须在释放锁之后调用）
+        if flush_now:
+            await self._flush_logs(task_id)
+
     async def _delayed_flush(self, task_id: str):
         """延迟刷新日志"""
         await asyncio.sleep(self.batch_interval / 1000.0)
@@ -344,15 +549,7 @@ class OptimizedConnectionManager(ConnectionManager):
 
     async def _batch_broadcast(self, message: WebSocketMessage, task_id: str = None):
         """批量广播消息"""
-        connections = set()
-
-        if task_id and task_id in self.active_connections:
-            connections = self.active_connections[task_id]
-
-        connections.update(self.global_connections)
-
-        for connection in connections:
-            await self.send_message(connection, message)
+        await self.broadcast(message, task_id)
 
     async def send_task_log(
         self,
@@ -362,7 +559,11 @@ class OptimizedConnectionManager(ConnectionManager):
         action_name: str = None,
         details: Dict[str, Any] = None
     ):
-        """使用批量发送日志"""
+        """使用批量发送日志（只入队不等待网络发送，调用方的操作循环不会因日志停顿）"""
+        # 无人订阅时日志不会被任何连接收到，连批量缓冲也不必进入
+        if not self.has_listeners(task_id):
+            return
+
         # 重要日志（error, warning）立即发送
         if level in ("error", "warning", "success"):
             payload = {
@@ -391,18 +592,6 @@ class OptimizedConnectionManager(ConnectionManager):
                 details=details
             )
 
-    async def broadcast(self, message: WebSocketMessage, task_id: str = None):
-        """覆盖父类的broadcast方法"""
-        connections = set()
-
-        if task_id and task_id in self.active_connections:
-            connections = self.active_connections[task_id]
-
-        connections.update(self.global_connections)
-
-        for connection in connections:
-            await self.send_message(connection, message)
-
 
 # 使用优化的连接管理器
 ws_manager = OptimizedConnectionManager()
@@ -0,0 +1,1901 @@
+"""
+API 服务内部模块测试
+"""
+import io
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _ShortReadStream(io.RawIOBase):
+    """模拟无缓冲管道：每次最多返回 3 字节"""
+
+    def __init__(self, data: bytes):
+        self._buf = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._buf.read(min(size, 3) if size >= 0 else 3)
+
+
+class TestIpcProtocol:
+    """浏览器控制器 IPC 帧协议测试"""
+
+    def test_frame_roundtrip(self):
+        from api_service.ipc import pack_frame, read_frame
+
+        message = {"success": True, "screenshot": b"\xff\xd8\xff\xe0jpeg", "saved_path": "截图.jpg"}
+        stream = io.BytesIO(pack_frame(message) + pack_frame({"cmd": "ping"}))
+
+        assert read_frame(stream) == message
+        assert read_frame(stream) == {"cmd": "ping"}
+        assert read_frame(stream) is None
+
+    def test_frame_short_reads(self):
+        from api_service.ipc import pack_frame, read_frame
+
+        message = {"cmd": "action", "action": {"type": "click", "selector": "#submit"}}
+        assert read_frame(_ShortReadStream(pack_frame(message))) == message
+
+    def test_write_frame_fd(self):
+        from api_service.ipc import read_frame, write_frame_fd
+
+        message = {"success": True, "screenshot": b"\x00" * 1024}
+        r, w = os.pipe()
+        write_frame_fd(w, message)
+        os.close(w)
+        with os.fdopen(r, "rb") as stream:
+            assert read_frame(stream) == message
+            assert read_frame(stream) is None
+
+    def test_truncated_frame(self):
+        from api_service.ipc import pack_frame, read_frame
+
+        data = pack_frame({"cmd": "ping"})
+        assert read_frame(io.BytesIO(data[:-1])) is None
+
+    def test_read_frame_async(self):
+        import asyncio
+        from api_service.ipc import pack_frame, read_frame_async
+
+        async def scenario():
+            reader = asyncio.StreamReader()
+            reader.feed_data(pack_frame({"cmd": "ping", "req_id": 1}))
+            reader.feed_data(pack_frame({"cmd": "close"})[:-1])
+            reader.feed_eof()
+            assert await read_frame_async(reader) == {"cmd": "ping", "req_id": 1}
+            assert await read_frame_async(reader) is None
+
+        asyncio.run(scenario())
+
+    def test_frame_decoder_handles_split_frames(self):
+        from api_service.ipc import FrameDecoder, pack_frame
+
+        data = pack_frame({"req_id": 1, "screenshot": b"\xff\xd8"}) + pack_frame({"req_id": 2})
+        decoder = FrameDecoder()
+        # 帧头、负载被任意切分时只返回已完整到达的消息
+        assert decoder.feed(data[:3]) == []
+        assert decoder.feed(data[3:-2]) == [{"req_id": 1, "screenshot": b"\xff\xd8"}]
+        assert decoder.feed(data[-2:]) == [{"req_id": 2}]
+        assert decoder.feed(b"") == []
+
+    def test_controller_echoes_req_id(self):
+        import socket
+        from api_service.browser_controller import BrowserController
+        from api_service.ipc import pack_frame, read_frame
+
+        parent, child = socket.socketpair()
+        controller = BrowserController()
+        controller.attach_socket(child)
+        parent.sendall(pack_frame({"cmd": "ping", "req_id": 7}) + pack_frame({"cmd": "close", "req_id": 8}))
+        controller.run()
+
+        stream = parent.makefile("rb")
+        assert read_frame(stream) == {"success": True, "running": True, "req_id": 7}
+        assert read_frame(stream) == {"success": True, "req_id": 8}
+        parent.close()
+        child.close()
+
+    def test_controller_dispatches_commands_by_table(self):
+        import socket
+        from api_service.browser_controller import BrowserController
+        from api_service.ipc import pack_frame, read_frame
+
+        parent, child = socket.socketpair()
+        controller = BrowserController()
+        controller.attach_socket(child)
+        parent.sendall(
+            pack_frame({"cmd": "reboot", "req_id": 1})
+            + pack_frame({"cmd": "action", "action": {"type": "start"}, "req_id": 2})
+            + pack_frame({"cmd": "close", "req_id": 3})
+            + pack_frame({"cmd": "ping", "req_id": 4})
+        )
+        controller.run()
+
+        # close 之后的命令不再处理
+        stream = parent.makefile("rb")
+        assert read_frame(stream) == {"success": False, "error": "Unknown cmd: reboot", "req_id": 1}
+        assert read_frame(stream) == {"success": False, "error": "Page not available", "req_id": 2}
+        assert read_frame(stream) == {"success": True, "req_id": 3}
+        assert not controller.running
+        parent.close()
+        child.close()
+
+    def test_responses_matched_by_req_id(self):
+        import asyncio
+        import socket
+        from api_service.execution_engine import SubprocessBrowser, _ControllerConnection
+        from api_service.ipc import pack_frame, read_frame
+
+        async def scenario():
+            parent, child = socket.socketpair()
+            browser = SubprocessBrowser()
+            browser._transport, _ = await asyncio.get_running_loop().create_connection(
+                lambda: _ControllerConnection(browser), sock=parent
+            )
+
+            first = asyncio.create_task(browser._request({"cmd": "ping"}))
+            second = asyncio.create_task(browser._request({"cmd": "screenshot"}))
+            await asyncio.sleep(0.05)
+
+            # 乱序响应仍交给各自的请求
+            stream = child.makefile("rb")
+            requests = [read_frame(stream), read_frame(stream)]
+            for request in reversed(requests):
+                child.sendall(pack_frame({"success": True, "cmd": request["cmd"], "req_id": request["req_id"]}))
+
+            assert (await first)["cmd"] == "ping"
+            assert (await second)["cmd"] == "screenshot"
+
+            # 连接断开时在途请求立即失败
+            pending = asyncio.create_task(browser._request({"cmd": "ping"}))
+            await asyncio.sleep(0.05)
+            stream.close()
+            child.close()
+            with pytest.raises(Exception, match="子进程无响应"):
+                await pending
+            browser._disconnect()
+
+        asyncio.run(scenario())
+
+
+    def test_controller_connects_and_signals_ready(self):
+        import asyncio
+        from pathlib import Path
+        import api_service.execution_engine as engine_module
+        from api_service.execution_engine import SubprocessBrowser
+
+        controller_path = Path(engine_module.__file__).parent / "browser_controller.py"
+
+        async def scenario():
+            browser = SubprocessBrowser()
+            ready = asyncio.get_running_loop().create_future()
+            server, ipc_args = await browser._listen(ready)
+            browser.process = await browser._spawn(sys.executable, str(controller_path), *ipc_args)
+
+            # 无需固定等待：控制器连接后发送 ready 帧即可发送命令
+            await browser._wait_ready(server, ready, 30)
+            assert (await browser._request({"cmd": "ping"})) == {"success": True, "running": True}
+            await browser.close()
+            assert browser.process is None
+
+        asyncio.run(scenario())
+
+    def test_spawn_failure_closes_ipc_listener(self, monkeypatch):
+        import asyncio
+        from api_service.config import get_config
+        from api_service.execution_engine import SubprocessBrowser
+
+        config = get_config()
+        monkeypatch.setattr(SubprocessBrowser, "_verified_chrome_paths", {config.browser.chrome_path})
+
+        async def scenario():
+            browser = SubprocessBrowser()
+            listening = []
+            listen = browser._listen
+
+            async def record_listen(ready):
+                server, ipc_args = await listen(ready)
+                listening.append(server)
+                return server, ipc_args
+
+            async def fail_spawn(*args):
+                raise PermissionError("denied")
+
+            browser._listen = record_listen
+            browser._spawn = fail_spawn
+            with pytest.raises(PermissionError):
+                await browser.launch(config)
+
+            # 启动失败时监听关闭、套接字文件删除
+            assert not listening[0].is_serving()
+            assert not browser._ipc_path or not os.path.exists(browser._ipc_path)
+
+        asyncio.run(scenario())
+
+    def test_wait_ready_fails_when_controller_exits(self):
+        import asyncio
+        from api_service.execution_engine import SubprocessBrowser
+
+        async def scenario():
+            browser = SubprocessBrowser()
+            ready = asyncio.get_running_loop().create_future()
+            server, _ = await browser._listen(ready)
+            browser.process = await browser._spawn(sys.executable, "-c", "raise SystemExit(3)")
+            with pytest.raises(Exception, match="退出码: 3"):
+                await browser._wait_ready(server, ready, 30)
+            assert not server.is_serving()
+
+        asyncio.run(scenario())
+
+    def test_stderr_forwarded_through_event_loop(self, caplog):
+        import asyncio
+        import logging
+        from api_service.execution_engine import SubprocessBrowser
+
+        async def scenario():
+            browser = SubprocessBrowser()
+            with caplog.at_level(logging.INFO, logger="api_service.execution_engine"):
+                browser.process = await browser._spawn(
+                    sys.executable, "-c", "import sys; sys.stderr.write('第一行\\nsecond\\n末尾')"
+                )
+                assert await browser._wait_exit(5)
+                await asyncio.sleep(0.05)
+            assert not browser.is_alive()
+            assert browser._stderr_reader_task is None
+
+        asyncio.run(scenario())
+        assert "[BrowserController] 第一行" in caplog.text
+        assert "[BrowserController] second" in caplog.text
+        assert "[BrowserController] 末尾" in caplog.text
+
+    def test_stderr_buffer_capped_without_newline(self, caplog):
+        import asyncio
+        import logging
+        from api_service import execution_engine as engine_module
+
+        async def scenario():
+            protocol = engine_module._ControllerProcessProtocol(asyncio.get_running_loop())
+            with caplog.at_level(logging.INFO, logger="api_service.execution_engine"):
+                # 一直不输出换行的进程：超过上限即转发并清空缓冲区
+                for _ in range(3):
+                    protocol.pipe_data_received(2, b"x" * (engine_module._STDERR_LINE_LIMIT // 2 + 1))
+                assert len(protocol._stderr_buffer) <= engine_module._STDERR_LINE_LIMIT
+                protocol.process_exited()
+                await protocol.exited
+
+        asyncio.run(scenario())
+        assert caplog.text.count("[BrowserController] xxx") == 1
+
+class TestSelectorConversion:
+    """选择器转换测试"""
+
+    @pytest.mark.parametrize("selector,selector_type,expected", [
+        ("#submit", "css", "#submit"),
+        ("#submit", "CSS", "#submit"),
+        ("//div[@id='a']", "xpath", "//div[@id='a']"),
+        ("//div[@id='a']", "XPath", "//div[@id='a']"),
+        ("submit", "id", "#submit"),
+        ("#submit", "ID", "#submit"),
+        ("btn primary", "class", "btn.primary"),
+        (".btn", "class", ".btn"),
+        (".btn", "Class", ".btn"),
+        ("btn.primary", "class", "btn.primary"),
+        ("username", "name", '[name="username"]'),
+        ("div > a", None, "div > a"),
+        ("div", "unknown", "div"),
+        ("", "id", ""),
+    ])
+    def test_browser_controller_convert_selector(self, selector, selector_type, expected):
+        from api_service.browser_controller import BrowserController
+
+        assert BrowserController.convert_selector(selector, selector_type) == expected
+
+    @pytest.mark.parametrize("selector,expected_selector,expected_xpath", [
+        ("#submit", "#submit", False),
+        ("css=div > a", "div > a", False),
+        ("xpath=//div[@id='a']", "//div[@id='a']", True),
+        ("//div[@id='a']", "//div[@id='a']", True),
+        ("text=登录", "text=登录", False),
+    ])
+    def test_dom_query_spec(self, selector, expected_selector, expected_xpath):
+        from api_service.browser_controller import _dom_query_spec
+
+        spec = _dom_query_spec(selector, "attribute", "href")
+        assert spec == {"selector": expected_selector, "xpath": expected_xpath,
+                        "type": "attribute", "attribute": "href"}
+
+
+class _FakePage:
+    """记录调用的最小 Page 替身"""
+
+    def __init__(self):
+        self.calls = []
+        self.closed = False
+
+    def on(self, event, handler):
+        pass
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+    def click(self, selector, timeout=None):
+        self.calls.append(("click", selector))
+
+    def goto(self, url, wait_until=None, timeout=None):
+        self.calls.append(("goto", url, wait_until))
+
+    def wait_for_load_state(self, state=None, timeout=None):
+        self.calls.append(("wait_for_load_state", state))
+
+    def wait_for_timeout(self, timeout):
+        self.calls.append(("wait_for_timeout", timeout))
+
+    def wait_for_selector(self, selector, state=None, timeout=None):
+        self.calls.append(("wait_for_selector", selector, state, timeout))
+
+    def screenshot(self, **options):
+        self.calls.append(("screenshot", options))
+        if options.get("path"):
+            # 与 Playwright 一致：截图完成后在客户端写入文件，写入失败时抛出 OSError
+            with open(options["path"], "wb") as f:
+                f.write(b"\xff\xd8")
+        return b"\xff\xd8"
+
+
+class _FakeContext:
+    """记录新建页面的最小 BrowserContext 替身"""
+
+    def __init__(self, pages):
+        self.pages = list(pages)
+        self.created = 0
+        self.closed = False
+
+    def new_page(self):
+        self.created += 1
+        page = _FakePage()
+        self.pages.append(page)
+        return page
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeBrowser:
+    """记录新建上下文的最小 Browser 替身"""
+
+    def __init__(self):
+        self.contexts = []
+
+    def new_context(self, **options):
+        context = _FakeContext([])
+        context.options = options
+        self.contexts.append(context)
+        return context
+
+
+class TestActionDispatch:
+    """动作分发测试"""
+
+    def _controller(self):
+        from api_service.browser_controller import BrowserController
+
+        controller = BrowserController()
+        controller.page = _FakePage()
+        return controller
+
+    def test_dispatch_to_handler(self):
+        controller = self._controller()
+
+        assert controller.execute_action({"type": "click", "selector": "submit", "selector_type": "id"}) == {"success": True}
+        assert controller.page.calls == [("click", "#submit")]
+
+    def test_goto_wait_until(self):
+        controller = self._controller()
+
+        controller.execute_action({"type": "goto", "url": "https://example.com"})
+        controller.execute_action({"type": "goto", "url": "https://example.com", "wait_until": "networkidle"})
+        assert controller.page.calls == [
+            ("goto", "https://example.com", "domcontentloaded"),
+            ("goto", "https://example.com", "networkidle"),
+        ]
+
+    def test_realtime_screenshot_options(self):
+        controller = self._controller()
+
+        assert controller.take_screenshot() == {"success": True, "screenshot": b"\xff\xd8"}
+        controller.take_screenshot(quality=30)
+        controller.take_screenshot(image_format="png")
+        assert [call[1] for call in controller.page.calls if call[0] == "screenshot"] == [
+            {"type": "jpeg", "quality": 50, "full_page": False},
+            {"type": "jpeg", "quality": 30, "full_page": False},
+            {"type": "png", "full_page": False},
+        ]
+
+    @pytest.mark.parametrize("scroll", [(0, 0), (120, 2400)])
+    def test_realtime_screenshot_via_cdp(self, scroll):
+        controller = self._controller()
+        controller.page.viewport_size = {"width": 2560, "height": 1440}
+        sent = []
+
+        class _Session:
+            def send(self, method, params=None):
+                sent.append((method, params))
+                if method == "Page.getLayoutMetrics":
+                    return {"cssVisualViewport": {"pageX": scroll[0], "pageY": scroll[1]}}
+                return {"data": "/9j/AAA="}
+
+        controller.context = _FakeContext([controller.page])
+        controller.context.new_cdp_session = lambda page: _Session()
+
+        # base64 在控制器中解码为原始字节，超过最大宽度时由 Chrome 缩放；
+        # 页面滚动后 clip 按滚动位置偏移，截取的是当前可见区域而不是文档顶部
+        assert controller.take_screenshot(quality=40, max_width=1280) == {"success": True, "screenshot": b"\xff\xd8\xff\x00\x00"}
+        assert sent == [("Page.getLayoutMetrics", None), ("Page.captureScreenshot", {
+            "format": "jpeg", "captureBeyondViewport": False, "quality": 40, "optimizeForSpeed": True,
+            "clip": {"x": scroll[0], "y": scroll[1], "width": 2560, "height": 1440, "scale": 0.5},
+        })]
+        assert not [call for call in controller.page.calls if call[0] == "screenshot"]
+
+    def test_screenshot_skips_load_wait_once_dom_ready(self):
+        controller = self._controller()
+
+        controller.take_screenshot()
+        controller.take_screenshot()
+        assert controller.page.calls.count(("wait_for_load_state", "domcontentloaded")) == 1
+
+        # 主框架导航后重新等待
+        controller._dom_ready = False
+        controller.take_screenshot()
+        assert controller.page.calls.count(("wait_for_load_state", "domcontentloaded")) == 2
+
+    def test_close_tab_closes_page(self):
+        controller = self._controller()
+        first = controller.page
+        second = _FakePage()
+        controller.context = _FakeContext([second, first])
+
+        # 还有其他标签页时真正关闭当前页面并切换过去
+        assert controller.execute_action({"type": "close_tab"}) == {"success": True}
+        assert first.closed
+        assert controller.page is second
+
+        # 最后一个标签页导航到空白页后继续使用，不新建页面
+        controller.context.pages.remove(first)
+        assert controller.execute_action({"type": "close_tab"}) == {"success": True}
+        assert controller.page is second and not second.closed
+        assert second.calls[-1] == ("goto", "about:blank", None)
+        assert controller.context.created == 0
+
+    def test_reset_browser_replaces_context(self):
+        controller = self._controller()
+        old_context = _FakeContext([controller.page])
+        controller.context = old_context
+        controller.browser = _FakeBrowser()
+
+        assert controller.reset_browser("https://example.com") == {"success": True, "stealth_mode": False}
+        assert old_context.closed
+        assert controller.context is controller.browser.contexts[0]
+        assert controller.page is controller.context.pages[0]
+        assert controller.page.calls[0] == ("goto", "https://example.com", "domcontentloaded")
+        # goto 已按 wait_until 等待，导航后不再固定等待
+        assert not any(call[0] == "wait_for_timeout" for call in controller.page.calls)
+
+    def test_reset_browser_warms_screenshot_session(self):
+        controller = self._controller()
+        controller.context = _FakeContext([controller.page])
+        controller.browser = _FakeBrowser()
+        sessions = []
+
+        class _Session:
+            def __init__(self):
+                self.sent = []
+                sessions.append(self)
+
+            def send(self, method, params):
+                self.sent.append(params)
+                return {"data": "/9j/"}
+
+        _FakeContext.new_cdp_session = lambda context, page: _Session()
+        try:
+            controller.reset_browser("https://example.com")
+            controller.page.viewport_size = {"width": 800, "height": 600}
+            controller.take_screenshot()
+        finally:
+            del _FakeContext.new_cdp_session
+
+        # 重置时预先建立会话并截取 1x1 区域，之后的实时截图复用同一会话
+        assert len(sessions) == 1
+        assert sessions[0].sent[0]["clip"]["width"] == 1
+        assert len(sessions[0].sent) == 2
+
+    def test_cdp_session_detached_on_page_switch(self):
+        controller = self._controller()
+        first = controller.page
+        second = _FakePage()
+        controller.context = _FakeContext([second, first])
+        sessions = []
+
+        class _Session:
+            def __init__(self, page):
+                self.page = page
+                self.detached = False
+                sessions.append(self)
+
+            def detach(self):
+                self.detached = True
+
+        controller.context.new_cdp_session = _Session
+
+        assert controller._cdp_session().page is first
+        assert controller._cdp_session() is sessions[0]
+
+        # 切换页面后旧会话被分离，新会话属于当前页面
+        controller.execute_action({"type": "close_tab"})
+        assert controller._cdp_session().page is second
+        assert [session.detached for session in sessions] == [True, False]
+
+    def test_reset_requires_started_browser(self):
+        assert self._controller().reset_browser("https://example.com")["success"] is False
+
+    def test_screenshot_save_failure_still_returns_image(self, tmp_path):
+        controller = self._controller()
+
+        # 保存路径是目录，写入失败：只记录警告，截图数据照常返回
+        result = controller.execute_action({"type": "screenshot", "savePath": str(tmp_path)})
+        assert result["success"] is True
+        assert result["screenshot"] == b"\xff\xd8"
+        assert "saved_path" not in result
+
+        saved = tmp_path / "shot.jpg"
+        result = controller.execute_action({"type": "screenshot", "savePath": str(saved), "returnScreenshot": False})
+        assert result == {"success": True, "saved_path": str(saved)}
+        assert saved.read_bytes() == b"\xff\xd8"
+
+    def test_wait_action_uses_configured_wait_type(self):
+        controller = self._controller()
+
+        # 管理后台配置的“等待元素”在元素满足状态时即返回，不再固定等待 timeout
+        controller.execute_action({
+            "type": "wait", "wait_type": "selector", "selector": ".loaded", "state": "attached", "timeout": 5000
+        })
+        controller.execute_action({"type": "wait", "wait_type": "timeout", "selector": ".loaded", "timeout": 300})
+        controller.execute_action({"type": "wait", "condition": "networkidle", "timeout": 800})
+
+        assert controller.page.calls[-3:] == [
+            ("wait_for_selector", ".loaded", "attached", 5000),
+            ("wait_for_timeout", 300),
+            ("wait_for_load_state", "networkidle"),
+        ]
+
+    def test_unknown_and_incomplete_actions(self):
+        controller = self._controller()
+
+        assert controller.execute_action({"type": "drag"}) == {"success": False, "error": "Unknown action type: drag"}
+        assert controller.execute_action({"type": "input"})["error"] == "Unknown action type: input"
+        assert controller.execute_action({"type": "start"}) == {"success": True}
+
+
+class TestConfigLoader:
+    """配置加载测试"""
+
+    @pytest.fixture(autouse=True)
+    def _isolate_env_cache(self):
+        from api_service.config import clear_env_cache
+
+        clear_env_cache()
+        yield
+        clear_env_cache()
+
+    def test_load_yaml(self, tmp_path):
+        from api_service.config import ConfigLoader
+
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text(
+            "browser:\n  chrome_path: 'D:\\浏览器\\chrome.exe'\n  screenshot_quality: 60\n"
+            "api:\n  port: 9000\n",
+            encoding="utf-8"
+        )
+
+        config = ConfigLoader(str(config_file)).load()
+        assert config.browser.chrome_path == "D:\\浏览器\\chrome.exe"
+        assert config.browser.screenshot_quality == 60
+        assert config.browser.viewport_width == 1920
+        assert config.api.port == 9000
+
+    def test_env_override_cached_until_reload(self, tmp_path, monkeypatch):
+        from api_service.config import ConfigLoader
+
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("api:\n  port: 9000\nsimulation:\n  enabled: true\n", encoding="utf-8")
+        monkeypatch.setenv("API_PORT", "9100")
+        monkeypatch.setenv("SIMULATION_ENABLED", "no")
+
+        loader = ConfigLoader(str(config_file))
+        config = loader.load()
+        assert config.api.port == 9100
+        assert config.simulation.enabled is False
+
+        # 环境变量读取结果被缓存，reload 时才重新读取
+        monkeypatch.setenv("API_PORT", "invalid")
+        assert loader._get_env_int("API_PORT", 1) == 9100
+        assert loader.reload().api.port == 9000
+
+    def test_simulation_delay_defaults_to_zero(self, tmp_path, monkeypatch):
+        from api_service.config import ConfigLoader, clear_env_cache
+
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("simulation:\n  enabled: true\n", encoding="utf-8")
+        assert ConfigLoader(str(config_file)).load().simulation.delay == 0
+
+        monkeypatch.setenv("SIMULATION_DELAY", "0.25")
+        clear_env_cache()
+        assert ConfigLoader(str(config_file)).load().simulation.delay == 0.25
+        clear_env_cache()
+
+    def test_io_thread_pool_size_env(self, tmp_path, monkeypatch):
+        from api_service.config import ConfigLoader, clear_env_cache
+
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("performance:\n  screenshot_interval: 2\n", encoding="utf-8")
+        assert ConfigLoader(str(config_file)).load().performance.io_thread_pool_size == 64
+
+        monkeypatch.setenv("AUTO_TOOLS_THREAD_POOL_SIZE", "128")
+        clear_env_cache()
+        assert ConfigLoader(str(config_file)).load().performance.io_thread_pool_size == 128
+
+    def test_get_config_singleton(self, tmp_path, monkeypatch):
+        from api_service import config as config_module
+
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("api:\n  port: 9000\n", encoding="utf-8")
+        monkeypatch.setattr(config_module, "_config", None)
+
+        config = config_module.get_config(str(config_file))
+        assert config.api.port == 9000
+        assert config_module.get_config() is config
+
+        config_file.write_text("api:\n  port: 10001\n", encoding="utf-8")
+        assert config_module.reload_config(str(config_file)).api.port == 10001
+        config_module._loader_for.cache_clear()
+
+    def test_reload_skips_unchanged_file(self, tmp_path, monkeypatch):
+        from api_service.config import ConfigLoader
+
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("api:\n  port: 9000\n", encoding="utf-8")
+        loader = ConfigLoader(str(config_file))
+        config = loader.load()
+
+        assert loader.reload() is config
+
+        # 环境变量变化同样触发重新解析
+        monkeypatch.setenv("API_PORT", "9200")
+        assert loader.reload().api.port == 9200
+
+        monkeypatch.delenv("API_PORT")
+        config_file.write_text("api:\n  port: 90010\n", encoding="utf-8")
+        assert loader.reload().api.port == 90010
+
+    def test_setup_logging_idempotent(self, tmp_path):
+        import logging
+        from api_service.config import Config, LoggingConfig, setup_logging
+
+        config = Config(logging=LoggingConfig(file_path=str(tmp_path / "logs" / "app.log")))
+        root_logger = logging.getLogger()
+        original_level = root_logger.level
+        try:
+            setup_logging(config)
+            setup_logging(config)
+            installed = [h for h in root_logger.handlers if getattr(h, "_installed_by_app", False)]
+            assert len(installed) == 2
+
+            # 文件处理器在第一条记录写出时才创建日志文件
+            log_file = tmp_path / "logs" / "app.log"
+            assert not log_file.exists()
+            logging.getLogger("test_setup_logging").warning("首条日志")
+            assert "首条日志" in log_file.read_text(encoding="utf-8")
+        finally:
+            for handler in root_logger.handlers[:]:
+                if getattr(handler, "_installed_by_app", False):
+                    root_logger.removeHandler(handler)
+                    handler.close()
+            root_logger.setLevel(original_level)
+
+    def test_log_formatter_renders_frames(self):
+        import logging
+        import traceback
+        from api_service.config import _LOG_FORMATTER
+
+        def fail():
+            raise ValueError("bad")
+
+        try:
+            fail()
+        except ValueError as e:
+            frames = traceback.extract_tb(e.__traceback__, limit=-5)
+
+        record = logging.LogRecord("test", logging.ERROR, __file__, 1, "出错了", None, None)
+        record.frames = frames
+        text = _LOG_FORMATTER.format(record)
+        assert "出错了\nTraceback (most recent call last):" in text
+        assert "in fail" in text
+
+    @pytest.mark.parametrize("value,expected", [
+        ("true", True), (" On ", True), ("1", True), ("Y", True),
+        ("false", False), ("0", False), ("", False),
+    ])
+    def test_env_bool_values(self, monkeypatch, value, expected):
+        from api_service.config import ConfigLoader
+
+        monkeypatch.setenv("BROWSER_HEADLESS", value)
+        assert ConfigLoader()._get_env_bool("BROWSER_HEADLESS", None) is expected
+
+    def test_missing_file_uses_defaults(self, tmp_path):
+        from api_service.config import ConfigLoader
+
+        config = ConfigLoader(str(tmp_path / "missing.yaml")).load()
+        assert config.api.port == 8000
+
+
+class TestErrors:
+    """错误处理测试"""
+
+    def test_error_detail_timestamp(self):
+        from datetime import datetime
+        from api_service.errors import ErrorDetail, create_error_response
+
+        detail = ErrorDetail(code="ERR_SYS_999", message="未知错误")
+        assert isinstance(detail.timestamp, int)
+
+        iso = detail.to_dict()["timestamp"]
+        assert abs(datetime.fromisoformat(iso).timestamp() - detail.timestamp / 1e9) < 0.002
+        assert create_error_response(detail)["timestamp"] == iso
+
+    def test_error_detail_to_json(self):
+        import json
+        from api_service.errors import ErrorCode, ErrorDetail
+
+        detail = ErrorDetail(code=ErrorCode.ERR_ELEM_NOT_FOUND, message="元素未找到",
+                             details={"selector": "#登录"}, task_id="t1")
+        data = json.loads(detail.to_json())
+        assert data == detail.to_dict() | {"error_code": "ERR_ELEM_001"}
+        assert "元素未找到" in detail.to_json()
+        assert detail.to_json() is detail.to_json()
+
+    def test_error_message_templates(self):
+        import json
+        from api_service.errors import EMPTY_DETAILS, ErrorCode, ErrorMessages
+
+        detail = ErrorMessages.page_load_timeout("https://example.com", 30000)
+        assert detail.code == ErrorCode.ERR_PAGE_LOAD_TIMEOUT
+        assert detail.reason == "页面 https://example.com 在 30000ms 内未加载完成"
+        assert detail.details == {"url": "https://example.com", "timeout": 30000}
+        assert ErrorMessages.browser_start_failed().reason == "未知原因"
+        # 没有详细信息的错误共享同一个只读空映射，序列化时输出空对象
+        empty = ErrorMessages.task_not_found("t1")
+        assert empty.details is EMPTY_DETAILS
+        assert json.loads(empty.to_json())["details"] == {}
+
+    def test_handle_exception_mapping(self):
+        from api_service.errors import ErrorCode, ErrorHandler
+
+        detail = ErrorHandler.handle_exception(FileNotFoundError("chrome.exe"), task_id="t1")
+        assert detail.code == ErrorCode.ERR_BRWSR_NOT_FOUND.value
+        assert detail.message == "Chrome浏览器未找到"
+        assert detail.suggestion == "请在config.yaml中配置正确的Chrome路径"
+        assert detail.task_id == "t1"
+
+        # 未映射的异常使用默认错误码和通用建议
+        detail = ErrorHandler.handle_exception(KeyError("x"), ErrorCode.ERR_ACT_FAILED)
+        assert detail.code == ErrorCode.ERR_ACT_FAILED.value
+        assert detail.suggestion == "请检查输入参数和网络连接"
+
+    def test_create_task_error_code_value(self):
+        from datetime import datetime
+        from api_service.errors import ErrorCode, ErrorHandler
+
+        error = ErrorHandler.create_task_error("t1", ErrorCode.ERR_TASK_NOT_FOUND, "任务不存在")
+        assert error["error_code"] == "ERR_TASK_001"
+        assert abs(datetime.fromisoformat(error["timestamp"]) - datetime.now()).total_seconds() < 1
+        assert type(error["error_code"]) is str
+        assert ErrorHandler.create_task_error("t1", "ERR_CUSTOM", "自定义")["error_code"] == "ERR_CUSTOM"
+
+    def test_error_detail_does_not_retain_exception_frames(self, monkeypatch):
+        import gc
+        import weakref
+        from api_service import errors
+        from api_service.errors import ErrorHandler
+
+        # pytest 会保留日志记录（其参数引用异常），此处关闭错误日志只观察 ErrorDetail 本身
+        monkeypatch.setattr(errors.logger, "disabled", True)
+
+        class _Local:
+            pass
+
+        def fail():
+            local = _Local()
+            fail.local = weakref.ref(local)
+            raise TimeoutError("等待超时")
+
+        # 关闭 gc：错误详情不持有异常（及其堆栈帧），帧内局部变量按引用计数立即释放
+        gc.disable()
+        try:
+            try:
+                fail()
+            except TimeoutError as e:
+                detail = ErrorHandler.handle_exception(e)
+            assert fail.local() is None
+        finally:
+            gc.enable()
+        assert detail.reason == "等待超时"
+
+    def test_handle_exception_logs_bounded_frames(self, caplog):
+        from api_service.errors import ErrorHandler, LOG_TRACEBACK_FRAMES
+
+        def recurse(depth):
+            if depth == 0:
+                raise ValueError("深层错误")
+            recurse(depth - 1)
+
+        try:
+            recurse(20)
+        except ValueError as e:
+            with caplog.at_level("ERROR", logger="api_service.errors"):
+                ErrorHandler.handle_exception(e)
+
+        record = caplog.records[-1]
+        assert record.exc_info is None
+        assert len(record.frames) == LOG_TRACEBACK_FRAMES
+        assert record.frames[-1].name == "recurse"
+        assert "ValueError: 深层错误" in record.getMessage()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
+
+
+class _PooledBrowser:
+    """浏览器池测试用的 SubprocessBrowser 替身"""
+
+    def __init__(self):
+        self.process = object()
+        self.task_id = None
+        self.use_count = 0
+        self.closed = False
+
+    def is_alive(self):
+        return self.process is not None
+
+    async def close(self):
+        self.closed = True
+        self.process = None
+
+
+class TestBrowserPool:
+    """浏览器池测试"""
+
+    def _pool(self, size=1, recycle_after=100, limit=0):
+        from api_service.execution_engine import BrowserPool
+
+        pool = BrowserPool(size, recycle_after, limit)
+        pool.spawned = []
+
+        async def spawn():
+            browser = _PooledBrowser()
+            pool.spawned.append(browser)
+            return browser
+
+        pool._spawn = spawn
+        return pool
+
+    def test_reuses_released_browser(self):
+        import asyncio
+
+        async def scenario():
+            pool = self._pool()
+            await pool.warmup()
+            first = await pool.acquire()
+            assert pool.stats()["in_use"] == 1
+            await pool.release(first)
+            assert await pool.acquire() is first
+            assert first.use_count == 1
+            assert len(pool.spawned) == 1
+
+        asyncio.run(scenario())
+
+    def test_recycles_after_limit(self):
+        import asyncio
+
+        async def scenario():
+            pool = self._pool(recycle_after=2)
+            browser = await pool.acquire()
+            await pool.release(browser)
+            await pool.release(await pool.acquire())
+            await asyncio.sleep(0)
+
+            assert browser.closed
+            assert pool.stats()["recycled"] == 1
+            assert await pool.acquire() is pool.spawned[1]
+
+        asyncio.run(scenario())
+
+    def test_externally_closed_browser_frees_slot(self):
+        import asyncio
+
+        async def scenario():
+            pool = self._pool()
+            browser = await pool.acquire()
+            # 取消任务时接口直接关闭了浏览器
+            await browser.close()
+            assert await pool.acquire() is pool.spawned[1]
+
+        asyncio.run(scenario())
+
+    def test_temporary_browsers_up_to_limit(self):
+        import asyncio
+
+        async def scenario():
+            pool = self._pool(size=1, limit=2)
+            first = await pool.acquire()
+            # 常驻实例被占用时按需启动临时实例，而不是让任务等待
+            second = await pool.acquire()
+            assert second is pool.spawned[1]
+
+            # 达到上限后等待归还，归还的实例直接交给等待者
+            waiter = asyncio.create_task(pool.acquire())
+            await asyncio.sleep(0)
+            assert pool.stats()["waiting"] == 1
+            await pool.release(second)
+            assert await waiter is second and not second.closed
+
+            # 没有等待者且常驻数量已满时，多出的实例归还即关闭
+            await pool.release(second)
+            assert second.closed
+            await pool.release(first)
+            assert pool.stats()["idle"] == 1 and not first.closed
+
+        asyncio.run(scenario())
+
+    def test_unlimited_concurrency_never_blocks(self, monkeypatch):
+        import asyncio
+        from types import SimpleNamespace
+        from api_service import execution_engine as engine_module
+
+        config = SimpleNamespace(
+            browser=SimpleNamespace(pool_size=1, pool_recycle_after=100),
+            task=SimpleNamespace(max_concurrent=0),
+        )
+        monkeypatch.setattr(engine_module, "get_config", lambda: config)
+        pool = engine_module.ExecutionEngine().browser_pool
+
+        async def spawn():
+            return _PooledBrowser()
+
+        pool._spawn = spawn
+
+        async def scenario():
+            # task.max_concurrent 为 0 表示不限制：超出常驻数量的任务各自得到临时实例，不会阻塞
+            browsers = await asyncio.wait_for(asyncio.gather(*(pool.acquire() for _ in range(3))), timeout=1)
+            assert len(set(browsers)) == 3
+            assert pool.stats()["limit"] is None
+
+        asyncio.run(scenario())
+
+    def test_close_cancels_background_spawns(self):
+        import asyncio
+
+        async def scenario():
+            pool = self._pool()
+            started = asyncio.Event()
+
+            async def slow_spawn():
+                started.set()
+                await asyncio.sleep(3600)
+
+            browser = await pool.acquire()
+            pool._spawn = slow_spawn
+            await pool.discard(browser)
+            await started.wait()
+
+            # 关闭时等待后台补充被取消，不会在池清空后再放入实例
+            await pool.close()
+            assert not pool._background
+            assert pool.stats()["idle"] == 0
+
+        asyncio.run(scenario())
+
+
+class TestScreenshotCoalescing:
+    """实时截图合并测试"""
+
+    def test_keeps_only_latest_pending_frame(self, monkeypatch):
+        import asyncio
+        from api_service import execution_engine as engine_module
+
+        sent = []
+
+        async def fake_send(task_id, image, action_index):
+            sent.append(action_index)
+
+        monkeypatch.setattr(engine_module.ws_manager, "send_task_screenshot_binary", fake_send)
+        monkeypatch.setattr(engine_module.ws_manager, "has_listeners", lambda task_id=None: True)
+
+        class _SlowBrowser:
+            async def take_screenshot(self, quality=50, image_format="jpeg", max_width=None):
+                await asyncio.sleep(0.01)
+                return b"\xff\xd8"
+
+        settings = engine_module.ScreenshotSettings(enabled=True, interval=1, quality=50, max_width=1280)
+
+        async def scenario():
+            engine = engine_module.ExecutionEngine()
+            browser = _SlowBrowser()
+            for index in range(5):
+                await engine._send_screenshot("t1", browser, index, settings, force=True)
+            await engine._stop_screenshot_sender("t1")
+            assert engine._screenshot_senders == {}
+
+        asyncio.run(scenario())
+        # 发送协程来不及处理的突发帧只保留最后一帧
+        assert sent == [4]
+
+
+    def test_throttles_and_skips_unchanged_frames(self, monkeypatch):
+        import asyncio
+        from api_service import execution_engine as engine_module
+
+        sent = []
+
+        async def fake_send(task_id, image, action_index):
+            sent.append((action_index, image))
+
+        monkeypatch.setattr(engine_module.ws_manager, "send_task_screenshot_binary", fake_send)
+        monkeypatch.setattr(engine_module.ws_manager, "has_listeners", lambda task_id=None: True)
+
+        images = [b"A", b"A", b"B"]
+        captured = []
+
+        class _Browser:
+            async def take_screenshot(self, quality=50, image_format="jpeg", max_width=None):
+                captured.append(len(captured))
+                return images[len(captured) - 1]
+
+        settings = engine_module.ScreenshotSettings(
+            enabled=True, interval=1, quality=50, max_width=1280, min_interval=0.05
+        )
+
+        async def scenario():
+            engine = engine_module.ExecutionEngine()
+            browser = _Browser()
+            await engine._send_screenshot("t1", browser, 0, settings)
+            await asyncio.sleep(0.01)
+            # 间隔内的请求等到下一个时间点，只截取最新一帧
+            await engine._send_screenshot("t1", browser, 1, settings)
+            await asyncio.sleep(0)
+            await engine._send_screenshot("t1", browser, 2, settings)
+            await asyncio.sleep(0.08)
+            await engine._send_screenshot("t1", browser, 3, settings)
+            await engine._stop_screenshot_sender("t1")
+
+        asyncio.run(scenario())
+        # 第二次截图与上一帧相同，不发送
+        assert len(captured) == 3
+        assert sent == [(0, b"A"), (3, b"B")]
+
+    def test_skips_capture_without_listeners(self):
+        import asyncio
+        from api_service import execution_engine as engine_module
+
+        class _Browser:
+            async def take_screenshot(self, **options):
+                raise AssertionError("无人订阅时不应截图")
+
+        async def scenario():
+            engine = engine_module.ExecutionEngine()
+            settings = engine_module.ScreenshotSettings(enabled=True, interval=1, quality=50, max_width=1280)
+            await engine._send_screenshot("t-unwatched", _Browser(), 0, settings, force=True)
+            assert engine._screenshot_senders == {}
+
+        assert not engine_module.ws_manager.has_listeners("t-unwatched")
+        asyncio.run(scenario())
+
+
+    def test_settings_snapshot_gates_frames(self, monkeypatch):
+        import asyncio
+        from api_service import execution_engine as engine_module
+        from api_service.config import Config
+
+        config = Config()
+        config.performance.screenshot_interval = 2
+        config.browser.screenshot_quality = 30
+        settings = engine_module.ScreenshotSettings.from_config(config)
+        assert settings == engine_module.ScreenshotSettings(
+            enabled=True, interval=2, quality=30, max_width=1920, min_interval=0.2
+        )
+
+        captured = []
+
+        class _Browser:
+            async def take_screenshot(self, quality=50, image_format="jpeg", max_width=None):
+                captured.append((quality, max_width))
+                return None
+
+        monkeypatch.setattr(engine_module.ws_manager, "has_listeners", lambda task_id=None: True)
+
+        async def scenario():
+            engine = engine_module.ExecutionEngine()
+            # 只有间隔整数倍的操作截图，截图参数来自快照
+            await engine._send_screenshot("t1", _Browser(), 1, settings)
+            assert "t1" not in engine._screenshot_senders
+            await engine._send_screenshot("t1", _Browser(), 2, settings)
+            await engine._stop_screenshot_sender("t1")
+
+        asyncio.run(scenario())
+        assert captured == [(30, 1920)]
+
+
+class TestActionResponse:
+    """动作响应处理测试"""
+
+    def test_screenshot_bytes_summarized_in_logs(self, caplog):
+        import asyncio
+        import logging
+        from api_service.execution_engine import SubprocessBrowser
+
+        image = b"\xff\xd8" + b"\x00" * 4096
+
+        async def fake_request(cmd, timeout=30.0):
+            return {"success": True, "screenshot": image}
+
+        browser = SubprocessBrowser()
+        browser._request = fake_request
+        with caplog.at_level(logging.INFO, logger="api_service.execution_engine"):
+            success, result = asyncio.run(browser.execute_action({"type": "screenshot"}))
+
+        assert success is True
+        assert result == {"screenshot": image}
+        assert "<4098 bytes>" in caplog.text
+        assert "\\x00\\x00" not in caplog.text
+
+    def test_failed_action_returns_error(self):
+        import asyncio
+        from api_service.execution_engine import SubprocessBrowser
+
+        async def fake_request(cmd, timeout=30.0):
+            return {"success": False, "error": "元素不存在"}
+
+        browser = SubprocessBrowser()
+        browser._request = fake_request
+        assert asyncio.run(browser.execute_action({"type": "click"})) == (False, "元素不存在")
+
+
+class TestDebugPorts:
+    """Chrome 调试端口分配测试"""
+
+    def test_ports_rotate_within_configured_range(self, monkeypatch):
+        from api_service.config import Config
+        from api_service.execution_engine import SubprocessBrowser
+
+        config = Config()
+        config.browser.debug_port_min = 9400
+        config.browser.debug_port_max = 9402
+        monkeypatch.setattr(SubprocessBrowser, "_debug_ports", None)
+
+        assert [SubprocessBrowser._next_debug_port(config) for _ in range(4)] == [9400, 9401, 9402, 9400]
+
+    def test_claim_port_falls_back_when_taken(self):
+        import socket
+        from api_service.browser_controller import _claim_port
+
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as busy:
+            busy.bind(("127.0.0.1", 0))
+            busy.listen(1)
+            taken = busy.getsockname()[1]
+            port = _claim_port(taken)
+
+        assert port != taken
+        assert port > 0
+
+    def test_chrome_path_checked_until_found(self, tmp_path, monkeypatch):
+        import asyncio
+        from api_service.config import Config
+        from api_service.execution_engine import SubprocessBrowser
+
+        monkeypatch.setattr(SubprocessBrowser, "_verified_chrome_paths", set())
+        stats = []
+        real_exists = os.path.exists
+        monkeypatch.setattr(os.path, "exists", lambda path: stats.append(path) or real_exists(path))
+
+        async def stop_after_check(self, ready):
+            raise RuntimeError("stop")
+
+        monkeypatch.setattr(SubprocessBrowser, "_listen", stop_after_check)
+
+        config = Config()
+        config.browser.chrome_path = str(tmp_path / "chrome")
+
+        # 不存在的路径不缓存，放入 Chrome 后无需重启即可使用
+        with pytest.raises(FileNotFoundError):
+            asyncio.run(SubprocessBrowser().launch(config))
+        (tmp_path / "chrome").write_bytes(b"")
+        for _ in range(2):
+            with pytest.raises(RuntimeError, match="stop"):
+                asyncio.run(SubprocessBrowser().launch(config))
+
+        assert stats.count(config.browser.chrome_path) == 2
+
+    def test_chrome_spawned_without_shell_or_pipes(self, monkeypatch):
+        import subprocess
+        from api_service import browser_controller
+        from api_service.browser_controller import BrowserController
+
+        spawned = []
+
+        class _ExitedProcess:
+            pid = 1
+            returncode = 1
+
+            def poll(self):
+                return 1
+
+        def fake_popen(args, **kwargs):
+            spawned.append((args, kwargs))
+            return _ExitedProcess()
+
+        monkeypatch.setattr(browser_controller.subprocess, "Popen", fake_popen)
+
+        controller = BrowserController()
+        result = controller._start_browser_normal("chrome", 0)
+
+        # Chrome 立即退出时启动失败，不会等满探测超时
+        assert result["success"] is False
+        args, kwargs = spawned[0]
+        assert args[0] == "chrome"
+        # 独立的用户数据目录，关闭控制器时删除
+        profile_dir = controller.user_data_dir
+        assert f"--user-data-dir={profile_dir}" in args
+        assert os.path.isdir(profile_dir)
+        controller.process = None
+        controller.close()
+        assert not os.path.exists(profile_dir)
+        assert kwargs["shell"] is False
+        assert kwargs["stdout"] is kwargs["stderr"] is subprocess.DEVNULL
+        # 只有 Windows 才传入 CREATE_NO_WINDOW，其他平台 Popen 会拒绝非零 creationflags
+        assert kwargs["creationflags"] == getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+
+class TestEventBatch:
+    """WebSocket 事件合并发送测试"""
+
+    def test_batch_sent_as_single_message(self, monkeypatch):
+        import asyncio
+        import json
+        from api_service.websocket_manager import ws_manager
+
+        sent = []
+
+        def fake_enqueue(data, task_id=None):
+            sent.append(json.loads(data))
+
+        monkeypatch.setattr(ws_manager, "_enqueue", fake_enqueue)
+
+        asyncio.run(ws_manager.send_task_event_batch("t1", [
+            ws_manager.task_progress_event("t1", 1, 4, "点击元素", {"type": "click"}),
+            ws_manager.task_log_event("t1", "success", "完成", "点击元素"),
+            ws_manager.task_result_event("t1", {"extracted_data": {"title": "x"}}),
+        ]))
+        asyncio.run(ws_manager.send_task_event_batch("t1", []))
+
+        assert len(sent) == 1
+        message = sent[0]
+        assert message["type"] == "batch"
+        assert message["task_id"] == "t1"
+        assert [event["type"] for event in message["payload"]["events"]] == ["task_progress", "task_log", "task_result"]
+        assert message["payload"]["events"][0]["payload"]["progress"] == 25
+
+    def test_batch_frame_matches_message_encoding(self, monkeypatch):
+        import asyncio
+        import json
+        from api_service.websocket_manager import WebSocketMessage, WebSocketMessageType, ws_manager
+
+        sent = []
+        monkeypatch.setattr(ws_manager, "_enqueue", lambda data, task_id=None: sent.append(data))
+
+        task_id = 'task "引号"'
+        events = [ws_manager.task_log_event(task_id, "info", "开始", "goto")]
+        asyncio.run(ws_manager.send_task_event_batch(task_id, events))
+        asyncio.run(ws_manager.send_task_event_batch(task_id, events))
+
+        expected = WebSocketMessage(
+            WebSocketMessageType.BATCH, {"task_id": task_id, "events": events}, task_id
+        ).to_dict()
+        del expected["timestamp"]
+        # 第二帧复用缓存的前缀，两帧的结构都与 WebSocketMessage 编码一致
+        for frame in sent:
+            message = json.loads(frame)
+            assert message.pop("timestamp")
+            assert message == expected
+
+    def test_progress_uses_integer_arithmetic(self):
+        from api_service.websocket_manager import ws_manager
+
+        # 29 / 100 * 100 的浮点结果为 28.999...，整数运算得到准确的百分比
+        assert ws_manager.task_progress_event("t1", 29, 100, "点击元素")["payload"]["progress"] == 29
+        assert ws_manager.task_progress_event("t1", 1, 0, "点击元素")["payload"]["progress"] == 0
+
+    def test_screenshot_binary_frame(self, monkeypatch):
+        import asyncio
+        import json
+        import struct
+        from api_service.websocket_manager import ws_manager
+
+        frames = []
+
+        async def fake_broadcast_bytes(data, task_id=None):
+            frames.append(data)
+
+        monkeypatch.setattr(ws_manager, "broadcast_bytes", fake_broadcast_bytes)
+        asyncio.run(ws_manager.send_task_screenshot_binary("t1", b"\xff\xd8jpeg", 3))
+
+        (header_length,) = struct.unpack(">I", frames[0][:4])
+        header = json.loads(frames[0][4:4 + header_length])
+        assert header["type"] == "task_screenshot"
+        assert header["task_id"] == "t1"
+        assert header["action_index"] == 3
+        assert header["mime"] == "image/jpeg"
+        assert frames[0][4 + header_length:] == b"\xff\xd8jpeg"
+
+    def test_backlog_coalesced_per_connection(self):
+        import asyncio
+        import json
+        from fastapi.websockets import WebSocketState
+        from api_service.websocket_manager import ConnectionManager, WebSocketMessage, WebSocketMessageType
+
+        class _Socket:
+            def __init__(self):
+                self.application_state = WebSocketState.CONNECTING
+                self.client_state = WebSocketState.CONNECTED
+                self.frames = []
+                self.release = asyncio.Event()
+
+            async def accept(self):
+                self.application_state = WebSocketState.CONNECTED
+
+            async def send_text(self, data):
+                self.frames.append(json.loads(data))
+                await self.release.wait()
+
+            async def send_bytes(self, data):
+                self.frames.append(data)
+
+        def log(task_id, text):
+            return WebSocketMessage(WebSocketMessageType.TASK_LOG, {"message": text}, task_id=task_id)
+
+        async def scenario():
+            manager = ConnectionManager()
+            socket = _Socket()
+            await manager.connect(socket)
+            await manager.connect(socket, "t1")
+
+            # 第一条发送阻塞期间积压的文本消息合并为一个 batch 帧，二进制帧保持顺序单独发送
+            await manager.broadcast(log("t1", "a"), "t1")
+            await asyncio.sleep(0)
+            await manager.broadcast(log("t1", "b"), "t1")
+            await manager.broadcast(log("t2", "c"), "t2")
+            await manager.broadcast_bytes(b"\xff\xd8", "t1")
+            socket.release.set()
+            await asyncio.sleep(0.01)
+
+            assert socket.frames[0]["payload"] == {"message": "a"}
+            batch = socket.frames[1]
+            assert batch["type"] == "batch"
+            assert [(event["task_id"], event["payload"]["message"]) for event in batch["payload"]["events"]] == [
+                ("t1", "b"), ("t2", "c"),
+            ]
+            assert socket.frames[2] == b"\xff\xd8"
+
+            # 连接关闭时移除全部登记并停止写协程
+            manager.disconnect(socket)
+            assert manager._outboxes == {}
+            assert manager.active_connections == {}
+            assert not manager.has_listeners("t1")
+
+        asyncio.run(scenario())
+
+    def test_write_delay_corks_burst_into_one_frame(self):
+        import asyncio
+        import json
+        from fastapi.websockets import WebSocketState
+        from api_service.websocket_manager import ConnectionManager, WebSocketMessage, WebSocketMessageType
+
+        class _Socket:
+            application_state = WebSocketState.CONNECTED
+            client_state = WebSocketState.CONNECTED
+
+            def __init__(self):
+                self.frames = []
+
+            async def send_text(self, data):
+                self.frames.append(json.loads(data))
+
+        async def scenario():
+            manager = ConnectionManager(write_delay=0.02)
+            socket = _Socket()
+            await manager.connect(socket, "t1")
+            await asyncio.sleep(0)
+
+            # 窗口内陆续产生的消息在写协程醒来后一次发出
+            for text in ("a", "b", "c"):
+                await manager.broadcast(WebSocketMessage(WebSocketMessageType.TASK_LOG, {"message": text}, "t1"), "t1")
+                await asyncio.sleep(0.001)
+            await asyncio.sleep(0.05)
+
+            assert len(socket.frames) == 1
+            assert [event["payload"]["message"] for event in socket.frames[0]["payload"]["events"]] == ["a", "b", "c"]
+            manager.disconnect(socket)
+
+        asyncio.run(scenario())
+
+    def test_batch_log_flush_at_batch_size_does_not_deadlock(self):
+        import asyncio
+        from api_service.websocket_manager import BatchLogManager
+
+        async def scenario():
+            manager = BatchLogManager(batch_interval=20, batch_size=3)
+            sent = []
+
+            async def fake_broadcast(message, task_id=None):
+                sent.append(message.payload["batch_count"])
+
+            manager.broadcast = fake_broadcast
+            # 达到批量大小时在锁外立即刷新（此前在持锁时调用 _flush_logs 会永久等待同一把锁）
+            for index in range(7):
+                await asyncio.wait_for(manager.add_log("t1", "info", f"日志 {index}"), 1)
+            await asyncio.sleep(0.1)
+            return sent
+
+        assert asyncio.run(scenario()) == [3, 3, 1]
+
+    def test_task_log_skipped_without_listeners(self, monkeypatch):
+        import asyncio
+        from api_service.websocket_manager import OptimizedConnectionManager, batch_log_manager
+
+        added = []
+
+        async def fake_add_log(**kwargs):
+            added.append(kwargs)
+
+        monkeypatch.setattr(batch_log_manager, "add_log", fake_add_log)
+        # 构造时会把全局 batch_log_manager 的广播指向新实例，测试结束后恢复
+        monkeypatch.setattr(batch_log_manager, "broadcast", batch_log_manager.broadcast)
+        manager = OptimizedConnectionManager()
+        asyncio.run(manager.send_task_log("t1", "info", "无人订阅"))
+        assert added == []
+
+    def test_json_fallback_matches_orjson(self, monkeypatch):
+        import importlib.util
+        import json
+        from datetime import datetime
+        from api_service import websocket_manager
+
+        payload = {"message": "完成", "at": datetime(2024, 1, 1, 12, 0, 0)}
+        encoded = websocket_manager._json_dumps_bytes(payload)
+        assert isinstance(encoded, bytes)
+        assert "完成".encode("utf-8") in encoded
+
+        # 未安装 orjson 时的回退实现同样输出 UTF-8 并把 datetime 编码为 ISO 字符串
+        monkeypatch.setitem(sys.modules, "orjson", None)
+        spec = importlib.util.spec_from_file_location("_ws_fallback", websocket_manager.__file__)
+        fallback = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(fallback)
+        assert json.loads(fallback._json_dumps_bytes(payload)) == json.loads(encoded)
+        assert "完成" in fallback._json_dumps(payload)
+
+    def test_message_json_encoded_once(self):
+        import json
+        from api_service.websocket_manager import WebSocketMessage, WebSocketMessageType
+
+        message = WebSocketMessage(WebSocketMessageType.TASK_LOG, {"message": "完成", 1: "非字符串键"}, task_id="t1")
+        encoded = message.to_json()
+
+        assert message.to_json() is encoded
+        assert json.loads(encoded)["payload"] == {"message": "完成", "1": "非字符串键"}
+
+
+class TestTaskInfo:
+    """执行中任务状态测试"""
+
+    @pytest.mark.skipif(sys.version_info < (3, 10), reason="dataclass slots 需要 Python 3.10")
+    def test_compact_slotted_layout(self):
+        from datetime import datetime
+        from api_service.execution_engine import TaskInfo
+
+        info = TaskInfo("t1", "https://example.com", 1, datetime.now())
+        # 字段存放在固定槽位中，没有逐实例的 __dict__
+        assert not hasattr(info, "__dict__")
+        with pytest.raises(AttributeError):
+            info.unknown_field = 1
+
+    def test_to_dict_omits_unset_fields(self):
+        from datetime import datetime
+        from api_service.execution_engine import TaskInfo
+
+        start = datetime(2024, 1, 1, 12, 0, 0)
+        info = TaskInfo(task_id="t1", url="https://example.com", actions_count=3, start_time=start)
+        assert info.to_dict() == {
+            "task_id": "t1", "url": "https://example.com", "actions_count": 3, "current_action": 0,
+            "status": "pending", "start_time": start, "headless": False,
+        }
+
+        info.status = "failed"
+        info.error = "boom"
+        assert info.to_dict()["error"] == "boom"
+        assert "end_time" not in info.to_dict()
+
+    def test_engine_import_skips_fastapi(self):
+        import subprocess
+
+        # 单独导入执行引擎（如命令行工具）时不加载 fastapi 的完整依赖图
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = "import sys, api_service.execution_engine; print('fastapi' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == "False"
+
+    def test_executing_tasks_exported_as_snapshot(self):
+        from datetime import datetime
+        from api_service.execution_engine import ExecutionEngine, TaskInfo
+
+        engine = ExecutionEngine()
+        engine.executing_tasks["t1"] = TaskInfo("t1", "https://example.com", 1, datetime.now())
+
+        assert engine.get_task_status("t1") is engine.executing_tasks["t1"]
+        assert engine.get_task_status("missing") is None
+        assert engine.get_all_executing_tasks() == [("t1", "pending", 0)]
+
+    def test_result_duration_from_monotonic_clock(self, monkeypatch):
+        import asyncio
+        from api_service import execution_engine as engine_module
+
+        results = []
+
+        async def noop(*args, **kwargs):
+            pass
+
+        async def capture_result(task_id, result):
+            results.append(result)
+
+        monkeypatch.setattr(engine_module.ws_manager, "send_task_status", noop)
+        monkeypatch.setattr(engine_module.ws_manager, "send_task_result", capture_result)
+
+        async def scenario():
+            engine = engine_module.ExecutionEngine()
+
+            async def fake_run_actions(task_id, *args, **kwargs):
+                # 耗时按单调时钟计算，系统时间回拨不会得到负值
+                info = engine.get_task_status(task_id)
+                info.started_monotonic -= 1.5
+                info.start_time = info.start_time.replace(year=info.start_time.year + 1)
+
+            engine._run_actions = fake_run_actions
+            await engine.execute_task("t1", "https://example.com", [])
+
+        asyncio.run(scenario())
+        assert 1.5 <= results[0]["duration_seconds"] < 2.5
+        assert results[0]["start_time"] > results[0]["end_time"]
+
+    def test_task_record_released_when_execute_task_returns(self, monkeypatch):
+        import asyncio
+        import gc
+        from api_service import execution_engine as engine_module
+
+        async def noop(*args, **kwargs):
+            pass
+
+        for name in ("send_task_status", "send_task_result", "send_task_error"):
+            monkeypatch.setattr(engine_module.ws_manager, name, noop)
+
+        async def scenario():
+            engine = engine_module.ExecutionEngine()
+            seen = []
+
+            async def fake_run_actions(task_id, *args, **kwargs):
+                seen.append(engine.get_task_status(task_id).status)
+
+            engine._run_actions = fake_run_actions
+            await engine.execute_task("t1", "https://example.com", [])
+            assert seen == ["pending"]
+            assert "t1" not in engine.executing_tasks
+
+            async def failing_run_actions(task_id, *args, **kwargs):
+                raise RuntimeError("boom")
+
+            # 失败任务的异常与执行帧形成引用环，记录也要在返回时立即移除，而不是等 gc
+            engine._run_actions = failing_run_actions
+            gc.disable()
+            try:
+                await engine.execute_task("t2", "https://example.com", [])
+                assert engine.get_all_executing_tasks() == []
+            finally:
+                gc.enable()
+
+        asyncio.run(scenario())
+
+
+    def test_tasks_queue_beyond_concurrency_limit(self, monkeypatch):
+        import asyncio
+        from api_service import execution_engine as engine_module
+
+        statuses = []
+
+        async def record_status(task_id, status, *args, **kwargs):
+            statuses.append((task_id, status))
+
+        async def noop(*args, **kwargs):
+            pass
+
+        monkeypatch.setattr(engine_module.ws_manager, "send_task_status", record_status)
+        monkeypatch.setattr(engine_module.ws_manager, "send_task_result", noop)
+
+        async def scenario():
+            engine = engine_module.ExecutionEngine()
+            engine._task_slots = asyncio.Semaphore(1)
+            engine._task_slots_created = True
+            running = []
+            gate = asyncio.Event()
+
+            async def fake_run_actions(task_id, *args, **kwargs):
+                running.append(task_id)
+                await gate.wait()
+
+            engine._run_actions = fake_run_actions
+            first = asyncio.create_task(engine.execute_task("t1", "https://example.com", []))
+            second = asyncio.create_task(engine.execute_task("t2", "https://example.com", []))
+            await asyncio.sleep(0.01)
+
+            # 第二个任务在第一个完成前只发送排队状态，不会开始执行
+            assert running == ["t1"]
+            assert ("t2", "queued") in statuses
+            assert engine.get_task_status("t2").status == "queued"
+
+            gate.set()
+            await asyncio.gather(first, second)
+            assert running == ["t1", "t2"]
+            assert not engine.task_slots.locked()
+
+        asyncio.run(scenario())
+
+
+class TestBrowserTeardown:
+    """浏览器关闭幂等性测试"""
+
+    def test_cancel_task_pops_records(self):
+        import asyncio
+        from datetime import datetime
+        from api_service.execution_engine import ExecutionEngine, TaskInfo
+
+        class _Browser:
+            closes = 0
+            pooled = False
+
+            async def close(self):
+                self.closes += 1
+
+        engine = ExecutionEngine()
+        info = engine.executing_tasks["t-cancel"] = TaskInfo("t-cancel", "https://example.com", 1, datetime.now())
+        browser = engine.browser_contexts["t-cancel"] = _Browser()
+
+        assert asyncio.run(engine.cancel_task("t-cancel")) is True
+        assert asyncio.run(engine.cancel_task("t-cancel")) is False
+
+        # 引擎持有的引用看到取消状态，记录各只移除、关闭一次
+        assert info.status == "cancelled"
+        assert "t-cancel" not in engine.executing_tasks
+        assert "t-cancel" not in engine.browser_contexts
+        assert browser.closes == 1
+
+    def test_cancel_wakes_task_waiting_for_pooled_browser(self):
+        import asyncio
+        from api_service.execution_engine import ExecutionEngine
+
+        async def scenario():
+            engine = ExecutionEngine()
+            pool = engine._browser_pool = TestBrowserPool()._pool(size=1, limit=1)
+            browser = await pool.acquire()
+            browser.pooled = True
+            engine.browser_contexts["t-running"] = browser
+
+            # 池已满，第二个任务阻塞在 acquire
+            waiter = asyncio.create_task(pool.acquire())
+            await asyncio.sleep(0)
+            assert pool.stats()["waiting"] == 1
+
+            # 取消占用实例的任务：实例被关闭，池补充新实例并交给等待的任务
+            assert await engine.cancel_task("t-running") is True
+            assert browser.closed
+            assert await asyncio.wait_for(waiter, timeout=1) is pool.spawned[1]
+
+        asyncio.run(scenario())
+
+    def test_cancel_interrupts_running_action(self, monkeypatch):
+        import asyncio
+        from api_service import execution_engine as engine_module
+
+        statuses = []
+
+        async def record_status(task_id, status, *args, **kwargs):
+            statuses.append(status)
+
+        async def noop(*args, **kwargs):
+            pass
+
+        for name in ("send_task_result", "send_task_error", "send_task_log", "send_task_event_batch"):
+            monkeypatch.setattr(engine_module.ws_manager, name, noop)
+        monkeypatch.setattr(engine_module.ws_manager, "send_task_status", record_status)
+
+        class _Browser:
+            pooled = False
+
+            def __init__(self):
+                self.closed = asyncio.Event()
+
+            async def reset(self, *args, **kwargs):
+                return True
+
+            async def start(self, *args, **kwargs):
+                return True
+
+            async def execute_action(self, action):
+                # 关闭浏览器时进行中的请求失败
+                await self.closed.wait()
+                raise Exception("子进程已关闭")
+
+            async def close(self):
+                self.closed.set()
+
+        async def scenario():
+            engine = engine_module.ExecutionEngine()
+            engine._browser_pool = engine_module.BrowserPool(0, 1)
+            browser = _Browser()
+            monkeypatch.setattr(engine_module, "SubprocessBrowser", lambda: browser)
+
+            task = asyncio.create_task(engine.execute_task("t1", "https://example.com", [{"type": "wait"}]))
+            await asyncio.sleep(0.01)
+            info = engine.get_task_status("t1")
+            assert await engine.cancel_task("t1")
+            await task
+            return info
+
+        info = asyncio.run(scenario())
+        # 取消后的任务既不算失败也不报告完成
+        assert info.status == "cancelled"
+        assert "failed" not in statuses
+        assert "completed" not in statuses
+
+    @pytest.mark.parametrize("start_raises", [False, True])
+    def test_cancel_during_browser_start(self, monkeypatch, start_raises):
+        import asyncio
+        from api_service import execution_engine as engine_module
+
+        statuses = []
+        error_logs = []
+
+        async def record_status(task_id, status, *args, **kwargs):
+            statuses.append(status)
+
+        async def record_log(task_id, level, message, *args, **kwargs):
+            if level == "error":
+                error_logs.append(message)
+
+        async def noop(*args, **kwargs):
+            pass
+
+        for name in ("send_task_result", "send_task_error", "send_task_event_batch"):
+            monkeypatch.setattr(engine_module.ws_manager, name, noop)
+        monkeypatch.setattr(engine_module.ws_manager, "send_task_status", record_status)
+        monkeypatch.setattr(engine_module.ws_manager, "send_task_log", record_log)
+
+        class _Browser:
+            pooled = False
+
+            def __init__(self):
+                self.closed = asyncio.Event()
+                self.actions = []
+
+            async def start(self, *args, **kwargs):
+                # 启动期间被取消：浏览器被关闭后启动请求失败或恰好完成
+                await self.closed.wait()
+                if start_raises:
+                    raise Exception("子进程已关闭")
+                return True
+
+            async def execute_action(self, action):
+                self.actions.append(action)
+                return True, {}
+
+            async def close(self):
+                self.closed.set()
+
+        async def scenario():
+            engine = engine_module.ExecutionEngine()
+            engine._browser_pool = engine_module.BrowserPool(0, 1)
+            browser = _Browser()
+            monkeypatch.setattr(engine_module, "SubprocessBrowser", lambda: browser)
+            simulated = []
+
+            async def simulate(*args):
+                simulated.append(args)
+
+            engine._simulate_browser_start = simulate
+
+            task = asyncio.create_task(engine.execute_task("t1", "https://example.com", [{"type": "wait"}]))
+            await asyncio.sleep(0.01)
+            assert await engine.cancel_task("t1")
+            await task
+            return browser, simulated
+
+        browser, simulated = asyncio.run(scenario())
+        # 取消的任务不再执行操作，也不作为启动失败上报或回退到模拟模式
+        assert browser.actions == []
+        assert simulated == []
+        assert error_logs == []
+        assert "failed" not in statuses and "completed" not in statuses
+
+    def test_close_browser_runs_once(self, monkeypatch):
+        import asyncio
+        from api_service import execution_engine as engine_module
+
+        async def noop(*args, **kwargs):
+            pass
+
+        monkeypatch.setattr(engine_module.ws_manager, "send_task_log", noop)
+
+        async def scenario():
+            engine = engine_module.ExecutionEngine()
+            browser = _PooledBrowser()
+            browser.pooled = False
+            closes = []
+
+            async def close():
+                closes.append(True)
+
+            browser.close = close
+            engine.browser_contexts["t1"] = browser
+
+            await engine._close_browser("t1")
+            await engine._close_browser("t1")
+            assert closes == [True]
+            assert "t1" not in engine.browser_contexts
+
+        asyncio.run(scenario())
+
+    def test_subprocess_browser_close_idempotent(self):
+        import asyncio
+        from api_service.execution_engine import SubprocessBrowser
+
+        class _Process:
+            terminated = 0
+            returncode = None
+
+            def terminate(self):
+                self.terminated += 1
+                self.returncode = 0
+
+            async def wait(self):
+                return self.returncode
+
+        async def scenario():
+            browser = SubprocessBrowser()
+            process = browser.process = _Process()
+            await browser.close()
+            await browser.close()
+            assert process.terminated == 1
+
+        asyncio.run(scenario())